@@ -1,39 +1,142 @@
+import fcntl
+import json
+import os
+import shlex
+import time
+import logging
+import threading
+
+from app import ssh_pool
+from app.installer import run_ssh_command, run_ssh_command_streaming
+
+logger = logging.getLogger(__name__)
+
+# Cache persistente do estado de instalação do Ctop por (host, username).
+# Só cacheamos resultado positivo: um "não instalado" pode mudar depois
+# de um install_ctop, mas um "instalado" vale por 24h sem re-verificar.
+_CACHE_PATH = os.path.expanduser("~/.cache/cria/ctop_installed.json")
+_CACHE_TTL = 24 * 3600
+_cache_lock = threading.Lock()
+
+
+def _cache_key(host, username):
+    return f"{username}@{host}"
+
+
+def _read_install_cache():
+    try:
+        with open(_CACHE_PATH, "r", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                return json.load(f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_cached_installed(host, username):
+    entry = _read_install_cache().get(_cache_key(host, username))
+    return bool(entry) and (time.time() - entry) < _CACHE_TTL
+
+
+def _mark_installed(host, username):
+    with _cache_lock:
+        os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+        try:
+            with open(_CACHE_PATH, "a+", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read()
+                    cache = json.loads(content) if content.strip() else {}
+                    cache[_cache_key(host, username)] = time.time()
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(cache, f)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        except OSError as e:
+            logger.warning("Não foi possível gravar o cache do Ctop: %s", e)
 
 
 def check_ctop_installed(host, username, password):
     """
     Verifica se o Ctop está instalado no servidor remoto.
+    Usa um cache local (24h) para evitar a conexão SSH quando já sabemos
+    que o host tem o Ctop; só o resultado positivo é cacheado.
     Retorna True se instalado, False caso contrário.
     """
-    client = get_ssh_client(host, username, password)
-    try:
-        try:
-            run_ssh_command(client, "which ctop")
-            return True
-        except Exception:
-            return False
-    finally:
-        client.close()
+    if _is_cached_installed(host, username):
+        return True
+
+    # 'command -v' é builtin POSIX (sem fork de processo externo, ao contrário
+    # do 'which') e o echo evita usar exceção como fluxo de controle.
+    with ssh_pool.acquire(host, username, password) as client:
+        output = run_ssh_command(client, "command -v ctop >/dev/null 2>&1 && echo OK || echo NO")
+
+    if output.strip() != "OK":
+        return False
+
+    _mark_installed(host, username)
+    return True
+
+
+# Uma única transação apt não-interativa no final: menos locks do dpkg e
+# menos commits de transação do que dois 'apt-get install' separados.
+# O codename vem de /etc/os-release (mesmo padrão do install_docker),
+# dispensando o lsb_release antes dele estar instalado.
+_INSTALL_COMMANDS = [
+    "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -o Dpkg::Use-Pty=0 ca-certificates curl gnupg",
+    "curl -fsSL https://azlux.fr/repo.gpg.key | sudo gpg --dearmor -o /usr/share/keyrings/azlux-archive-keyring.gpg",
+    'echo "deb [arch=$(dpkg --print-architecture) signed-by=/usr/share/keyrings/azlux-archive-keyring.gpg] http://packages.azlux.fr/debian $(. /etc/os-release && echo "$VERSION_CODENAME") main" | sudo tee /etc/apt/sources.list.d/azlux.list >/dev/null',
+    "sudo apt-get update",
+    "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -o Dpkg::Use-Pty=0 -o Acquire::Retries=3 ca-certificates curl gnupg lsb-release docker-ctop"
+]
 
 
 def install_ctop(host, username, password):
     """
     Instala o Ctop (container monitoring tool) no servidor remoto via SSH.
+    Executa todos os comandos em uma única sessão SSH (um único exec_command)
+    para evitar o custo de abrir um canal novo por comando.
     """
-    commands = [
-        "sudo apt-get install -y ca-certificates curl gnupg lsb-release",
-        "curl -fsSL https://azlux.fr/repo.gpg.key | sudo gpg --dearmor -o /usr/share/keyrings/azlux-archive-keyring.gpg",
-        'echo "deb [arch=$(dpkg --print-architecture) signed-by=/usr/share/keyrings/azlux-archive-keyring.gpg] http://packages.azlux.fr/debian $(lsb_release -cs) main" | sudo tee /etc/apt/sources.list.d/azlux.list >/dev/null',
-        "sudo apt-get update",
-        "sudo apt-get install -y docker-ctop"
-    ]
-
-    client = get_ssh_client(host, username, password)
-    try:
-        logger.info(f"Iniciando instalação do Ctop em {host}...")
-        for cmd in commands:
-            run_ssh_command(client, cmd, timeout=60)
+    commands = _INSTALL_COMMANDS
+
+    # Junta tudo em um único script com 'set -e' para abortar no primeiro erro
+    script = "set -euo pipefail\n" + "\n".join(commands)
+
+    with ssh_pool.acquire(host, username, password) as client:
+        logger.info("Iniciando instalação do Ctop em %s...", host)
+        run_ssh_command_streaming(client, f"bash -lc {shlex.quote(script)}", timeout=300)
         logger.info("Instalação do Ctop concluída com sucesso.")
-        return {"status": "success", "message": "Ctop instalado com sucesso"}
-    finally:
-        client.close()
+
+    _mark_installed(host, username)
+    return {"status": "success", "message": "Ctop instalado com sucesso"}
+
+
+def ensure_ctop(host, username, password):
+    """
+    Garante o Ctop instalado em UM único round-trip SSH: o próprio script
+    remoto checa 'command -v ctop' e só roda a instalação se faltar.
+    Substitui o padrão 'if not check_ctop_installed(...): install_ctop(...)',
+    que pagava duas conexões/handshakes no caso de miss.
+    """
+    if _is_cached_installed(host, username):
+        return {"status": "already_present", "message": "Ctop já estava instalado"}
+
+    script = (
+        "set -euo pipefail\n"
+        "if ! command -v ctop >/dev/null 2>&1; then\n"
+        + "\n".join(_INSTALL_COMMANDS)
+        + "\necho __CTOP_INSTALLED__\nfi"
+    )
+
+    with ssh_pool.acquire(host, username, password) as client:
+        logger.info("Garantindo instalação do Ctop em %s...", host)
+        output = run_ssh_command_streaming(client, f"bash -lc {shlex.quote(script)}", timeout=300)
+
+    _mark_installed(host, username)
+    if "__CTOP_INSTALLED__" in output:
+        return {"status": "installed", "message": "Ctop instalado com sucesso"}
+    return {"status": "already_present", "message": "Ctop já estava instalado"}
@@ -1,32 +1,230 @@
+import asyncio
+import hashlib
 import requests
 import logging
+import threading
+import time
+
+import httpx
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson é ~3-5x mais rápido que o json da stdlib para as listagens grandes
+# de registros DNS; se não estiver instalado, caímos no parser padrão.
+try:
+    import orjson
+
+    def _json(response):
+        return orjson.loads(response.content)
+except ImportError:
+    def _json(response):
+        return response.json()
+
+# Sessão compartilhada: reaproveita a conexão TCP+TLS com a Cloudflare
+# (keep-alive) em vez de refazer o handshake a cada chamada.
+# O Retry cobre o rate limit da Cloudflare (429, respeitando Retry-After)
+# e erros transitórios 5xx com backoff exponencial.
+_retry = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+    respect_retry_after_header=True
+)
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=_retry))
+
+
+# Memoizado por token: evita recriar as mesmas strings/dict a cada chamada.
+# Seguro porque requests/httpx copiam os headers internamente ao enviar.
+@lru_cache(maxsize=64)
+def _headers(api_token):
+    return {
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json"
+    }
+
+
+# Códigos estáveis da Cloudflare para "registro já existe" (81057/81058):
+# comparar o código numérico é O(1) e independe do texto da mensagem.
+_KNOWN_CONFLICT_CODES = frozenset({81057, 81058})
+
+
+# Cache de zone_id por domínio: evita um list_zones (HTTP completo) a cada
+# create/delete de registro. A chave usa um hash do token (não o token em si).
+_ZONE_CACHE_TTL = 3600
+_zone_cache = {}  # (token_hash, dominio) -> (zone_id, expira_em)
+_zone_cache_lock = threading.RLock()
+
+
+def _token_key(api_token):
+    return hashlib.sha256(api_token.encode("utf-8")).hexdigest()[:16]
+
+
+def get_zone_id(api_token, domain_name):
+    """
+    Retorna o zone_id do domínio, usando cache em memória com TTL de 1 hora.
+    No cache miss, faz um list_zones e popula todas as zonas retornadas de uma vez.
+    """
+    token_hash = _token_key(api_token)
+    domain = domain_name.lower()
+    now = time.time()
+
+    with _zone_cache_lock:
+        cached = _zone_cache.get((token_hash, domain))
+        if cached and cached[1] > now:
+            return cached[0]
+
+    zones = list_zones(api_token)
+
+    with _zone_cache_lock:
+        expires_at = now + _ZONE_CACHE_TTL
+        for zone in zones:
+            _zone_cache[(token_hash, zone["name"].lower())] = (zone["id"], expires_at)
+        cached = _zone_cache.get((token_hash, domain))
+
+    if not cached:
+        raise Exception(f"Zona não encontrada na Cloudflare: {domain_name}")
+    return cached[0]
+
+
+def invalidate_zone(domain_name):
+    """
+    Remove um domínio do cache de zone_id (ex.: após deletar a zona na Cloudflare).
+    """
+    domain = domain_name.lower()
+    with _zone_cache_lock:
+        for key in [k for k in _zone_cache if k[1] == domain]:
+            del _zone_cache[key]
+
+
+# Cache do conjunto completo de registros 'A' por zona: consultas repetidas
+# com ip_filter diferente são respondidas localmente, sem novo round-trip.
+# Qualquer mutação (create/update/delete) na zona invalida a entrada.
+_ZONE_RECORDS_TTL = 300
+_zone_records_cache = {}  # (token_hash, zone_id) -> (registros, expira_em)
+_zone_records_lock = threading.RLock()
+
+
+def _get_zone_records(api_token, zone_id):
+    """
+    Retorna todos os registros 'A' da zona, usando cache com TTL de 5 minutos.
+    """
+    key = (_token_key(api_token), zone_id)
+    now = time.time()
+
+    with _zone_records_lock:
+        cached = _zone_records_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
+    records = _paged_get(url, _headers(api_token), {"type": "A"})
+
+    with _zone_records_lock:
+        _zone_records_cache[key] = (records, now + _ZONE_RECORDS_TTL)
+
+    return records
+
+
+def _invalidate_zone_records(zone_id):
+    with _zone_records_lock:
+        for key in [k for k in _zone_records_cache if k[1] == zone_id]:
+            del _zone_records_cache[key]
+
+
+def _paged_get(url, headers, params=None):
+    """
+    Faz um GET paginado na Cloudflare e retorna todos os 'result' concatenados.
+    A página 1 é buscada primeiro; as demais são buscadas em paralelo.
+    """
+    params = dict(params or {})
+    params.setdefault("per_page", 100)
+    params["page"] = 1
+
+    response = _session.get(url, headers=headers, params=params)
+    response.raise_for_status()
+    data = _json(response)
+
+    if not data.get("success"):
+        error_msg = data.get("errors", [{"message": "Unknown error"}])[0]["message"]
+        raise Exception(f"Cloudflare Error: {error_msg}")
+
+    results = list(data.get("result", []))
+    total_pages = data.get("result_info", {}).get("total_pages", 1)
+
+    if total_pages > 1:
+        def fetch_page(page):
+            page_response = _session.get(url, headers=headers, params={**params, "page": page})
+            page_response.raise_for_status()
+            page_data = _json(page_response)
+            if not page_data.get("success"):
+                error_msg = page_data.get("errors", [{"message": "Unknown error"}])[0]["message"]
+                raise Exception(f"Cloudflare Error: {error_msg}")
+            return page_data.get("result", [])
+
+        with ThreadPoolExecutor(max_workers=min(8, total_pages - 1)) as executor:
+            for page_results in executor.map(fetch_page, range(2, total_pages + 1)):
+                results.extend(page_results)
+
+    return results
+
+
+# O conjunto de zonas de um token muda raramente, mas é rebuscado a cada
+# abertura da UI; 5 minutos de cache respondem os repeats com um lookup de
+# dict em vez de um round-trip HTTPS (e poupam o rate limit da Cloudflare).
+_ZONES_LIST_TTL = 300
+_zones_list_cache = {}  # token_hash -> (zonas, expira_em)
+
+
+def invalidate_zones_cache(api_token=None):
+    """
+    Limpa o cache de listagem de zonas (de um token, ou todo).
+    """
+    with _zone_cache_lock:
+        if api_token is None:
+            _zones_list_cache.clear()
+        else:
+            _zones_list_cache.pop(_token_key(api_token), None)
+
+
+def _cached_zones_get(api_token):
+    with _zone_cache_lock:
+        cached = _zones_list_cache.get(_token_key(api_token))
+        if cached and cached[1] > time.time():
+            return cached[0]
+    return None
+
+
+def _cached_zones_put(api_token, zones):
+    with _zone_cache_lock:
+        _zones_list_cache[_token_key(api_token)] = (zones, time.time() + _ZONES_LIST_TTL)
+
 
 def list_zones(api_token):
     """
     Lists available zones (domains) for the given Cloudflare API Token.
+    Results are cached for 5 minutes per token.
     """
+    cached = _cached_zones_get(api_token)
+    if cached is not None:
+        return cached
+
     url = "https://api.cloudflare.com/client/v4/zones"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
-    
+    headers = _headers(api_token)
+
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        if not data.get("success"):
-            error_msg = data.get("errors", [{"message": "Unknown error"}])[0]["message"]
-            raise Exception(f"Cloudflare API Error: {error_msg}")
-            
         zones = []
-        for zone in data.get("result", []):
+        for zone in _paged_get(url, headers):
             zones.append({
                 "id": zone["id"],
                 "name": zone["name"]
             })
-            
+
+        _cached_zones_put(api_token, zones)
         return zones
 
     except requests.exceptions.RequestException as e:
@@ -39,10 +237,7 @@ def create_dns_record(api_token, zone_id, name, content, proxied=True):
     Creates an 'A' record in Cloudflare.
     """
     url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
+    headers = _headers(api_token)
     
     # If name is 'app' and zone is 'example.com', final is 'app.example.com'
     # Cloudflare API accepts the full name or subdomain. 
@@ -58,19 +253,19 @@ def create_dns_record(api_token, zone_id, name, content, proxied=True):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        data = response.json()
+        response = _session.post(url, headers=headers, json=payload)
+        data = _json(response)
         
         if not data.get("success"):
              # Check if error is "Record already exists"
             errors = data.get("errors", [])
-            for err in errors:
-                if "record already exists" in err.get("message", "").lower():
-                    raise Exception("Este registro DNS já existe.")
-            
+            if any(err.get("code") in _KNOWN_CONFLICT_CODES for err in errors):
+                raise Exception("Este registro DNS já existe.")
+
             error_msg = errors[0]["message"] if errors else "Unknown error"
             raise Exception(f"Cloudflare Error: {error_msg}")
             
+        _invalidate_zone_records(zone_id)
         return {
             "success": True,
             "record": data["result"]
@@ -83,28 +278,11 @@ def list_dns_records(api_token, zone_id, ip_filter=None):
     """
     Lists 'A' records in a specific zone, optionally filtered by IP content.
     """
-    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
-    
-    params = {
-        "type": "A",
-        "per_page": 100
-    }
-    if ip_filter:
-        params["content"] = ip_filter
-
     try:
-        response = requests.get(url, headers=headers, params=params)
-        data = response.json()
-        
-        if not data.get("success"):
-            error_msg = data.get("errors", [{"message": "Unknown error"}])[0]["message"]
-            raise Exception(f"Cloudflare Error: {error_msg}")
-            
-        return data.get("result", [])
+        records = _get_zone_records(api_token, zone_id)
+        if ip_filter:
+            return [r for r in records if r.get("content") == ip_filter]
+        return records
 
     except requests.exceptions.RequestException as e:
         raise Exception(f"Falha na conexão com a Cloudflare: {str(e)}")
@@ -117,35 +295,35 @@ def delete_dns_record(api_token, zone_id, record_id):
     logger = logging.getLogger(__name__)
     
     url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records/{record_id}"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
+    headers = _headers(api_token)
     
-    logger.info(f"[DELETE DNS] Deletando registro")
-    logger.info(f"[DELETE DNS] Zone ID: {zone_id}")
-    logger.info(f"[DELETE DNS] Record ID: {record_id}")
-    logger.info(f"[DELETE DNS] URL: {url}")
+    logger.info("[DELETE DNS] Deletando registro")
+    logger.info("[DELETE DNS] Zone ID: %s", zone_id)
+    logger.info("[DELETE DNS] Record ID: %s", record_id)
+    logger.info("[DELETE DNS] URL: %s", url)
 
     try:
-        response = requests.delete(url, headers=headers)
-        data = response.json()
+        response = _session.delete(url, headers=headers)
+        data = _json(response)
         
-        logger.info(f"[DELETE DNS] Status HTTP: {response.status_code}")
-        logger.info(f"[DELETE DNS] Resposta Cloudflare: {data}")
+        logger.info("[DELETE DNS] Status HTTP: %s", response.status_code)
+        # O corpo pode ser um dict grande; só paga o repr se DEBUG estiver ligado
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[DELETE DNS] Resposta Cloudflare: %s", data)
         
         if not data.get("success"):
             errors = data.get("errors", [{"message": "Unknown error"}])
             error_msg = errors[0].get("message", "Unknown error")
-            logger.error(f"[DELETE DNS] Erro na API: {error_msg}")
-            logger.error(f"[DELETE DNS] Erros completos: {errors}")
+            logger.error("[DELETE DNS] Erro na API: %s", error_msg)
+            logger.error("[DELETE DNS] Erros completos: %s", errors)
             raise Exception(f"Cloudflare Error: {error_msg}")
             
-        logger.info(f"[DELETE DNS] Registro deletado com sucesso!")
+        logger.info("[DELETE DNS] Registro deletado com sucesso!")
+        _invalidate_zone_records(zone_id)
         return data.get("result")
         
     except requests.exceptions.RequestException as e:
-        logger.error(f"[DELETE DNS] Falha na requisição: {str(e)}")
+        logger.error("[DELETE DNS] Falha na requisição: %s", e)
         raise Exception(f"Falha na conexão com a Cloudflare: {str(e)}")
 
 def update_dns_record(api_token, zone_id, record_id, name, content, proxied=True):
@@ -153,10 +331,7 @@ def update_dns_record(api_token, zone_id, record_id, name, content, proxied=True
     Updates an existing 'A' DNS record.
     """
     url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records/{record_id}"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
+    headers = _headers(api_token)
     
     payload = {
         "type": "A",
@@ -167,14 +342,183 @@ def update_dns_record(api_token, zone_id, record_id, name, content, proxied=True
     }
 
     try:
-        response = requests.put(url, headers=headers, json=payload)
-        data = response.json()
+        response = _session.put(url, headers=headers, json=payload)
+        data = _json(response)
         
         if not data.get("success"):
             error_msg = data.get("errors", [{"message": "Unknown error"}])[0]["message"]
             raise Exception(f"Cloudflare Error: {error_msg}")
             
+        _invalidate_zone_records(zone_id)
         return data.get("result")
 
     except requests.exceptions.RequestException as e:
         raise Exception(f"Falha na conexão com a Cloudflare: {str(e)}")
+
+
+# --- Variantes assíncronas (para operações DNS em lote) ---
+
+# Cliente httpx compartilhado: as operações em lote reutilizam as mesmas
+# conexões em vez de pagar um handshake TLS por registro. Com HTTP/2 as
+# requisições concorrentes são multiplexadas em uma única conexão TCP
+# (sem head-of-line blocking e com um handshake só por host).
+_async_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    timeout=30
+)
+
+
+def _check_cf_response(data):
+    """
+    Valida o envelope de resposta da Cloudflare e retorna o 'result'.
+    """
+    if not data.get("success"):
+        error_msg = data.get("errors", [{"message": "Unknown error"}])[0]["message"]
+        raise Exception(f"Cloudflare Error: {error_msg}")
+    return data.get("result")
+
+
+async def _apaged_get(url, api_token, params=None):
+    """
+    Versão assíncrona do _paged_get: página 1 primeiro, demais páginas em
+    paralelo via asyncio.gather.
+    """
+    params = dict(params or {})
+    params.setdefault("per_page", 100)
+    params["page"] = 1
+
+    response = await _async_client.get(url, headers=_headers(api_token), params=params)
+    data = _json(response)
+    results = list(_check_cf_response(data) or [])
+    total_pages = data.get("result_info", {}).get("total_pages", 1)
+
+    if total_pages > 1:
+        async def fetch_page(page):
+            page_response = await _async_client.get(
+                url, headers=_headers(api_token), params={**params, "page": page}
+            )
+            return _check_cf_response(_json(page_response)) or []
+
+        pages = await asyncio.gather(*(fetch_page(p) for p in range(2, total_pages + 1)))
+        for page_results in pages:
+            results.extend(page_results)
+
+    return results
+
+
+async def alist_zones(api_token):
+    """
+    Versão assíncrona de list_zones (compartilha o mesmo cache de 5 min).
+    """
+    cached = _cached_zones_get(api_token)
+    if cached is not None:
+        return cached
+
+    url = "https://api.cloudflare.com/client/v4/zones"
+    zones = [{"id": zone["id"], "name": zone["name"]} for zone in await _apaged_get(url, api_token)]
+    _cached_zones_put(api_token, zones)
+    return zones
+
+
+async def acreate_dns_record(api_token, zone_id, name, content, proxied=True):
+    """
+    Versão assíncrona de create_dns_record.
+    """
+    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
+    payload = {
+        "type": "A",
+        "name": name,
+        "content": content,
+        "ttl": 1,
+        "proxied": proxied
+    }
+    response = await _async_client.post(url, headers=_headers(api_token), json=payload)
+    result = _check_cf_response(_json(response))
+    _invalidate_zone_records(zone_id)
+    return result
+
+
+async def _aget_zone_records(api_token, zone_id):
+    """
+    Versão assíncrona de _get_zone_records: paginada e compartilhando o
+    mesmo cache de 5 minutos por zona do caminho síncrono.
+    """
+    key = (_token_key(api_token), zone_id)
+    now = time.time()
+
+    with _zone_records_lock:
+        cached = _zone_records_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
+    records = await _apaged_get(url, api_token, {"type": "A"})
+
+    with _zone_records_lock:
+        _zone_records_cache[key] = (records, now + _ZONE_RECORDS_TTL)
+
+    return records
+
+
+async def alist_dns_records(api_token, zone_id, ip_filter=None):
+    """
+    Versão assíncrona de list_dns_records: busca todas as páginas (zonas
+    com >100 registros não são truncadas) e aplica o ip_filter localmente
+    sobre o conjunto cacheado, como no caminho síncrono.
+    """
+    records = await _aget_zone_records(api_token, zone_id)
+    if ip_filter:
+        return [record for record in records if record.get("content") == ip_filter]
+    return records
+
+
+async def adelete_dns_record(api_token, zone_id, record_id):
+    """
+    Versão assíncrona de delete_dns_record.
+    """
+    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records/{record_id}"
+    response = await _async_client.delete(url, headers=_headers(api_token))
+    result = _check_cf_response(_json(response))
+    _invalidate_zone_records(zone_id)
+    return result
+
+
+async def aupdate_dns_record(api_token, zone_id, record_id, name, content, proxied=True):
+    """
+    Versão assíncrona de update_dns_record.
+    """
+    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records/{record_id}"
+    payload = {
+        "type": "A",
+        "name": name,
+        "content": content,
+        "proxied": proxied,
+        "ttl": 1
+    }
+    response = await _async_client.put(url, headers=_headers(api_token), json=payload)
+    result = _check_cf_response(_json(response))
+    _invalidate_zone_records(zone_id)
+    return result
+
+
+async def bulk_create_records(api_token, zone_id, records, concurrency=20):
+    """
+    Cria vários registros 'A' em paralelo (limitado por 'concurrency').
+    'records' é uma lista de dicts {'name': ..., 'content': ..., 'proxied': ...}.
+    Retorna uma lista na mesma ordem; erros individuais viram a própria Exception
+    na posição correspondente, sem derrubar o lote inteiro.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create_one(record):
+        async with semaphore:
+            return await acreate_dns_record(
+                api_token,
+                zone_id,
+                record["name"],
+                record["content"],
+                record.get("proxied", True)
+            )
+
+    return await asyncio.gather(*(create_one(r) for r in records), return_exceptions=True)
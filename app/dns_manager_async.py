@@ -0,0 +1,46 @@
+"""
+Espelho assíncrono da API pública do dns_manager.
+
+Endpoints de alto fan-out (ex.: provisionar N subdomínios de uma vez) devem
+importar daqui: uma única thread de event-loop atende todas as chamadas à
+Cloudflare em voo, em vez de bloquear uma worker thread por N x RTT.
+"""
+import asyncio
+
+from app.dns_manager import (
+    acreate_dns_record as create_dns_record,
+    alist_dns_records as list_dns_records,
+    adelete_dns_record as delete_dns_record,
+    aupdate_dns_record as update_dns_record,
+    bulk_create_records,
+)
+
+__all__ = [
+    "create_dns_record",
+    "list_dns_records",
+    "delete_dns_record",
+    "update_dns_record",
+    "bulk_create_records",
+    "bounded",
+    "gather_bounded",
+]
+
+
+async def bounded(semaphore, coro):
+    """
+    Executa a corrotina limitada pelo semáforo (para capear chamadas em voo).
+    """
+    async with semaphore:
+        return await coro
+
+
+async def gather_bounded(coros, concurrency=20):
+    """
+    asyncio.gather com limite de concorrência; erros individuais são
+    retornados na posição correspondente sem derrubar o lote.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(
+        *(bounded(semaphore, coro) for coro in coros),
+        return_exceptions=True
+    )
@@ -1,8 +1,16 @@
+import hashlib
+import http.client
+import json
 import paramiko
 import logging
 import os
-import tempfile
+import re
+import shlex
+import threading
 import requests
+from functools import lru_cache
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from typing import Optional
 
 # Configura o logging
@@ -18,21 +26,33 @@ def get_ssh_client(host, username, password, timeout=30):
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     
     try:
-        logger.info(f"[SSH] Iniciando conexão SSH com {host}")
-        logger.info(f"[SSH] Parâmetros: User={username}, Timeout={timeout}s")
-        logger.info(f"[SSH] look_for_keys=False, allow_agent=False")
+        logger.info("[SSH] Conectando a %s (User=%s, Timeout=%ss, look_for_keys=False, allow_agent=False)",
+                    host, username, timeout)
         
         start = time.time()
         client.connect(
-            hostname=host, 
-            username=username, 
-            password=password, 
+            hostname=host,
+            username=username,
+            password=password,
             timeout=timeout,
+            # Falha rápido em vez de esperar os 15s/30s padrão em banner/auth
+            banner_timeout=10,
+            auth_timeout=10,
+            # zlib@openssh.com: menos bytes na fiação para os YAMLs/saídas de apt
+            compress=True,
             look_for_keys=False,
             allow_agent=False
         )
         elapsed = time.time() - start
         logger.info(f"[SSH] Conexão estabelecida em {elapsed:.2f}s")
+
+        # Keepalive para a conexão sobreviver ociosa (essencial para o pool de
+        # conexões reaproveitar o mesmo transport em chamadas subsequentes,
+        # no estilo do ControlMaster/ControlPersist do OpenSSH)
+        transport = client.get_transport()
+        if transport is not None:
+            transport.set_keepalive(30)
+
         return client
         
     except Exception as e:
@@ -49,14 +69,14 @@ def verify_ssh_connection(host, username, password):
     logger.info(f"[VERIFY] Iniciando verificação SSH para {username}@{host}")
     
     try:
-        logger.info(f"[VERIFY] Chamando get_ssh_client com timeout=30s")
-        client = get_ssh_client(host, username, password, timeout=30)
-        
-        elapsed = time.time() - start_time
-        logger.info(f"[VERIFY] Conexão SSH estabelecida com sucesso em {elapsed:.2f}s")
-        
-        client.close()
-        logger.info(f"[VERIFY] Conexão SSH fechada. Verificação completa.")
+        logger.info(f"[VERIFY] Abrindo sessão SSH via pool")
+        with ssh_session(host, username, password):
+            elapsed = time.time() - start_time
+            logger.info(f"[VERIFY] Conexão SSH estabelecida com sucesso em {elapsed:.2f}s")
+
+        # A conexão volta ao pool em vez de ser fechada: o install que
+        # normalmente vem logo depois não paga um novo handshake
+        logger.info(f"[VERIFY] Conexão devolvida ao pool. Verificação completa.")
         return True
         
     except Exception as e:
@@ -71,60 +91,322 @@ def verify_ssh_connection(host, username, password):
 def run_ssh_command(client, command, timeout=10):
     """
     Executa um comando no servidor remoto via SSH com timeout.
+    stdout e stderr são drenados juntos num loop de select (em vez do
+    recv_exit_status + read bloqueantes), o que evita o deadlock clássico
+    do paramiko quando um dos buffers enche e não bufferiza a saída em
+    dobro; os bytes só são decodificados uma vez, no final.
     """
-    logger.info(f"CMD: {command}")
-    stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
-    
-    # Define timeout no canal para leitura
-    stdout.channel.settimeout(timeout)
-    
+    import select
+    import time
+
+    logger.info("CMD: %s", command)
+    channel = client.get_transport().open_session()
+    channel.settimeout(timeout)
+    channel.exec_command(command)
+
+    out_buf = bytearray()
+    err_buf = bytearray()
+    deadline = time.time() + timeout if timeout else None
+
     try:
-        # Aguarda o comando finalizar e pega o status de saída
-        # recv_exit_status pode bloquear, mas o timeout do canal deve ajudar
-        exit_status = stdout.channel.recv_exit_status()
-        
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
+        while True:
+            readable, _, _ = select.select([channel], [], [], 0.5)
+            if readable:
+                while channel.recv_ready():
+                    out_buf += channel.recv(65536)
+                while channel.recv_stderr_ready():
+                    err_buf += channel.recv_stderr(65536)
+
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+
+            if deadline and time.time() > deadline:
+                raise Exception(f"Timeout após {timeout}s")
+
+        exit_status = channel.recv_exit_status()
+
+        # Drena qualquer resto que tenha chegado junto com o exit status
+        while channel.recv_ready():
+            out_buf += channel.recv(65536)
+        while channel.recv_stderr_ready():
+            err_buf += channel.recv_stderr(65536)
+
+        output = out_buf.decode(errors="replace").strip()
+        error = err_buf.decode(errors="replace").strip()
 
         if exit_status != 0:
             logger.error(f"ERRO CMD: {command}")
             logger.error(f"STDERR: {error}")
             raise Exception(f"Comando falhou: {error}")
         
-        logger.info(f"OUTPUT: {output[:100]}..." if len(output) > 100 else f"OUTPUT: {output}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("OUTPUT: %s", output[:100] + "..." if len(output) > 100 else output)
         return output
 
     except Exception as e:
-        logger.error(f"Timeout ou erro ao executar '{command}': {e}")
-        # Se for timeout, stdout.channel lança timeout
+        logger.error("Timeout ou erro ao executar '%s': %s", command, e)
         raise Exception(f"Erro/Timeout ao executar comando: {str(e)}")
+    finally:
+        channel.close()
+
+def run_ssh_command_streaming(client, command, timeout=300):
+    """
+    Executa um comando longo via SSH consumindo stdout/stderr em chunks
+    conforme chegam (em vez de bufferizar tudo no final). Falhas e timeouts
+    são detectados cedo e a saída vai para o log em tempo real.
+    """
+    import select
+    import time
+
+    logger.info("CMD (stream): %s", command)
+    stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+    channel = stdout.channel
+
+    output_chunks = []
+    deadline = time.time() + timeout if timeout else None
+
+    while True:
+        readable, _, _ = select.select([channel], [], [], 1.0)
+        if readable:
+            while channel.recv_ready():
+                chunk = channel.recv(8192).decode(errors="replace")
+                output_chunks.append(chunk)
+                logger.debug("STDOUT: %s", chunk.rstrip())
+            while channel.recv_stderr_ready():
+                chunk = channel.recv_stderr(8192).decode(errors="replace")
+                logger.debug("STDERR: %s", chunk.rstrip())
+
+        if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+            break
+
+        if deadline and time.time() > deadline:
+            raise Exception(f"Erro/Timeout ao executar comando: {command}")
+
+    exit_status = channel.recv_exit_status()
+    output = "".join(output_chunks).strip()
+
+    if exit_status != 0:
+        logger.error(f"ERRO CMD: {command}")
+        raise Exception(f"Comando falhou com exit status {exit_status}: {command}")
+
+    return output
+
+
+def _read_capped(stream, cap=65536):
+    """
+    Lê no máximo 'cap' bytes de um stream do paramiko em um bytearray,
+    decodificação fica para o chamador. Protege contra saídas patológicas
+    (comando remoto cuspindo MBs) quando só procuramos um marcador curto.
+    """
+    buf = bytearray()
+    while len(buf) < cap:
+        chunk = stream.read(min(8192, cap - len(buf)))
+        if not chunk:
+            break
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def run_ssh_script(client, script, timeout=600):
+    """
+    Executa vários comandos como UM único script remoto via 'bash -s'
+    (conteúdo enviado pelo stdin do canal). Paga uma única abertura de
+    canal/round-trip em vez de uma por comando; 'set -e' aborta no
+    primeiro erro. stdout/stderr são drenados no mesmo loop de select do
+    run_ssh_command — scripts falantes (install completo do Docker, apt)
+    não travam quando a saída estoura a janela do canal.
+    """
+    import select
+    import time
+
+    logger.info("SCRIPT SSH (%d bytes):\n%s", len(script), script)
+    stdin, stdout, stderr = client.exec_command("bash -s", timeout=timeout)
+    channel = stdout.channel
+    stdin.write("set -euo pipefail\n" + script + "\n")
+    stdin.channel.shutdown_write()
+
+    out_buf = bytearray()
+    err_buf = bytearray()
+    deadline = time.time() + timeout if timeout else None
+
+    while True:
+        readable, _, _ = select.select([channel], [], [], 1.0)
+        if readable:
+            while channel.recv_ready():
+                out_buf += channel.recv(65536)
+            while channel.recv_stderr_ready():
+                err_buf += channel.recv_stderr(65536)
+
+        if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+            break
+
+        if deadline and time.time() > deadline:
+            raise Exception(f"Erro/Timeout ao executar script ({timeout}s)")
+
+    exit_status = channel.recv_exit_status()
+
+    # Drena qualquer resto que tenha chegado junto com o exit status
+    while channel.recv_ready():
+        out_buf += channel.recv(65536)
+    while channel.recv_stderr_ready():
+        err_buf += channel.recv_stderr(65536)
+
+    output = out_buf.decode(errors="replace").strip()
+    error = err_buf.decode(errors="replace").strip()
+
+    if exit_status != 0:
+        logger.error(f"ERRO SCRIPT (exit {exit_status})")
+        logger.error(f"STDERR: {error}")
+        raise Exception(f"Script falhou: {error}")
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("OUTPUT: %s", output[:100] + "..." if len(output) > 100 else output)
+    return output
+
+
+@contextmanager
+def ssh_session(host, username, password):
+    """
+    Sessão SSH vinda do pool de conexões (app.ssh_pool): reaproveita uma
+    conexão autenticada com o host quando existe, em vez de pagar o
+    handshake TCP+SSH completo a cada chamada.
+    """
+    from app import ssh_pool
+    with ssh_pool.acquire(host, username, password) as client:
+        yield client
 
 # ... (outras funções)
 
+# Probe único de estado do servidor: os quatro checks preflight (docker,
+# swarm, redes, stacks) saem em UM comando SSH em vez de 4 conexões + 4
+# round-trips. O resultado fica em cache curto para servir chamadas
+# repetidas (ex.: vários check_stack_exists seguidos) em O(1).
+_PROBE_TTL = 10
+_probe_cache = {}  # (host, username) -> (ServerState, expira_em)
+_probe_lock = threading.Lock()
+
+# '{{json .}}' devolve um JSON por linha: além do nome, Status/Replicas etc.
+# chegam de graça no mesmo round-trip e ficam disponíveis nos *_details.
+_PROBE_SCRIPT = (
+    "docker --version 2>/dev/null; echo ---; "
+    "docker info --format '{{.Swarm.LocalNodeState}}' 2>/dev/null; echo ---; "
+    "docker network ls --format '{{json .}}' 2>/dev/null; echo ---; "
+    "docker stack ls --format '{{json .}}' 2>/dev/null; true"
+)
+
+
+def _parse_json_lines(blob):
+    entries = {}
+    for line in blob.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        name = entry.get("Name")
+        if name:
+            entries[name] = entry
+    return entries
+
+
+@dataclass
+class ServerState:
+    docker_version: Optional[str] = None
+    swarm_active: bool = False
+    networks: frozenset = frozenset()
+    stacks: frozenset = frozenset()
+    # Metadados completos por nome (Status, Replicas, Driver, ...)
+    network_details: dict = field(default_factory=dict)
+    stack_details: dict = field(default_factory=dict)
+
+
+def invalidate_probe_cache(host, username):
+    """
+    Descarta o estado cacheado de um host (após instalar/criar algo nele).
+    """
+    with _probe_lock:
+        _probe_cache.pop((host, username), None)
+
+
+def _invalidate_probe_for_client(client):
+    """
+    Versão da invalidação para quem só tem o SSHClient em mãos (ex.:
+    deploy_stack_remote): host/usuário saem do próprio transport.
+    """
+    try:
+        transport = client.get_transport()
+        invalidate_probe_cache(transport.getpeername()[0], transport.get_username())
+    except Exception:
+        pass
+
+
+def probe_server(host, username, password, use_cache=True):
+    """
+    Levanta o estado do servidor (docker, swarm, redes, stacks) em um único
+    comando SSH e retorna um ServerState.
+    """
+    import time
+
+    key = (host, username)
+    now = time.time()
+
+    if use_cache:
+        with _probe_lock:
+            cached = _probe_cache.get(key)
+            if cached and cached[1] > now:
+                return cached[0]
+
+    with ssh_session(host, username, password) as client:
+        output = run_ssh_command(client, _PROBE_SCRIPT, timeout=30)
+
+    parts = [p.strip() for p in output.split("---")]
+    while len(parts) < 4:
+        parts.append("")
+
+    network_details = _parse_json_lines(parts[2])
+    stack_details = _parse_json_lines(parts[3])
+
+    state = ServerState(
+        docker_version=parts[0] or None,
+        swarm_active=(parts[1] == "active"),
+        networks=frozenset(network_details),
+        stacks=frozenset(stack_details),
+        network_details=network_details,
+        stack_details=stack_details,
+    )
+
+    with _probe_lock:
+        _probe_cache[key] = (state, now + _PROBE_TTL)
+
+    return state
+
+
 def get_active_stacks(host, username, password):
     """
     Retorna uma lista com os nomes das stacks ativas no servidor remoto.
     """
-    client = get_ssh_client(host, username, password)
     try:
-        try:
-            output = run_ssh_command(client, "docker stack ls --format '{{.Name}}'")
-            stacks = [s.strip() for s in output.strip().splitlines() if s.strip()]
-            print(f"DEBUG: Stacks ativas no servidor {host}: {stacks}", flush=True)
-            return stacks
-        except Exception as e:
-            print(f"ERRO ao listar stacks: {e}", flush=True)
-            return []
-    finally:
-        client.close()
+        stacks = sorted(probe_server(host, username, password).stacks)
+        print(f"DEBUG: Stacks ativas no servidor {host}: {stacks}", flush=True)
+        return stacks
+    except Exception as e:
+        print(f"ERRO ao listar stacks: {e}", flush=True)
+        return []
 
 def check_stack_exists(host, username, password, stack_name):
     """
     Verifica se a stack Docker já existe no servidor remoto.
     Retorna True se existir, False caso contrário.
+    Uma rajada de checks consecutivos usa o probe cacheado (um único SSH
+    exec) e a consulta vira membership O(1) no frozenset.
     """
-    stacks = get_active_stacks(host, username, password)
-    exists = stack_name in stacks
+    try:
+        exists = stack_name in probe_server(host, username, password).stacks
+    except Exception as e:
+        print(f"ERRO ao listar stacks: {e}", flush=True)
+        exists = False
     print(f"CHECK STACK '{stack_name}': {exists}", flush=True)
     return exists
 
@@ -133,156 +415,217 @@ def check_docker_installed(host, username, password):
     Verifica se o Docker já está instalado no servidor remoto.
     Retorna a string de versão se instalado, None caso contrário.
     """
-    client = get_ssh_client(host, username, password)
     try:
-        # Usamos um bloco try-except porque run_ssh_command lança uma exceção se o comando falhar
-        try:
-            version = run_ssh_command(client, "docker --version")
-            return version
-        except Exception:
-            return None
-    finally:
-        client.close()
+        return probe_server(host, username, password).docker_version
+    except Exception as e:
+        logger.debug("check_docker_installed falhou: %s", e)
+        return None
 
 def install_docker(host, username, password):
     """
     Instala o Docker em um sistema remoto baseado em Debian via SSH.
     """
-    commands = [
-        "sudo apt-get update",
-        "sudo apt install -y sudo gnupg2 wget ca-certificates apt-transport-https curl gnupg nano htop",
-        "sudo install -m 0755 -d /etc/apt/keyrings",
-        "curl -fsSL https://download.docker.com/linux/debian/gpg | sudo gpg --dearmor -o /etc/apt/keyrings/docker.gpg || true", # || true para evitar erro se existir
-        "sudo chmod a+r /etc/apt/keyrings/docker.gpg",
-        'echo "deb [arch=$(dpkg --print-architecture) signed-by=/etc/apt/keyrings/docker.gpg] https://download.docker.com/linux/debian $(. /etc/os-release && echo "$VERSION_CODENAME") stable" | sudo tee /etc/apt/sources.list.d/docker.list >/dev/null',
-        "sudo apt-get update",
-        "sudo apt-get install -y docker-ce docker-ce-cli containerd.io docker-buildx-plugin docker-compose-plugin",
-        "sudo systemctl enable docker.service",
-        "sudo systemctl enable containerd.service"
-    ]
+    script = _load_template(os.path.join("app", "stack", "scripts", "install_docker.sh"))
 
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         logger.info(f"Iniciando instalação do Docker em {host}...")
-        for cmd in commands:
-            run_ssh_command(client, cmd)
+        run_ssh_script(client, script, timeout=600)
         logger.info("Instalação do Docker concluída com sucesso.")
+        invalidate_probe_cache(host, username)
         return {"status": "success", "message": "Docker instalado com sucesso"}
-    finally:
-        client.close()
 
 def upgrade_docker_engine(host, username, password):
     """
     Atualiza o Docker Engine no servidor remoto via SSH.
     """
-    commands = [
-        "sudo apt-get update",
-        "sudo DEBIAN_FRONTEND=noninteractive apt-get install --only-upgrade -y docker-ce docker-ce-cli containerd.io docker-buildx-plugin docker-compose-plugin"
-    ]
+    script = _load_template(os.path.join("app", "stack", "scripts", "upgrade_docker.sh"))
 
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         logger.info(f"Iniciando atualização do Docker em {host}...")
-        for cmd in commands:
-            run_ssh_command(client, cmd)
+        run_ssh_script(client, script, timeout=600)
         logger.info("Atualização do Docker concluída com sucesso.")
         return {"status": "success", "message": "Docker atualizado com sucesso"}
-    finally:
-        client.close()
 
 def check_swarm_active(host, username, password):
     """
     Verifica se o Docker Swarm já está ativo no servidor remoto.
     Retorna True se ativo, False caso contrário.
     """
-    client = get_ssh_client(host, username, password)
     try:
-        try:
-            # Verifica o estado do Swarm
-            output = run_ssh_command(client, "docker info --format '{{.Swarm.LocalNodeState}}'")
-            return output.strip() == "active"
-        except Exception:
-            return False
-    finally:
-        client.close()
+        return probe_server(host, username, password).swarm_active
+    except Exception as e:
+        logger.debug("check_swarm_active falhou: %s", e)
+        return False
 
 def init_swarm(host, username, password, advertise_addr):
     """
     Inicializa o Docker Swarm em um servidor remoto.
     """
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         logger.info(f"Inicializando Swarm em {host} ({advertise_addr})...")
         try:
             run_ssh_command(client, f"docker swarm init --advertise-addr {advertise_addr}")
+            invalidate_probe_cache(host, username)
             return {"status": "success", "message": "Swarm inicializado"}
         except Exception as e:
             if "This node is already part of a swarm" in str(e):
                 logger.info("Nó já faz parte de um swarm.")
                 return {"status": "success", "message": "Nó já faz parte de um swarm"}
             raise e
-    finally:
-        client.close()
 
 def check_network_exists(host, username, password, network_name):
     """
     Verifica se a rede Docker já existe no servidor remoto.
     Retorna True se existir, False caso contrário.
     """
-    client = get_ssh_client(host, username, password)
     try:
-        try:
-            # Lista as redes filtrando pelo nome exato
-            output = run_ssh_command(client, f"docker network ls --filter name=^{network_name}$ --format '{{{{.Name}}}}'")
-            return output.strip() == network_name
-        except Exception:
-            return False
-    finally:
-        client.close()
+        return network_name in probe_server(host, username, password).networks
+    except Exception as e:
+        logger.debug("check_network_exists falhou: %s", e)
+        return False
 
 def create_network(host, username, password, network_name):
     """
     Cria uma rede overlay Docker em um servidor remoto.
     """
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         logger.info(f"Criando rede {network_name} em {host}...")
         try:
             run_ssh_command(client, f"docker network create --driver overlay --attachable {network_name}")
+            invalidate_probe_cache(host, username)
             return {"status": "success", "message": f"Rede {network_name} criada"}
         except Exception as e:
              if "network with name" in str(e) and "already exists" in str(e):
                  logger.info(f"Rede {network_name} já existe.")
                  return {"status": "success", "message": f"Rede {network_name} já existe"}
              raise e
-    finally:
-        client.close()
 
 
 
+
+# Templates de stack: o arquivo é lido do disco uma única vez por processo
+# e os placeholders são aplicados em UMA passada (um único scan do YAML,
+# em vez de uma nova string por .replace encadeado).
+@lru_cache(maxsize=32)
+def _load_template(path):
+    # Sem os.path.exists antes: o stat extra é redundante (e sujeito a
+    # corrida) — o próprio open() sinaliza a ausência, com a mensagem padrão
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo de stack não encontrado: {path}")
+
+
+# string.Template não serve aqui: os YAMLs misturam {X}, ${X} e os templates
+# nativos do Docker ({{.Service.Name}}), então o padrão é compilado a partir
+# do conjunto exato de placeholders de cada stack — e cacheado, já que o
+# conjunto é fixo por template.
+@lru_cache(maxsize=32)
+def _placeholder_pattern(keys):
+    return re.compile("|".join(re.escape(key) for key in keys))
+
+
+def _render_template(template, mapping):
+    pattern = _placeholder_pattern(tuple(sorted(mapping)))
+    return pattern.sub(lambda match: mapping[match.group(0)], template)
+
+
+# Para templates re-renderizados com frequência (caso do n8n, 3 YAMLs por
+# install), o arquivo é pré-quebrado em segmentos em volta dos placeholders
+# uma única vez; cada render vira um "".join sem nenhum scan do YAML.
+@lru_cache(maxsize=32)
+def _template_segments(path, keys):
+    pattern = re.compile("(" + "|".join(re.escape(key) for key in keys) + ")")
+    return tuple(pattern.split(_load_template(path)))
+
+
+def _render_segments(path, mapping):
+    segments = _template_segments(path, tuple(sorted(mapping)))
+    return "".join(mapping.get(segment, segment) for segment in segments)
+
+
+# Compilação antecipada dos três templates do n8n no import: o pré-split em
+# segmentos já fica pronto e cada install renderiza com um único "".join,
+# sem nenhum scan do YAML em tempo de request.
+_N8N_PLACEHOLDER_KEYS = ("{N8N_HOST}", "{N8N_Webhook}", "{Senha_Postgres}")
+for _n8n_stack in ("n8n_editor", "n8n_webhook", "n8n_worker"):
+    try:
+        _template_segments(
+            os.path.join("app", "stack", "stacks", f"{_n8n_stack}.yml"),
+            _N8N_PLACEHOLDER_KEYS,
+        )
+    except OSError:
+        # Sem o arquivo no cwd atual o warm-up é só pulado; o render em
+        # request-time falha com a mensagem padrão se ele realmente faltar
+        pass
+
+
 def deploy_stack_remote(client, stack_name, stack_content):
     """
     Faz o deploy de uma stack Docker em um servidor remoto.
+    O YAML vai pelo stdin do próprio exec ('cat > arquivo && deploy'):
+    sem tempfile local e sem abrir o subsistema SFTP (um canal e um
+    round-trip a menos). SFTP fica apenas como fast-path para conteúdos
+    grandes (> 1 MiB).
     """
     logger.info(f"Fazendo deploy da stack {stack_name}...")
-    
-    # Precisamos transferir o arquivo para o servidor remoto
-    sftp = client.open_sftp()
     # Salva diretamente na pasta /root/
     remote_path = f"/root/{stack_name}.yml"
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.yml', delete=False, encoding='utf-8') as temp_file:
-        temp_file.write(stack_content)
-        temp_file_path = temp_file.name
-    
+
+    # Idempotência: se o YAML remoto tem o mesmo sha256 e a stack já está
+    # rodando, não há nada a fazer — economiza o upload e o reconcile do
+    # 'docker stack deploy' em redeploys repetidos.
+    local_hash = hashlib.sha256(stack_content.encode("utf-8")).hexdigest()
     try:
-        sftp.put(temp_file_path, remote_path)
+        probe = run_ssh_command(
+            client,
+            f"sha256sum {remote_path} 2>/dev/null | awk '{{print $1}}'; echo ---; "
+            "docker stack ls --format '{{.Name}}'",
+            timeout=15
+        )
+        remote_hash, _, stacks_part = probe.partition("---")
+        running = {s.strip() for s in stacks_part.splitlines() if s.strip()}
+        if remote_hash.strip() == local_hash and stack_name in running:
+            logger.info(f"Stack {stack_name} inalterada; deploy pulado.")
+            return {"status": "success", "message": f"Stack {stack_name} inalterada"}
+    except Exception:
+        pass  # o probe é só otimização; qualquer falha cai no deploy normal
+
+    if len(stack_content.encode("utf-8")) > 1024 * 1024:
+        sftp = client.open_sftp()
+        try:
+            with sftp.file(remote_path, "wb") as remote_file:
+                # Pipelined: mantém várias escritas SFTP em voo sem esperar
+                # o ACK de cada pacote — importante em links com RTT alto.
+                # Os chunks de 32KB casam com o MAX_REQUEST_SIZE do paramiko,
+                # deixando a janela de requisições pendentes fazer o resto.
+                remote_file.set_pipelined(True)
+                data = stack_content.encode("utf-8")
+                for offset in range(0, len(data), 32768):
+                    remote_file.write(data[offset:offset + 32768])
+        finally:
+            sftp.close()
         run_ssh_command(client, f"docker stack deploy -c {remote_path} {stack_name}")
+        _invalidate_probe_for_client(client)
         return {"status": "success", "message": f"Stack {stack_name} deployada"}
-    finally:
-        sftp.close()
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+
+    cmd = f"cat > {remote_path} && docker stack deploy -c {remote_path} {stack_name}"
+    logger.info(f"CMD: {cmd}")
+    stdin, stdout, stderr = client.exec_command(cmd, timeout=120)
+    stdin.write(stack_content)
+    stdin.channel.shutdown_write()
+
+    exit_status = stdout.channel.recv_exit_status()
+    error = stderr.read().decode().strip()
+
+    if exit_status != 0:
+        logger.error(f"ERRO CMD: {cmd}")
+        logger.error(f"STDERR: {error}")
+        raise Exception(f"Comando falhou: {error}")
+
+    _invalidate_probe_for_client(client)
+    return {"status": "success", "message": f"Stack {stack_name} deployada"}
 
 def install_traefik(host, username, password, email):
     """
@@ -290,20 +633,11 @@ def install_traefik(host, username, password, email):
     """
     stack_path = os.path.join("app", "stack", "stacks", "traefik.yml")
     
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
-
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
 
-    # Substitui o placeholder de email
-    stack_content = stack_content.replace("{email}", email)
+    stack_content = _render_template(_load_template(stack_path), {"{email}": email})
         
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         return deploy_stack_remote(client, "traefik", stack_content)
-    finally:
-        client.close()
 
 def install_portainer(host, username, password, portainer_host):
     """
@@ -311,50 +645,11 @@ def install_portainer(host, username, password, portainer_host):
     """
     stack_path = os.path.join("app", "stack", "stacks", "portainer.yml")
     
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
 
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
-        
-    # Substitui o placeholder pelo host real
-    stack_content = stack_content.replace("{{PORTAINER_HOST}}", portainer_host)
+    stack_content = _render_template(_load_template(stack_path), {"{{PORTAINER_HOST}}": portainer_host})
         
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         return deploy_stack_remote(client, "portainer", stack_content)
-    finally:
-        client.close()
-
-def update_docker_version_config(host, username, password):
-    """
-    Aplica a correção de versão da API do Docker para compatibilidade com Traefik/Portainer.
-    Cria um override no systemd definindo DOCKER_MIN_API_VERSION=1.24.
-    """
-    client = get_ssh_client(host, username, password)
-    try:
-        logger.info(f"Aplicando correção de versão da API do Docker em {host}...")
-        
-        # 1. Cria o diretório de override se não existir
-        run_ssh_command(client, "sudo mkdir -p /etc/systemd/system/docker.service.d")
-        
-        # 2. Cria o arquivo de configuração override
-        # Usamos echo com tee para escrever no arquivo com permissões de sudo
-        override_content = "[Service]\nEnvironment=DOCKER_MIN_API_VERSION=1.24"
-        cmd_create_file = f'echo -e "{override_content}" | sudo tee /etc/systemd/system/docker.service.d/override.conf'
-        run_ssh_command(client, cmd_create_file)
-        
-        # 3. Recarrega o daemon do systemd
-        run_ssh_command(client, "sudo systemctl daemon-reexec")
-        run_ssh_command(client, "sudo systemctl daemon-reload")
-        
-        # 4. Reinicia o serviço do Docker
-        run_ssh_command(client, "sudo systemctl restart docker")
-        
-        logger.info("Correção aplicada e Docker reiniciado com sucesso.")
-        return {"status": "success", "message": "Configuração do Docker atualizada com sucesso"}
-    finally:
-        client.close()
 
 def install_redis(host, username, password):
     """
@@ -362,171 +657,200 @@ def install_redis(host, username, password):
     """
     stack_path = os.path.join("app", "stack", "stacks", "redis.yml")
     
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
 
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
-        
-    client = get_ssh_client(host, username, password)
-    try:
+    stack_content = _load_template(stack_path)
+
+    with ssh_session(host, username, password) as client:
         return deploy_stack_remote(client, "redis", stack_content)
-    finally:
-        client.close()
+
+
+class RemotePortainerClient:
+    """
+    Cliente HTTP para a API do Portainer (127.0.0.1:9000 no host remoto)
+    sobre um canal 'direct-tcpip' do paramiko. Dispensa o fork de curl e os
+    arquivos temporários remotos por chamada: uma única conexão HTTP/1.1
+    keep-alive atende auth, endpoints, stacks, info e deploy.
+    """
+
+    def __init__(self, ssh_client, host="127.0.0.1", port=9000):
+        self._transport = ssh_client.get_transport()
+        self._host = host
+        self._port = port
+        self._conn = None
+
+    def connect(self):
+        channel = self._transport.open_channel(
+            "direct-tcpip", (self._host, self._port), ("127.0.0.1", 0)
+        )
+        conn = http.client.HTTPConnection(self._host, self._port)
+        # O Channel do paramiko é socket-like (sendall/recv/makefile),
+        # então serve diretamente de socket para o http.client
+        conn.sock = channel
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def request(self, method, path, headers=None, json_body=None):
+        request_headers = dict(headers or {})
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body)
+            request_headers["Content-Type"] = "application/json"
+
+        if self._conn is None:
+            self.connect()
+
+        try:
+            self._conn.request(method, path, body=body, headers=request_headers)
+            response = self._conn.getresponse()
+            content = response.read().decode("utf-8").strip()
+        except Exception:
+            # Canal em estado ruim: fecha para a próxima chamada reabrir
+            self.close()
+            raise
+
+        if response.status == 404:
+            raise Exception("Portainer API 404 Not Found")
+        if response.status == 401:
+            raise Exception("Portainer API 401 Unauthorized")
+        if response.status >= 400:
+            raise Exception(f"Portainer API {response.status}: {content[:200]}")
+
+        if not content:
+            return {}
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            raise Exception(f"Falha ao parsear JSON: {content[:200]}...")
+
+
+def _deploy_via_remote_helper(client, stack_name, stack_content, api_key=None):
+    """
+    Fallback do deploy via Portainer: executa app/stack/scripts/
+    portainer_deploy.py no servidor com o payload pelo stdin. Um único
+    exec substitui os 5 curls sequenciais (e seus TCP connects) de antes.
+    """
+    script = _load_template(os.path.join("app", "stack", "scripts", "portainer_deploy.py"))
+    payload = {
+        "api_key": api_key,
+        "username": "admin",
+        "password": "admin12345",
+        "stack_name": stack_name,
+        "stack_yml": stack_content,
+    }
+
+    stdin, stdout, stderr = client.exec_command(f"python3 -c {shlex.quote(script)}", timeout=120)
+    stdin.write(json.dumps(payload))
+    stdin.channel.shutdown_write()
+
+    exit_status = stdout.channel.recv_exit_status()
+    out_content = _read_capped(stdout).decode("utf-8").strip()
+    err_log = _read_capped(stderr).decode("utf-8")
+
+    try:
+        result = json.loads(out_content) if out_content else {}
+    except json.JSONDecodeError:
+        result = {}
+
+    if exit_status != 0 or result.get("status") != "success":
+        message = result.get("message") or err_log[-500:] or f"exit {exit_status}"
+        raise Exception(f"Falha no deploy via Portainer: {message}")
+    return result
+
 
 def install_redis_via_portainer(host, username, password, api_key=None):
     """
     Faz o deploy da stack do Redis usando a API do Portainer VIA SSH (Localhost).
     Isso evita problemas de firewall/portas fechadas (9000/9443).
     """
-    import json
-    import time
-    import random
-    
     stack_path = os.path.join("app", "stack", "stacks", "redis.yml")
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
 
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
+    stack_content = _load_template(stack_path)
 
-    client = get_ssh_client(host, username, password)
-    
-    try:
-        # Helper interno para rodar CURL e parsear JSON
-        def curl_request(method, endpoint, headers_dict, data_dict=None):
-            # Use 127.0.0.1 para evitar problemas com IPv6 no localhost
-            url = f"http://127.0.0.1:9000/api{endpoint}"
-            
-            # Monta headers
-            header_args = []
-            for k, v in headers_dict.items():
-                header_args.append(f'-H "{k}: {v}"')
-            header_str = " ".join(header_args)
-            
-            # Arquivos temporarios
-            remote_base = f"/tmp/portainer_{int(time.time())}_{random.randint(1000,9999)}"
-            remote_json_path = f"{remote_base}.json"
-            remote_out_path = f"{remote_base}.out"
-            
-            # Se tiver dados, salva em arquivo temp remoto
-            data_arg = ""
-            if data_dict:
-                try:
-                    sftp = client.open_sftp()
-                    with sftp.file(remote_json_path, 'w') as f:
-                        f.write(json.dumps(data_dict))
-                    sftp.close()
-                except Exception as e:
-                    logger.error(f"Erro no upload SFTP: {e}")
-                    raise e
-                
-                data_arg = f"-d @{remote_json_path}"
-                cleanup_files = f"{remote_json_path} {remote_out_path}"
+    with ssh_session(host, username, password) as client:
+        # Preferência: API via túnel direct-tcpip (sem processos remotos).
+        # Se o canal não abrir, um único helper Python remoto faz TODAS as
+        # chamadas (auth/endpoints/stacks/info/create) em um exec só, com
+        # uma conexão HTTP keep-alive interna — sem curl nem /tmp.
+        portainer = None
+        try:
+            portainer = RemotePortainerClient(client)
+            portainer.connect()
+        except Exception as e:
+            logger.warning(f"Túnel direct-tcpip indisponível ({e}); usando helper remoto.")
+            return _deploy_via_remote_helper(client, "redis", stack_content, api_key)
+
+        def api_request(method, endpoint, headers_dict, data_dict=None):
+            return portainer.request(method, f"/api{endpoint}", headers=headers_dict, json_body=data_dict)
+
+        # Tudo que usa o túnel fica sob um único try/finally: retorno
+        # antecipado ("stack já existe") ou erro em qualquer passo fecham
+        # o canal direct-tcpip em vez de vazá-lo na conexão devolvida ao pool
+        try:
+            # 1. Autenticação (Se não tiver API Key)
+            headers = {}
+            if api_key:
+                headers["X-API-Key"] = api_key
             else:
-                cleanup_files = f"{remote_out_path}"
-
-            # Monta comando CURL SIMPLES
-            # -o {remote_out_path}: Salva BODY (JSON)
-            # --max-time 30: Timeout interno do curl
-            # -s -S: Silent mas mostra erros
-            cmd = f"curl --max-time 30 -s -S -X {method} {header_str} -H 'Content-Type: application/json' {data_arg} '{url}' -o {remote_out_path}"
-            
-            print(f"DEBUG: [SSH] Enviando comando: {method} {endpoint}")
-            
-            # Executa limpo
-            stdin, stdout, stderr = client.exec_command(cmd)
-            stdin.close()
-            
-            # Agora é seguro esperar
-            print(f"DEBUG: [SSH] Aguardando termino...")
-            exit_status = stdout.channel.recv_exit_status()
-            print(f"DEBUG: [SSH] Terminou. Exit: {exit_status}")
-            
-            # Lê stderr se tiver
-            err_log = stderr.read().decode('utf-8')
-
-            if exit_status != 0:
-                 raise Exception(f"CURL Failed with Exit Code {exit_status}. Stderr: {err_log[-500:]}")
-            
-            # Lê o arquivo de resposta
-            print(f"DEBUG: [SSH] Lendo resposta de {remote_out_path}...")
-            try:
-                stdin_cat, stdout_cat, stderr_cat = client.exec_command(f"cat {remote_out_path}")
-                out_content = stdout_cat.read().decode('utf-8').strip()
-            except Exception as e:
-                raise Exception(f"Falha ao ler output file: {e}")
-                
-            # Limpeza
-            client.exec_command(f"rm {cleanup_files}")
-            
-            try:
-                if not out_content: return {}
-                return json.loads(out_content)
-            except json.JSONDecodeError:
-                 if "404" in out_content: raise Exception("Portainer API 404 Not Found")
-                 if "401" in out_content: raise Exception("Portainer API 401 Unauthorized")
-                 if "Bad Request" in out_content: raise Exception(f"Portainer 400 Bad Request: {out_content}")
-                 raise Exception(f"Falha ao parsear JSON: {out_content[:200]}...")
-
-        # 1. Autenticação (Se não tiver API Key)
-        headers = {}
-        if api_key:
-            headers["X-API-Key"] = api_key
-        else:
-            logger.info("Autenticando no Portainer (Localhost) com credenciais internas...")
-            auth_resp = curl_request("POST", "/auth", {}, {"Username": "admin", "Password": "admin12345"})
-            if not auth_resp.get("jwt"):
-                 raise Exception(f"Falha na autenticação: {auth_resp}")
-            headers["Authorization"] = f"Bearer {auth_resp['jwt']}"
-
-        # 2. Buscar Endpoint ID
-        logger.info("Buscando Endpoint ID...")
-        endpoints = curl_request("GET", "/endpoints", headers)
-        endpoint_id = None
-        for ep in endpoints:
-            if ep.get("Status") == 1: # Up
-                endpoint_id = ep.get("Id")
-                break
-        
-        if not endpoint_id:
-            raise Exception("Nenhum endpoint ativo encontrado no Portainer.")
-
-        # 3. Verificar se Stack existe
-        logger.info("Verificando stacks existentes...")
-        stacks = curl_request("GET", "/stacks", headers)
-        for stack in stacks:
-            if stack.get("Name") == "redis":
-                 return {"status": "success", "message": "Stack Redis já existe no Portainer."}
-
-        # 4. Deploy da Stack
-        logger.info(f"Criando Stack Redis no Endpoint {endpoint_id}...")
+                logger.info("Autenticando no Portainer (Localhost) com credenciais internas...")
+                auth_resp = api_request("POST", "/auth", {}, {"Username": "admin", "Password": "admin12345"})
+                if not auth_resp.get("jwt"):
+                     raise Exception(f"Falha na autenticação: {auth_resp}")
+                headers["Authorization"] = f"Bearer {auth_resp['jwt']}"
+
+            # 2. Buscar Endpoint ID
+            logger.info("Buscando Endpoint ID...")
+            endpoints = api_request("GET", "/endpoints", headers)
+            endpoint_id = None
+            for ep in endpoints:
+                if ep.get("Status") == 1: # Up
+                    endpoint_id = ep.get("Id")
+                    break
         
-        # Precisamos do SwarmID
-        docker_info = curl_request("GET", f"/endpoints/{endpoint_id}/docker/info", headers)
-        swarm_id = docker_info.get("Swarm", {}).get("Cluster", {}).get("ID")
+            if not endpoint_id:
+                raise Exception("Nenhum endpoint ativo encontrado no Portainer.")
+
+            # 3. Verificar se Stack existe
+            logger.info("Verificando stacks existentes...")
+            stacks = api_request("GET", "/stacks", headers)
+            for stack in stacks:
+                if stack.get("Name") == "redis":
+                     return {"status": "success", "message": "Stack Redis já existe no Portainer."}
+
+            # 4. Deploy da Stack
+            logger.info(f"Criando Stack Redis no Endpoint {endpoint_id}...")
         
-        payload = {
-            "Name": "redis",
-            "StackFileContent": stack_content,
-            "SwarmID": swarm_id or "placeholder"
-        }
+            # Precisamos do SwarmID
+            docker_info = api_request("GET", f"/endpoints/{endpoint_id}/docker/info", headers)
+            swarm_id = docker_info.get("Swarm", {}).get("Cluster", {}).get("ID")
         
-        logger.info(f"DEBUG: Payload size: {len(json.dumps(payload))} bytes")
+            payload = {
+                "Name": "redis",
+                "StackFileContent": stack_content,
+                "SwarmID": swarm_id or "placeholder"
+            }
         
-        # Query Params na URL para create stack
-        create_url = f"/stacks?type=1&method=string&endpointId={endpoint_id}"
+            logger.info(f"DEBUG: Payload size: {len(json.dumps(payload))} bytes")
         
-        deploy_resp = curl_request("POST", create_url, headers, payload)
+            # Query Params na URL para create stack
+            create_url = f"/stacks?type=1&method=string&endpointId={endpoint_id}"
         
-        if deploy_resp.get("Id"):
-             return {"status": "success", "message": "Redis instalado com sucesso via Portainer (Localhost)!"}
-        else:
-             # Tenta ler mensagem de erro
-             raise Exception(f"Erro no deploy: {deploy_resp}")
+            deploy_resp = api_request("POST", create_url, headers, payload)
+
+            if deploy_resp.get("Id"):
+                 return {"status": "success", "message": "Redis instalado com sucesso via Portainer (Localhost)!"}
+            else:
+                 # Tenta ler mensagem de erro
+                 raise Exception(f"Erro no deploy: {deploy_resp}")
+        finally:
+            portainer.close()
 
-    finally:
-        client.close()
 
 def install_postgres(host, username, password, postgres_password):
     """
@@ -535,20 +859,11 @@ def install_postgres(host, username, password, postgres_password):
     """
     stack_path = os.path.join("app", "stack", "stacks", "postgres.yml")
     
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
 
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
-    
-    # Substitui o placeholder pela senha real
-    stack_content = stack_content.replace("${POSTGRES_PASSWORD}", postgres_password)
+    stack_content = _render_template(_load_template(stack_path), {"${POSTGRES_PASSWORD}": postgres_password})
         
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         return deploy_stack_remote(client, "postgres", stack_content)
-    finally:
-        client.close()
 
 def install_rabbitmq(host, username, password, rabbit_user, rabbit_password, rabbit_base_url):
     """
@@ -557,25 +872,18 @@ def install_rabbitmq(host, username, password, rabbit_user, rabbit_password, rab
     """
     stack_path = os.path.join("app", "stack", "stacks", "rabbit.yml")
     
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
 
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
-    
     # Remove https:// se vier na URL
     rabbit_base_url_clean = rabbit_base_url.replace("https://", "").replace("http://", "")
 
-    # Substitui os placeholders
-    stack_content = stack_content.replace("{Usuario_Rabbit}", rabbit_user)
-    stack_content = stack_content.replace("{Senha_Rabbit}", rabbit_password)
-    stack_content = stack_content.replace("{BaseUrl_Rabbit}", rabbit_base_url_clean)
+    stack_content = _render_template(_load_template(stack_path), {
+        "{Usuario_Rabbit}": rabbit_user,
+        "{Senha_Rabbit}": rabbit_password,
+        "{BaseUrl_Rabbit}": rabbit_base_url_clean,
+    })
         
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         return deploy_stack_remote(client, "rabbitmq", stack_content)
-    finally:
-        client.close()
 
 def install_minio(host, username, password, minio_user, minio_password, minio_base_url_private, minio_base_url_public):
     """
@@ -588,26 +896,19 @@ def install_minio(host, username, password, minio_user, minio_password, minio_ba
     """
     stack_path = os.path.join("app", "stack", "stacks", "minio.yml")
     
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
 
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
-    
     console_domain = minio_base_url_private   # Ex: privadotesteary02.aryaraj.shop
     api_domain = minio_base_url_public        # Ex: s3testeary02.aryaraj.shop
 
-    # Substitui os placeholders
-    stack_content = stack_content.replace("{Usuario_Minio}", minio_user)
-    stack_content = stack_content.replace("{Senha_Minio}", minio_password)
-    stack_content = stack_content.replace("{Console_Domain}", console_domain)
-    stack_content = stack_content.replace("{Domain}", api_domain)
+    stack_content = _render_template(_load_template(stack_path), {
+        "{Usuario_Minio}": minio_user,
+        "{Senha_Minio}": minio_password,
+        "{Console_Domain}": console_domain,
+        "{Domain}": api_domain,
+    })
         
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         return deploy_stack_remote(client, "minio", stack_content)
-    finally:
-        client.close()
 
 def create_postgres_database(client, db_name):
     """
@@ -655,28 +956,49 @@ def install_baserow(host, username, password, baserow_base_url, postgres_passwor
     """
     stack_path = os.path.join("app", "stack", "stacks", "baserow.yml")
     
-    if not os.path.exists(stack_path):
-        raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path}")
 
-    with open(stack_path, "r") as f:
-        stack_content = f.read()
-    
     # Remove https:// se vier na URL, pois o arquivo yml já adiciona onde precisa
     baserow_base_url_clean = baserow_base_url.replace("https://", "").replace("http://", "")
 
-    # Substitui os placeholders
-    stack_content = stack_content.replace("{BaseUrl_Baserow}", baserow_base_url_clean)
-    stack_content = stack_content.replace("{Senha_Baserow}", postgres_password)
+    stack_content = _render_template(_load_template(stack_path), {
+        "{BaseUrl_Baserow}": baserow_base_url_clean,
+        "{Senha_Baserow}": postgres_password,
+    })
         
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         # 1. Cria o banco de dados
         create_postgres_database(client, "baserow")
         
         # 2. Faz o deploy da stack
         return deploy_stack_remote(client, "baserow", stack_content)
-    finally:
-        client.close()
+
+
+def install_stacks_parallel(tasks):
+    """
+    Executa instalações independentes em paralelo sobre o pool SSH.
+    'tasks' é uma lista de callables sem argumentos (closures que já
+    capturam as credenciais, ex.: em volta de install_traefik/...). O tempo
+    total vira ~max(tarefa) em vez da soma; o paramiko solta o GIL durante
+    a espera de rede. Erros individuais são agregados em uma única exceção.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=min(len(tasks), 8)) as executor:
+        futures = [executor.submit(task) for task in tasks]
+        for future in futures:
+            exc = future.exception()
+            if exc is not None:
+                errors.append(exc)
+            else:
+                results.append(future.result())
+
+    if errors:
+        summary = "; ".join(str(e) for e in errors)
+        raise Exception(f"Falha em {len(errors)} instalação(ões): {summary}")
+    return results
+
 
 def install_chatwoot(host, username, password, postgres_password, minio_user, minio_password, minio_base_url_public, chatwoot_base_url):
     """
@@ -687,86 +1009,77 @@ def install_chatwoot(host, username, password, postgres_password, minio_user, mi
     minio_base_url_public_clean = minio_base_url_public.replace("https://", "").replace("http://", "")
     chatwoot_base_url_clean = chatwoot_base_url.replace("https://", "").replace("http://", "")
     
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         # 1. Cria o banco de dados
         create_postgres_database(client, "chatwoot")
 
         # 2. Deploy do Chatwoot Admin
         stack_path_admin = os.path.join("app", "stack", "stacks", "chatwoot_admin.yml")
-        if not os.path.exists(stack_path_admin):
-            raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path_admin}")
 
-        with open(stack_path_admin, "r") as f:
-            content_admin = f.read()
-        
-        content_admin = content_admin.replace("{Senha_Postgres}", postgres_password)
-        content_admin = content_admin.replace("{Usuario_Minio}", minio_user)
-        content_admin = content_admin.replace("{Senha_Minio}", minio_password)
-        content_admin = content_admin.replace("{BaseUrl_Publica_Minio}", minio_base_url_public_clean)
-        content_admin = content_admin.replace("{BaseUrl_chatwoot}", chatwoot_base_url_clean) # Env var
-        content_admin = content_admin.replace("{BaseUrl_Chatwoot}", chatwoot_base_url_clean) # Traefik label
+        content_admin = _render_template(_load_template(stack_path_admin), {
+            "{Senha_Postgres}": postgres_password,
+            "{Usuario_Minio}": minio_user,
+            "{Senha_Minio}": minio_password,
+            "{BaseUrl_Publica_Minio}": minio_base_url_public_clean,
+            "{BaseUrl_chatwoot}": chatwoot_base_url_clean,  # Env var
+            "{BaseUrl_Chatwoot}": chatwoot_base_url_clean,  # Traefik label
+        })
         
-        deploy_stack_remote(client, "chatwoot_admin", content_admin)
-        
-        # 2. Deploy do Chatwoot Sidekiq
+        # 2. Deploy do Chatwoot Sidekiq (renderizado junto para subir em paralelo)
         stack_path_sidekiq = os.path.join("app", "stack", "stacks", "chatwoot_sidekiq.yml")
-        if not os.path.exists(stack_path_sidekiq):
-            raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path_sidekiq}")
-
-        with open(stack_path_sidekiq, "r") as f:
-            content_sidekiq = f.read()
-            
-        content_sidekiq = content_sidekiq.replace("{Senha_Postgres}", postgres_password)
-        content_sidekiq = content_sidekiq.replace("{Usuario_Minio}", minio_user)
-        content_sidekiq = content_sidekiq.replace("{Senha_Minio}", minio_password)
-        content_sidekiq = content_sidekiq.replace("{BaseUrl_Publica_Minio}", minio_base_url_public_clean)
-        content_sidekiq = content_sidekiq.replace("{BaseUrl_chatwoot}", chatwoot_base_url_clean)
-        
-        deploy_stack_remote(client, "chatwoot_sidekiq", content_sidekiq)
+
+        content_sidekiq = _render_template(_load_template(stack_path_sidekiq), {
+            "{Senha_Postgres}": postgres_password,
+            "{Usuario_Minio}": minio_user,
+            "{Senha_Minio}": minio_password,
+            "{BaseUrl_Publica_Minio}": minio_base_url_public_clean,
+            "{BaseUrl_chatwoot}": chatwoot_base_url_clean,
+        })
+
+        # Admin e Sidekiq são independentes até a migração: sobem em paralelo
+        def _deploy_admin():
+            with ssh_session(host, username, password) as deploy_client:
+                deploy_stack_remote(deploy_client, "chatwoot_admin", content_admin)
+
+        def _deploy_sidekiq():
+            with ssh_session(host, username, password) as deploy_client:
+                deploy_stack_remote(deploy_client, "chatwoot_sidekiq", content_sidekiq)
+
+        install_stacks_parallel([_deploy_admin, _deploy_sidekiq])
         
         # 3. Executar prepare database
-        logger.info("Aguardando containers iniciarem para rodar a migração do banco...")
-        import time
-        time.sleep(10) # Espera um pouco para o serviço ser criado
-        
-        # Tenta encontrar o container do admin
+        logger.info("Aguardando container do Chatwoot e rodando a migração (exec único)...")
+        # O próprio servidor espera o container aparecer e já dispara o
+        # db:chatwoot_prepare no mesmo shell: um canal SSH só, sem trazer o
+        # ID do container de volta para o Python. Exit 2 = container não
+        # apareceu no prazo; outros códigos = falha na migração.
         # O nome do serviço é chatwoot_admin_chatwoot_admin
-        get_container_cmd = "docker ps -q -f name=chatwoot_admin_chatwoot_admin | head -n 1"
-        
-        # Loop para tentar pegar o container ID (pode demorar para subir)
-        container_id = None
-        for _ in range(12): # Tenta por 1 minuto (12 * 5s)
-            container_id = run_ssh_command(client, get_container_cmd).strip()
-            if container_id:
-                break
-            logger.info("Aguardando container do Chatwoot Admin subir...")
-            time.sleep(5)
-            
-        if container_id:
-            logger.info(f"Container encontrado: {container_id}. Executando db:chatwoot_prepare...")
-            prepare_cmd = f"docker exec {container_id} bundle exec rails db:chatwoot_prepare"
-            try:
-                run_ssh_command(client, prepare_cmd)
-                logger.info("Migração do Chatwoot concluída com sucesso.")
-            except Exception as e:
-                logger.error(f"Erro ao rodar migração do Chatwoot: {e}")
-                # Não lança exceção aqui para não invalidar o deploy que já foi feito, mas loga o erro
-        else:
+        prepare_cmd = (
+            'cid=""; for i in $(seq 1 120); do '
+            'cid=$(docker ps -q -f name=chatwoot_admin_chatwoot_admin | head -n 1); '
+            '[ -n "$cid" ] && break; sleep 1; done; '
+            '[ -z "$cid" ] && exit 2; '
+            'docker exec "$cid" bundle exec rails db:chatwoot_prepare'
+        )
+        stdin, stdout, stderr = client.exec_command(prepare_cmd, timeout=600)
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status == 0:
+            logger.info("Migração do Chatwoot concluída com sucesso.")
+        elif exit_status == 2:
             logger.warning("Não foi possível encontrar o container do Chatwoot Admin para rodar a migração.")
+        else:
+            # Não lança exceção aqui para não invalidar o deploy que já foi feito, mas loga o erro
+            logger.error(f"Erro ao rodar migração do Chatwoot: {_read_capped(stderr).decode(errors='replace').strip()[-500:]}")
 
         return {"status": "success", "message": "Chatwoot instalado e configurado com sucesso."}
 
-    finally:
-        client.close()
 
 def restart_stack_services(host, username, password, stack_name):
     """
     Reinicia todos os serviços de uma stack específica forçando um update.
     Equivalente a 'docker service update --force <service_name>' para cada serviço da stack.
     """
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         # 1. Lista os serviços da stack
         logger.info(f"Listando serviços da stack '{stack_name}' para reinício...")
         cmd_list = f"docker stack services {stack_name} --format '{{{{.Name}}}}'"
@@ -778,193 +1091,257 @@ def restart_stack_services(host, username, password, stack_name):
             return {"status": "warning", "message": f"Nenhum serviço encontrado para a stack '{stack_name}'"}
 
         logger.info(f"Serviços encontrados: {services}")
+
+        # 2. Reinicia todos em paralelo no próprio servidor ('&' + wait) e com
+        # --detach=true: a convergência dos N serviços se sobrepõe no Swarm em
+        # vez de ser paga em série, e um único exec SSH dispara tudo.
+        # --update-parallelism 0 (sem limite) + --update-delay 0s empurram o
+        # rollout das réplicas para dentro do manager do Swarm, em vez de
+        # sequenciar do lado Python via SSH
+        # 'wait' sem argumentos sempre retorna 0; o sentinela marca updates
+        # que falharam na submissão
+        script = "\n".join(
+            f"docker service update --detach=true --force --update-parallelism 0 --update-delay 0s {service} || echo __FALHOU__ {service} &"
+            for service in services
+        ) + "\nwait"
+        output = run_ssh_script(client, script, timeout=300)
+        failed = [line.split()[1] for line in output.splitlines()
+                  if line.startswith("__FALHOU__") and len(line.split()) > 1]
+        if failed:
+            raise Exception(f"Falha ao reiniciar serviços: {', '.join(failed)}")
+
+        # Confirmação de convergência: UM 'docker stack services' agregado
+        # por rodada (em vez de esperar serviço a serviço), com backoff
+        # 0.5s -> 4s até todas as réplicas baterem N/N
+        import time
+        delay = 0.5
+        deadline = time.monotonic() + 300
+        pending = services
+        while time.monotonic() < deadline:
+            output = run_ssh_command(
+                client,
+                f"docker stack services {stack_name} --format '{{{{.Name}}}} {{{{.Replicas}}}}'",
+                timeout=15
+            )
+            pending = []
+            for line in output.splitlines():
+                parts = line.split()
+                if len(parts) >= 2:
+                    current, _, desired = parts[1].partition("/")
+                    if current != desired:
+                        pending.append(parts[0])
+            if not pending:
+                return {
+                    "status": "success",
+                    "message": f"{len(services)} serviços da stack '{stack_name}' reiniciados e convergidos"
+                }
+            time.sleep(delay)
+            delay = min(delay * 2, 4.0)
+
+        return {
+            "status": "warning",
+            "message": f"Stack '{stack_name}' reiniciada; ainda convergindo: {', '.join(pending)}"
+        }
         
-        # 2. Reinicia cada serviço
-        results = []
-        for service in services:
-            logger.info(f"Reiniciando serviço '{service}'...")
-            cmd_update = f"docker service update --force {service}"
-            try:
-                run_ssh_command(client, cmd_update)
-                results.append(f"Serviço '{service}' reiniciado com sucesso.")
-            except Exception as e:
-                logger.error(f"Erro ao reiniciar serviço '{service}': {e}")
-                results.append(f"Erro ao reiniciar '{service}': {str(e)}")
-        
-    finally:
-        client.close()
 
 def install_n8n(host, username, password, postgres_password, n8n_host, n8n_webhook_url):
     """
     Instala a stack do N8N (Editor, Webhook, Worker).
     1. Cria o banco de dados 'n8n_queue' no Postgres.
-    2. Faz o deploy das 3 stacks.
-    """
-    client = get_ssh_client(host, username, password)
-    try:
-        # 1. Cria o banco de dados
-        create_postgres_database(client, "n8n_queue")
-
-        # Limpa URLs
-        n8n_host_clean = n8n_host.replace("https://", "").replace("http://", "").strip("/")
-        n8n_webhook_url_clean = n8n_webhook_url.replace("https://", "").replace("http://", "").strip("/")
-
-        # 2. Deploy do N8N Editor
-        stack_path_editor = os.path.join("app", "stack", "stacks", "n8n_editor.yml")
-        if not os.path.exists(stack_path_editor):
-             raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path_editor}")
-        
-        with open(stack_path_editor, "r", encoding="utf-8") as f:
-            content_editor = f.read()
-        
-        content_editor = content_editor.replace("{Senha_Postgres}", postgres_password)
-        content_editor = content_editor.replace("{N8N_HOST}", n8n_host_clean)
-        content_editor = content_editor.replace("{N8N_Webhook}", n8n_webhook_url_clean)
-        
-        deploy_stack_remote(client, "n8n_editor", content_editor)
+    2. Faz o deploy das 3 stacks em paralelo (são independentes entre si,
+       só compartilham o banco já criado) — o tempo total vira ~max() em
+       vez da soma dos três deploys.
+    """
+    # Limpa URLs
+    n8n_host_clean = n8n_host.replace("https://", "").replace("http://", "").strip("/")
+    n8n_webhook_url_clean = n8n_webhook_url.replace("https://", "").replace("http://", "").strip("/")
+
+    placeholders = {
+        "{Senha_Postgres}": postgres_password,
+        "{N8N_HOST}": n8n_host_clean,
+        "{N8N_Webhook}": n8n_webhook_url_clean,
+    }
 
-        # 3. Deploy do N8N Webhook
-        stack_path_webhook = os.path.join("app", "stack", "stacks", "n8n_webhook.yml")
-        if not os.path.exists(stack_path_webhook):
-             raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path_webhook}")
+    def _prepare_stack(stack_name):
+        stack_path = os.path.join("app", "stack", "stacks", f"{stack_name}.yml")
+        return stack_name, _render_segments(stack_path, placeholders)
 
-        with open(stack_path_webhook, "r", encoding="utf-8") as f:
-            content_webhook = f.read()
-            
-        content_webhook = content_webhook.replace("{Senha_Postgres}", postgres_password)
-        content_webhook = content_webhook.replace("{N8N_HOST}", n8n_host_clean)
-        content_webhook = content_webhook.replace("{N8N_Webhook}", n8n_webhook_url_clean)
+    rendered = [_prepare_stack(name) for name in ("n8n_editor", "n8n_webhook", "n8n_worker")]
 
-        deploy_stack_remote(client, "n8n_webhook", content_webhook)
+    with ssh_session(host, username, password) as client:
+        # 1. Cria o banco de dados
+        create_postgres_database(client, "n8n_queue")
 
-        # 4. Deploy do N8N Worker
-        stack_path_worker = os.path.join("app", "stack", "stacks", "n8n_worker.yml")
-        if not os.path.exists(stack_path_worker):
-             raise FileNotFoundError(f"Arquivo de stack não encontrado: {stack_path_worker}")
+    # 2. Deploys em paralelo, cada um com uma sessão do pool
+    def _deploy_task(stack_name, stack_content):
+        def task():
+            with ssh_session(host, username, password) as deploy_client:
+                deploy_stack_remote(deploy_client, stack_name, stack_content)
+        return task
 
-        with open(stack_path_worker, "r", encoding="utf-8") as f:
-            content_worker = f.read()
+    install_stacks_parallel([_deploy_task(name, content) for name, content in rendered])
 
-        content_worker = content_worker.replace("{Senha_Postgres}", postgres_password)
-        content_worker = content_worker.replace("{N8N_HOST}", n8n_host_clean)
-        content_worker = content_worker.replace("{N8N_Webhook}", n8n_webhook_url_clean)
+    return {"status": "success", "message": "N8N (Editor, Webhook, Worker) instalado com sucesso."}
 
-        deploy_stack_remote(client, "n8n_worker", content_worker)
 
-        return {"status": "success", "message": "N8N (Editor, Webhook, Worker) instalado com sucesso."}
+# 'docker stack services' é chamado por vários fluxos (env vars, restart,
+# status) para a mesma stack em sequência; 5s de cache por (host, stack)
+# colapsam a rajada em um único exec remoto.
+_STACK_SVC_TTL = 5.0
+_stack_svc_cache = {}  # (host, stack_name) -> (timestamp, [serviços])
+_stack_svc_lock = threading.Lock()
 
-    finally:
-        client.close()
 
 def get_stack_services(client, stack_name):
     """
-    Retorna uma lista dos nomes dos serviços de uma stack.
+    Retorna uma lista dos nomes dos serviços de uma stack (cache de 5s).
     """
+    import time
+
+    try:
+        host = client.get_transport().getpeername()[0]
+    except Exception:
+        host = None
+
+    now = time.monotonic()
+    if host is not None:
+        with _stack_svc_lock:
+            cached = _stack_svc_cache.get((host, stack_name))
+            if cached and now - cached[0] < _STACK_SVC_TTL:
+                return list(cached[1])
+
     cmd = f"docker stack services {stack_name} --format '{{{{.Name}}}}'"
     output = run_ssh_command(client, cmd)
-    return [s.strip() for s in output.strip().splitlines() if s.strip()]
+    services = [s.strip() for s in output.strip().splitlines() if s.strip()]
+
+    if host is not None:
+        with _stack_svc_lock:
+            _stack_svc_cache[(host, stack_name)] = (now, services)
+
+    return services
 
 def get_service_env_vars(client, service_name):
     """
     Retorna um dicionário com as variáveis de ambiente de um serviço.
     """
-    # Formato retornado é ["VAR=VAL", "VAR2=VAL2"]
-    cmd = f"docker service inspect {service_name} --format '{{{{json .Spec.TaskTemplate.ContainerSpec.Env}}}}'"
+    # O range/println do docker emite direto "VAR=VAL" por linha: sem JSON
+    # para parsear e o partition faz o split K=V em uma única passada
+    cmd = (
+        f"docker service inspect {shlex.quote(service_name)} "
+        "--format '{{range .Spec.TaskTemplate.ContainerSpec.Env}}{{println .}}{{end}}'"
+    )
     try:
         output = run_ssh_command(client, cmd)
-        import json
-        env_list = json.loads(output)
-        if not env_list:
-            return {}
-        
-        env_dict = {}
-        for item in env_list:
-            if "=" in item:
-                key, value = item.split("=", 1)
-                env_dict[key] = value
-        return env_dict
+        return dict(line.partition("=")[::2] for line in output.splitlines() if "=" in line)
     except Exception as e:
         logger.error(f"Erro ao ler env vars de {service_name}: {e}")
         return {}
 
+def get_services_env_vars(client, service_names):
+    """
+    Retorna {serviço: {VAR: VALOR}} para vários serviços com UM único
+    'docker service inspect' (o docker aceita N nomes por invocação e
+    devolve uma linha JSON por serviço) — 1 round-trip em vez de N.
+    """
+    if not service_names:
+        return {}
+
+    cmd = (
+        "docker service inspect --format '{{json .Spec.TaskTemplate.ContainerSpec.Env}}' "
+        + " ".join(shlex.quote(name) for name in service_names)
+    )
+    output = run_ssh_command(client, cmd)
+
+    result = {}
+    lines = [line for line in output.splitlines() if line.strip()]
+    for name, line in zip(service_names, lines):
+        try:
+            env_list = json.loads(line) or []
+        except json.JSONDecodeError:
+            env_list = []
+        result[name] = dict(item.split("=", 1) for item in env_list if "=" in item)
+    return result
+
+
 def get_stack_env_vars(host, username, password, stack_name):
     """
     Retorna as variáveis de ambiente consolidadas da stack.
     Pega do primeiro serviço encontrado, assumindo que compartilham as principais configs.
     """
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         services = get_stack_services(client, stack_name)
         if not services:
             return {}
-        
-        # Pega do primeiro serviço (geralmente o principal)
-        return get_service_env_vars(client, services[0])
-    finally:
-        client.close()
+
+        # Pega do primeiro serviço (geralmente o principal); o inspect em
+        # lote deixa os demais disponíveis pelo mesmo round-trip
+        return get_services_env_vars(client, services).get(services[0], {})
 
 def update_stack_env_vars(host, username, password, stack_name, env_vars):
     """
     Atualiza as variáveis de ambiente de TODOS os serviços da stack.
     env_vars é um dict {'VAR': 'VAL'}.
     """
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         services = get_stack_services(client, stack_name)
         if not services:
             raise Exception(f"Nenhum serviço encontrado para a stack {stack_name}")
 
-        # Monta a string de argumentos --env-add
-        env_args = []
-        for key, value in env_vars.items():
-            # Escapa aspas se necessário
-            env_args.append(f'--env-add "{key}={value}"')
-        
-        env_args_str = " ".join(env_args)
+        # Monta a string de argumentos --env-add (shlex.quote cobre $,
+        # backticks e espaços sem re-parse do shell)
+        env_args_str = " ".join(
+            f"--env-add {shlex.quote(f'{key}={value}')}"
+            for key, value in env_vars.items()
+        )
+
+        # --detach=true devolve o controle imediatamente e o '&' + wait faz
+        # os N serviços convergirem em paralelo dentro do Swarm, em um único
+        # exec SSH
+        logger.info(f"Atualizando variáveis em {len(services)} serviços...")
+        # 'wait' sem argumentos sempre retorna 0, então cada update marca a
+        # própria falha com um sentinela que é verificado aqui
+        script = "\n".join(
+            f"docker service update --detach=true {env_args_str} {service} || echo __FALHOU__ {service} &"
+            for service in services
+        ) + "\nwait"
+        output = run_ssh_script(client, script, timeout=300)
+        failed = [line.split()[1] for line in output.splitlines()
+                  if line.startswith("__FALHOU__") and len(line.split()) > 1]
+        if failed:
+            raise Exception(f"Falha ao atualizar variáveis em: {', '.join(failed)}")
         
-        for service in services:
-            logger.info(f"Atualizando variáveis em {service}...")
-            cmd = f"docker service update {env_args_str} {service}"
-            run_ssh_command(client, cmd)
-            
         return {"status": "success", "message": f"Variáveis atualizadas em {len(services)} serviços da stack {stack_name}"}
-    finally:
-        client.close()
 
 def update_docker_version_config(host, username, password):
     """
     Configura DOCKER_MIN_API_VERSION=1.24 no systemd override e reinicia o Docker.
     """
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         logger.info(f"Aplicando correção de versão da API do Docker em {host}...")
-        
-        # 1. Criar diretório se não existir
-        run_ssh_command(client, "sudo mkdir -p /etc/systemd/system/docker.service.d")
-        
-        # 2. Criar arquivo de override
-        override_content = '[Service]\nEnvironment="DOCKER_MIN_API_VERSION=1.24"'
-        cmd_create_file = f'echo \'{override_content}\' | sudo tee /etc/systemd/system/docker.service.d/override.conf'
-        run_ssh_command(client, cmd_create_file)
-        
-        # 3. Reload e Restart
-        run_ssh_command(client, "sudo systemctl daemon-reload")
-        run_ssh_command(client, "sudo systemctl restart docker")
-        
-        # 4. Verificar (comando solicitado pelo usuário)
-        output = run_ssh_command(client, "systemctl show --property=Environment docker")
+
+        # O conteúdo do override vai por SFTP (sem escaping de shell nem
+        # echo|tee); install + reload + restart + verificação saem em um
+        # único exec via script
+        override_content = '[Service]\nEnvironment="DOCKER_MIN_API_VERSION=1.24"\n'
+        sftp = client.open_sftp()
+        try:
+            with sftp.file("/tmp/docker_override.conf", "w") as remote_file:
+                remote_file.write(override_content)
+        finally:
+            sftp.close()
+
+        script = _load_template(os.path.join("app", "stack", "scripts", "docker_api_version_fix.sh"))
+        output = run_ssh_script(client, script, timeout=120)
         logger.info(f"Verificação de ambiente Docker: {output.strip()}")
         
         return {"status": "success", "message": "Configuração do Docker atualizada com sucesso"}
-    finally:
-        client.close()
 
 def get_full_system_status(host, username, password):
     """
-    Realiza todas as verificações de estado do sistema em UMA ÚNICA conexão SSH.
-    Isso otimiza muito o tempo de resposta dibandingkan fazer 5 conexões separadas.
+    Realiza todas as verificações de estado do sistema em UMA ÚNICA conexão
+    SSH e em UM único exec: as cinco sondas saem juntas separadas por uma
+    linha-sentinela e são parseadas do lado de cá (1 RTT em vez de 4-5).
     """
-    client = get_ssh_client(host, username, password, timeout=10)
     status = {
         "docker": None,
         "swarm": False,
@@ -972,120 +1349,169 @@ def get_full_system_status(host, username, password):
         "ctop": False,
         "active_stacks": []
     }
-    
-    try:
-        # 1. Check Docker
-        try:
-            # Reutiliza o cliente para rodar comando
-            output = run_ssh_command(client, "docker --version", timeout=5)
-            status["docker"] = output.strip()
-        except:
-            return status # Se não tem docker, retorna tudo false/vazio
-
-        # 2. Check Swarm
-        try:
-            output = run_ssh_command(client, "docker info --format '{{.Swarm.LocalNodeState}}'", timeout=5)
-            status["swarm"] = (output.strip() == "active")
-        except:
-            pass
 
-        # 3. Check Ctop (Execution based)
-        try:
-            # Run ctop --help to check if command exists (avoids TUI hang)
-            # Add /usr/local/bin to PATH ensuring we find it if it's there
-            cmd = "export PATH=$PATH:/usr/local/bin; ctop --help"
-            stdin, stdout, stderr = client.exec_command(cmd, timeout=10)
-            out = stdout.read().decode('utf-8')
-            err = stderr.read().decode('utf-8')
-            full_req = (out + err).lower()
-
-            # Debug log to see exactly what is returned
-            logger.info(f"CTOP Check Output: '{full_req}'")
-
-            # Rigid check for shell error. "not found" is too broad (can be config not found)
-            if "command not found" in full_req or (len(full_req.strip()) > 0 and "not found" in full_req and "sh:" in full_req):
-                status["ctop"] = False
-            else:
-                status["ctop"] = True
-                
-        except Exception as e:
-             logger.warning(f"Ctop check exception: {e}")
-             # Timeout or connection error -> Assume False
-             pass
+    script = (
+        "docker --version 2>/dev/null; echo ---; "
+        "docker info --format '{{.Swarm.LocalNodeState}}' 2>/dev/null; echo ---; "
+        "PATH=$PATH:/usr/local/bin command -v ctop >/dev/null 2>&1 && echo Y || echo N; echo ---; "
+        "docker network ls --filter name=^network_swarm_public$ -q 2>/dev/null | grep -q . && echo yes || echo no; echo ---; "
+        "docker stack ls --format '{{.Name}}' 2>/dev/null; true"
+    )
 
-        # 4. Check Network & Stacks (Only if Swarm is active usually, but we check if docker exists)
-        if status["swarm"]:
-            try:
-                # Check Network
-                net_cmd = "docker network ls --filter name=^network_swarm_public$ --format '{{.Name}}'"
-                output = run_ssh_command(client, net_cmd, timeout=5)
-                status["network"] = (output.strip() == "network_swarm_public")
-                
-                # Check Stacks
-                stack_cmd = "docker stack ls --format '{{.Name}}'"
-                output = run_ssh_command(client, stack_cmd, timeout=5)
-                status["active_stacks"] = [s.strip() for s in output.strip().splitlines() if s.strip()]
-            except:
-                pass
-                
+    try:
+        with ssh_session(host, username, password) as client:
+            output = run_ssh_command(client, script, timeout=15)
     except Exception as e:
         logger.error(f"Erro no check em lote: {e}")
-    finally:
-        client.close()
-        
+        return status
+
+    parts = [p.strip() for p in output.split("---")]
+    while len(parts) < 5:
+        parts.append("")
+    docker_part, swarm_part, ctop_part, network_part, stacks_part = parts[:5]
+
+    # 1. Check Docker
+    if not docker_part:
+        return status  # Se não tem docker, retorna tudo false/vazio
+    status["docker"] = docker_part
+
+    # 2. Check Swarm
+    status["swarm"] = (swarm_part == "active")
+
+    # 3. Check Ctop ('command -v' é builtin: sem fork do binário Go nem
+    # parsing do texto de help)
+    status["ctop"] = (ctop_part == "Y")
+
+    # 4. Check Network & Stacks (Only if Swarm is active)
+    if status["swarm"]:
+        # O próprio servidor reduz a listagem a um booleano (yes/no): menos
+        # bytes no canal e nenhum parsing de nomes aqui
+        status["network"] = (network_part == "yes")
+        status["active_stacks"] = [s.strip() for s in stacks_part.splitlines() if s.strip()]
+
     return status
 
 
 def check_ctop_installed(host, username, password):
     """
     Verifica se o Ctop está instalado no servidor remoto.
-    Executa 'ctop --help' e verifica se retorna 'command not found'.
+    Usa 'command -v' (builtin do shell): não executa o binário do ctop,
+    então não há fork, leitura de config nem texto de help para analisar.
     """
-    client = get_ssh_client(host, username, password)
-    try:
+    with ssh_session(host, username, password) as client:
         try:
-            # User request: Check if running 'ctop' returns 'command not found'.
-            # We use --help to avoid entering the TUI if it IS installed.
-            # Add /usr/local/bin to PATH
-            cmd = "export PATH=$PATH:/usr/local/bin; ctop --help"
-            stdin, stdout, stderr = client.exec_command(cmd, timeout=10)
-            
-            # Combine outputs to check for the shell error message
-            out = stdout.read().decode('utf-8')
-            err = stderr.read().decode('utf-8')
-            full_output = (out + err).lower()
-
-            if "command not found" in full_output or "not found" in full_output:
-                 return False
-            
-            # If it didn't say "not found", assumes it is installed
-            return True
+            cmd = "PATH=$PATH:/usr/local/bin command -v ctop >/dev/null 2>&1 && echo Y || echo N"
+            output = run_ssh_command(client, cmd, timeout=5)
+            return output.strip() == "Y"
 
-        except Exception:
+        except Exception as e:
             # Communication error or timeout
+            logger.debug("check_ctop_installed falhou: %s", e)
             return False
-    finally:
-        client.close()
 
 
 def install_ctop(host, username, password):
     """
     Instala o Ctop (container monitoring tool) no servidor remoto via SSH.
     """
+    # Os cinco comandos viram UM script remoto: 1 canal SSH e 1 shell em vez
+    # de 5, e o apt reaproveita lock/cache dentro do mesmo processo.
+    # Dpkg::Use-Pty=0 dispensa a alocação de PTY do apt.
     commands = [
-        "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y ca-certificates curl gnupg lsb-release",
+        "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -o Dpkg::Use-Pty=0 ca-certificates curl gnupg lsb-release",
         "curl -fsSL https://azlux.fr/repo.gpg.key | sudo gpg --dearmor --batch --yes -o /usr/share/keyrings/azlux-archive-keyring.gpg",
         'echo "deb [arch=$(dpkg --print-architecture) signed-by=/usr/share/keyrings/azlux-archive-keyring.gpg] http://packages.azlux.fr/debian $(lsb_release -cs) main" | sudo tee /etc/apt/sources.list.d/azlux.list >/dev/null',
-        "sudo apt-get update",
-        "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y docker-ctop"
+        "sudo apt-get update -q",
+        "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -o Dpkg::Use-Pty=0 docker-ctop"
     ]
 
-    client = get_ssh_client(host, username, password)
-    try:
+    script = " && ".join(commands)
+
+    with ssh_session(host, username, password) as client:
         logger.info(f"Iniciando instalação do Ctop em {host}...")
-        for cmd in commands:
-            run_ssh_command(client, cmd, timeout=60)
+        run_ssh_command(client, f"bash -c {shlex.quote(script)}", timeout=180)
         logger.info("Instalação do Ctop concluída com sucesso.")
         return {"status": "success", "message": "Ctop instalado com sucesso"}
+
+
+# --- Fachada assíncrona ---
+# Handlers async não devem pinar uma worker thread durante um install de
+# vários segundos. As funções abaixo despacham o trabalho bloqueante
+# (paramiko + pool) para o threadpool do asyncio; N hosts podem ser
+# provisionados concorrentemente a partir de um único event loop.
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Executa qualquer função bloqueante deste módulo fora do event loop.
+    """
+    import asyncio
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def averify_ssh_connection(host, username, password):
+    return await run_blocking(verify_ssh_connection, host, username, password)
+
+
+async def ainstall_docker(host, username, password):
+    return await run_blocking(install_docker, host, username, password)
+
+
+async def aprobe_server(host, username, password, use_cache=True):
+    return await run_blocking(probe_server, host, username, password, use_cache)
+
+
+async def async_run_ssh_command(client, command, timeout=10):
+    """
+    Versão awaitable de run_ssh_command: o exit status é aguardado com
+    polls não-bloqueantes, devolvendo o event loop ao FastAPI enquanto o
+    comando remoto (ex.: convergência de um service update) roda.
+    """
+    import asyncio
+
+    channel = client.get_transport().open_session()
+    channel.settimeout(timeout)
+    channel.setblocking(False)
+    channel.exec_command(command)
+
+    out_buf = bytearray()
+    err_buf = bytearray()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+
+    try:
+        while True:
+            while channel.recv_ready():
+                out_buf += channel.recv(65536)
+            while channel.recv_stderr_ready():
+                err_buf += channel.recv_stderr(65536)
+
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+
+            if deadline and loop.time() > deadline:
+                raise Exception(f"Erro/Timeout ao executar comando: {command}")
+
+            await asyncio.sleep(0.05)
+
+        exit_status = channel.recv_exit_status()
+        output = out_buf.decode(errors="replace").strip()
+        error = err_buf.decode(errors="replace").strip()
+
+        if exit_status != 0:
+            raise Exception(f"Comando falhou: {error}")
+        return output
     finally:
-        client.close()
+        channel.close()
+
+
+async def arestart_stack_services(host, username, password, stack_name):
+    return await run_blocking(restart_stack_services, host, username, password, stack_name)
+
+
+async def aupdate_stack_env_vars(host, username, password, stack_name, env_vars):
+    return await run_blocking(update_stack_env_vars, host, username, password, stack_name, env_vars)
+
+
+async def ainstall_n8n(host, username, password, postgres_password, n8n_host, n8n_webhook_url):
+    return await run_blocking(install_n8n, host, username, password,
+                              postgres_password, n8n_host, n8n_webhook_url)
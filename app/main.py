@@ -1,15 +1,35 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import Optional
-from app.installer import install_docker, init_swarm, create_network, install_traefik, install_portainer, check_docker_installed, check_swarm_active, check_network_exists, check_stack_exists, install_redis, install_postgres, install_rabbitmq, install_minio, install_baserow, install_n8n, install_chatwoot
-from app.dns_manager import list_zones, create_dns_record, list_dns_records, delete_dns_record, update_dns_record
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from typing import Dict, Optional
+from app import ssh_pool
+from app.installer import (
+    install_docker, init_swarm, create_network, install_traefik, install_portainer,
+    check_docker_installed, check_swarm_active, check_network_exists, check_stack_exists,
+    install_redis, install_postgres, install_rabbitmq, install_minio, install_baserow,
+    install_n8n, install_chatwoot, install_ctop, upgrade_docker_engine,
+    update_docker_version_config, verify_ssh_connection, get_full_system_status,
+    get_active_stacks, get_stack_env_vars, update_stack_env_vars, restart_stack_services,
+    run_blocking, invalidate_probe_cache,
+)
+from app.dns_manager import (
+    list_zones, create_dns_record, list_dns_records, delete_dns_record, update_dns_record,
+    alist_zones, acreate_dns_record, alist_dns_records, adelete_dns_record, aupdate_dns_record,
+    invalidate_zones_cache,
+)
+import asyncio
+import json
 import logging
 import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # Configura logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+logger = logging.getLogger(__name__)
 
 # Inicializa FastAPI
 app = FastAPI()
@@ -25,11 +45,24 @@ app.add_middleware(
 )
 
 class DNSRecordDeleteRequest(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
     api_token: str
     zone_id: str
     record_id: str
 
+class CacheInvalidateRequest(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
+    api_token: str
+
+
 class DNSRecordUpdateRequest(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
     api_token: str
     zone_id: str
     record_id: str
@@ -39,19 +72,24 @@ class DNSRecordUpdateRequest(BaseModel):
 
 # ... existing endpoints ...
 
+@app.post("/cloudflare/zones/invalidate")
+async def invalidate_cf_zones(req: CacheInvalidateRequest):
+    invalidate_zones_cache(req.api_token)
+    return {"message": "Cache de zonas invalidado."}
+
 @app.post("/cloudflare/delete")
-def delete_cf_record(req: DNSRecordDeleteRequest):
+async def delete_cf_record(req: DNSRecordDeleteRequest):
     try:
-        result = delete_dns_record(req.api_token, req.zone_id, req.record_id)
+        result = await adelete_dns_record(req.api_token, req.zone_id, req.record_id)
         return {"message": "Registro deletado com sucesso!", "details": result}
     except Exception as e:
-        logging.error(f"Error deleting record: {e}")
+        logger.error(f"Error deleting record: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/cloudflare/update")
-def update_cf_record(req: DNSRecordUpdateRequest):
+async def update_cf_record(req: DNSRecordUpdateRequest):
     try:
-        result = update_dns_record(
+        result = await aupdate_dns_record(
             req.api_token, 
             req.zone_id, 
             req.record_id, 
@@ -61,20 +99,62 @@ def update_cf_record(req: DNSRecordUpdateRequest):
         )
         return {"message": "Registro atualizado com sucesso!", "details": result}
     except Exception as e:
-        logging.error(f"Error updating record: {e}")
+        logger.error(f"Error updating record: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 # Logging já configurado no início do arquivo (linha 12)
 
-# Mount static files
-static_dir = os.path.join(os.path.dirname(__file__), "static")
-if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+def _warm_ssh_host(host, username, password):
+    try:
+        # acquire + release imediato: a conexão autenticada fica no pool
+        with ssh_pool.acquire(host, username, password):
+            pass
+        logger.info("Conexão SSH pré-aquecida para %s@%s", username, host)
+    except Exception as e:
+        logger.warning("Falha ao pré-aquecer SSH de %s@%s: %s", username, host, e)
+
+
+@app.on_event("startup")
+async def warm_ssh_connections():
+    """
+    Pré-aquece o pool de conexões para hosts conhecidos: a primeira
+    chamada de API contra eles não paga o handshake. Formato da env
+    WARM_SSH_HOSTS: 'usuario:senha@host' separados por vírgula.
+    """
+    for entry in os.getenv("WARM_SSH_HOSTS", "").split(","):
+        entry = entry.strip()
+        if not entry or "@" not in entry or ":" not in entry:
+            continue
+        creds, _, host = entry.rpartition("@")
+        username, _, password = creds.partition(":")
+        install_executor.submit(_warm_ssh_host, host, username, password)
+
+
+@app.on_event("startup")
+async def expand_threadpool():
+    # Endpoints bloqueantes de SSH seguram uma worker thread por vários
+    # segundos; com o limite padrão do anyio (40 threads) os endpoints
+    # rápidos ficariam na fila atrás deles sob carga.
+    from anyio import to_thread
+    to_thread.current_default_thread_limiter().total_tokens = 200
+
+
+# Mount static files (caminhos resolvidos uma única vez no import)
+STATIC_DIR = Path(__file__).parent / "static"
+INDEX_HTML = STATIC_DIR / "index.html"
+if STATIC_DIR.exists():
+    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 class CloudflareAuth(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
     api_token: str
 
 class DNSRecordRequest(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
     api_token: str
     zone_id: str
     name: str # Subdomain or @
@@ -82,20 +162,20 @@ class DNSRecordRequest(BaseModel):
     proxied: bool = True
 
 @app.post("/cloudflare/zones")
-def get_cf_zones(auth: CloudflareAuth):
+async def get_cf_zones(auth: CloudflareAuth):
     try:
-        zones = list_zones(auth.api_token)
+        zones = await alist_zones(auth.api_token)
         return {"zones": zones}
     except Exception as e:
         # Log error for debugging
-        logging.error(f"Error fetching zones: {e}")
+        logger.error(f"Error fetching zones: {e}")
         # Return 400 so frontend catches it
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/cloudflare/create")
-def create_cf_record(req: DNSRecordRequest):
+async def create_cf_record(req: DNSRecordRequest):
     try:
-        result = create_dns_record(
+        result = await acreate_dns_record(
             req.api_token, 
             req.zone_id, 
             req.name, 
@@ -104,24 +184,30 @@ def create_cf_record(req: DNSRecordRequest):
         )
         return {"message": "Registro DNS criado com sucesso!", "details": result}
     except Exception as e:
-        logging.error(f"Error creating record: {e}")
+        logger.error(f"Error creating record: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 class DNSListRequest(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
     api_token: str
     zone_id: str
     ip_filter: Optional[str] = None
 
 @app.post("/cloudflare/records")
-def list_cf_records(req: DNSListRequest):
+async def list_cf_records(req: DNSListRequest):
     try:
-        records = list_dns_records(req.api_token, req.zone_id, req.ip_filter)
+        records = await alist_dns_records(req.api_token, req.zone_id, req.ip_filter)
         return {"records": records}
     except Exception as e:
-        logging.error(f"Error listing records: {e}")
+        logger.error(f"Error listing records: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 class ServerCredentials(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
     host: str
     username: str
     password: str
@@ -130,55 +216,50 @@ class NetworkCreateRequest(ServerCredentials):
     network_name: str = "network_swarm_public"
     overwrite: bool = False
 
-@app.get("/")
-def read_root():
-    return FileResponse(os.path.join(static_dir, "index.html"))
-
 @app.post("/verify-connection")
-def verify_connection(credentials: ServerCredentials):
+def verify_connection(credentials: ServerCredentials):  # def-on-purpose: blocking SSH
     """
     Verifica APENAS se é possível conectar via SSH (Login).
     Rápido: ~1-3 segundos.
     """
     import time
     start_time = time.time()
-    
-    logging.info("="*60)
-    logging.info(f"[ENDPOINT] /verify-connection recebido")
-    logging.info(f"[ENDPOINT] Host: {credentials.host}")
-    logging.info(f"[ENDPOINT] Username: {credentials.username}")
-    logging.info(f"[ENDPOINT] Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    from app.installer import verify_ssh_connection
-    
+
+    # UM registro estruturado em vez de 6 logger.info: cada log formata
+    # string e disputa o lock global do logging — em paralelo isso
+    # serializava as workers neste endpoint quente
+    logger.info("[ENDPOINT] /verify-connection recebido host=%s user=%s",
+                credentials.host, credentials.username)
+
     try:
-        logging.info(f"[ENDPOINT] Chamando verify_ssh_connection...")
         result = verify_ssh_connection(credentials.host, credentials.username, credentials.password)
-        
+
         elapsed = time.time() - start_time
-        
+
         if result:
-            logging.info(f"[ENDPOINT] ✓ Conexão bem-sucedida em {elapsed:.2f}s")
+            logger.info("[ENDPOINT] verify-connection ok host=%s elapsed=%.2fs",
+                        credentials.host, elapsed)
             return {"message": "Conectado com sucesso!"}
         else:
-            logging.error(f"[ENDPOINT] ✗ Conexão falhou em {elapsed:.2f}s")
+            logger.error("[ENDPOINT] verify-connection falhou host=%s elapsed=%.2fs",
+                         credentials.host, elapsed)
             raise HTTPException(status_code=401, detail="Falha na autenticação ou host inacessível")
-            
+
     except HTTPException:
         raise
     except Exception as e:
         elapsed = time.time() - start_time
-        logging.error(f"[ENDPOINT] ✗ Exceção após {elapsed:.2f}s: {type(e).__name__}: {str(e)}")
+        logger.error("[ENDPOINT] verify-connection excecao host=%s elapsed=%.2fs err=%s: %s",
+                     credentials.host, elapsed, type(e).__name__, e)
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.post("/system-status")
-def system_status(credentials: ServerCredentials):
+def system_status(credentials: ServerCredentials):  # def-on-purpose: blocking SSH
     """
     Verifica o estado completo do sistema (Docker, Swarm, Apps).
     Pesado: ~5-15 segundos.
     """
-    logging.info(f"Fetching full system status for: {credentials.host}")
-    from app.installer import get_full_system_status
+    logger.info(f"Fetching full system status for: {credentials.host}")
     
     status_data = get_full_system_status(credentials.host, credentials.username, credentials.password)
     
@@ -192,184 +273,337 @@ def system_status(credentials: ServerCredentials):
         "detected_stacks": status_data["active_stacks"]
     }
 
-# Dicionário para armazenar o status das instalações
+@app.post("/system-status/stream")
+async def system_status_stream(credentials: ServerCredentials):
+    """
+    Versão SSE do /system-status: o cliente recebe um evento por componente
+    (docker, swarm, network, ctop, stacks) assim que o resultado chega, em
+    vez de esperar a resposta inteira — e a worker thread do FastAPI não
+    fica presa, pois o probe roda via run_blocking.
+    Credenciais no corpo (como nos demais endpoints): senha em query string
+    acabaria nos access logs.
+    """
+    async def event_source():
+        yield 'data: {"status": "probing"}\n\n'
+        # O probe em si já é UM único exec SSH (mais rápido que 5 sondas
+        # separadas); daqui os componentes saem como eventos individuais
+        status_data = await run_blocking(get_full_system_status,
+                                         credentials.host, credentials.username, credentials.password)
+        for key in ("docker", "swarm", "network", "ctop"):
+            yield f"data: {json.dumps({key: status_data[key]})}\n\n"
+        yield f"data: {json.dumps({'detected_stacks': status_data['active_stacks']})}\n\n"
+
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
+
+# Executor dedicado para o trabalho de SSH/instalação: o threadpool do
+# FastAPI fica livre para os endpoints curtos (/verify-connection,
+# /install-status) mesmo com dezenas de installs em andamento
+install_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="installer")
+
+
+@app.on_event("shutdown")
+def shutdown_install_executor():
+    install_executor.shutdown(wait=False)
+
+
+# Dedupe de triggers concorrentes: um segundo POST para o mesmo
+# (serviço, host) — double-click ou dois operadores — retorna na hora em
+# vez de enfileirar outro deploy de 30s para o mesmo servidor
+_INFLIGHT_EXPIRY = 15 * 60  # auto-expira para se recuperar de workers mortos
+_inflight_installs = {}  # (serviço, host) -> monotonic de início
+_inflight_lock = threading.Lock()
+
+
+def _try_begin_install(service, host):
+    import time
+    now = time.monotonic()
+    with _inflight_lock:
+        started = _inflight_installs.get((service, host))
+        if started is not None and now - started < _INFLIGHT_EXPIRY:
+            return False
+        _inflight_installs[(service, host)] = now
+        return True
+
+
+def _finish_install(service, host):
+    with _inflight_lock:
+        _inflight_installs.pop((service, host), None)
+
+
+# Dicionário para armazenar o status das instalações (snapshot mais recente,
+# mantido para o endpoint de polling legado)
 install_status = {}
 
+# Assinantes SSE por serviço: cada atualização de status é replicada para as
+# filas dos clientes conectados, eliminando o polling do frontend
+_status_subscribers = defaultdict(list)
+_status_lock = threading.Lock()
+_event_loop = None
+
+
+@app.on_event("startup")
+async def capture_event_loop():
+    global _event_loop
+    _event_loop = asyncio.get_running_loop()
+
+
+def set_install_status(service, status, message):
+    """
+    Atualiza o snapshot de status e notifica os assinantes SSE.
+    Seguro para chamar de background threads (call_soon_threadsafe).
+    """
+    payload = {"status": status, "message": message}
+    install_status[service] = payload
+
+    if _event_loop is not None:
+        with _status_lock:
+            queues = list(_status_subscribers.get(service, []))
+        for queue in queues:
+            _event_loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+
 @app.get("/install-status/{service}")
-def get_install_status(service: str):
+async def get_install_status(service: str):
     """
     Retorna o status da instalação de um serviço.
     """
     return install_status.get(service, {"status": "unknown", "message": "Serviço não encontrado"})
 
+
+@app.get("/install-status-stream/{service}")
+async def stream_install_status(service: str):
+    """
+    Stream SSE do status de instalação: o frontend recebe as mudanças em
+    push, em vez de fazer polling no endpoint acima.
+    """
+    queue = asyncio.Queue()
+    with _status_lock:
+        _status_subscribers[service].append(queue)
+
+    async def event_source():
+        try:
+            snapshot = install_status.get(service)
+            if snapshot is not None:
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                if snapshot.get("status") in ("success", "error"):
+                    return
+            while True:
+                payload = await queue.get()
+                yield f"data: {json.dumps(payload)}\n\n"
+                if payload.get("status") in ("success", "error"):
+                    return
+        finally:
+            with _status_lock:
+                try:
+                    _status_subscribers[service].remove(queue)
+                except ValueError:
+                    pass
+
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
 def run_install_docker_task(host, username, password):
-    install_status['docker'] = {'status': 'running', 'message': 'Instalando Docker...'}
+    set_install_status('docker', 'running', 'Instalando Docker...')
     try:
-        from app.installer import install_docker, update_docker_version_config
         
         # 1. Instala o Docker
         result = install_docker(host, username, password)
         
         # 2. Atualiza a configuração da versão da API (Automático)
-        install_status['docker'] = {'status': 'running', 'message': 'Atualizando configuração do Docker...'}
+        set_install_status('docker', 'running', 'Atualizando configuração do Docker...')
         update_docker_version_config(host, username, password)
         
-        install_status['docker'] = {'status': 'success', 'message': 'Docker instalado e configurado com sucesso!'}
+        set_install_status('docker', 'success', 'Docker instalado e configurado com sucesso!')
     except Exception as e:
-        logger.error(f"Erro na task de instalação do Docker: {e}")
-        install_status['docker'] = {'status': 'error', 'message': str(e)}
+        logger.exception(f"Erro na task de instalação do Docker: {e}")
+        set_install_status('docker', 'error', str(e))
+    _finish_install('docker', host)
 
 @app.post("/install-docker")
-def trigger_docker_install(credentials: ServerCredentials, background_tasks: BackgroundTasks):
+async def trigger_docker_install(credentials: ServerCredentials):
     """
     Inicia o processo de instalação do Docker em um servidor remoto.
     """
     try:
-        # Verifica se o Docker já está instalado
-        existing_version = check_docker_installed(credentials.host, credentials.username, credentials.password)
+        # Verifica se o Docker já está instalado (probe SSH roda no executor
+        # de installs, não na thread de request)
+        loop = asyncio.get_running_loop()
+        existing_version = await loop.run_in_executor(
+            install_executor, check_docker_installed,
+            credentials.host, credentials.username, credentials.password)
         if existing_version:
              return {"message": f"Docker já está instalado com sucesso. Versão: {existing_version}"}
 
         # Inicia a task com o wrapper para atualizar o status
-        background_tasks.add_task(run_install_docker_task, credentials.host, credentials.username, credentials.password)
+        if not _try_begin_install('docker', credentials.host):
+            return {"message": f"Instalação de 'docker' já está em andamento em {credentials.host}"}
+
+        install_executor.submit(run_install_docker_task, credentials.host, credentials.username, credentials.password)
         return {"message": f"Instalação do Docker iniciada em {credentials.host}"}
     except Exception as e:
-        logger.error(f"Falha ao iniciar a instalação: {e}")
+        logger.exception(f"Falha ao iniciar a instalação: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 def run_upgrade_docker_task(host, username, password):
-    install_status['docker-upgrade'] = {'status': 'running', 'message': 'Atualizando Docker...'}
+    set_install_status('docker-upgrade', 'running', 'Atualizando Docker...')
     try:
-        from app.installer import upgrade_docker_engine
         result = upgrade_docker_engine(host, username, password)
-        install_status['docker-upgrade'] = {'status': 'success', 'message': result.get('message', 'Docker atualizado com sucesso!')}
+        set_install_status('docker-upgrade', 'success', result.get('message', 'Docker atualizado com sucesso!'))
     except Exception as e:
-        logger.error(f"Erro na task de atualização do Docker: {e}")
-        install_status['docker-upgrade'] = {'status': 'error', 'message': str(e)}
+        logger.exception(f"Erro na task de atualização do Docker: {e}")
+        set_install_status('docker-upgrade', 'error', str(e))
+    _finish_install('docker-upgrade', host)
 
 def run_init_swarm_task(host, username, password, advertise_addr):
-    install_status['swarm'] = {'status': 'running', 'message': 'Inicializando Swarm...'}
+    set_install_status('swarm', 'running', 'Inicializando Swarm...')
     try:
-        from app.installer import init_swarm
         result = init_swarm(host, username, password, advertise_addr)
-        install_status['swarm'] = {'status': 'success', 'message': result.get('message', 'Swarm inicializado com sucesso!')}
+        set_install_status('swarm', 'success', result.get('message', 'Swarm inicializado com sucesso!'))
     except Exception as e:
-        logger.error(f"Erro na task de Swarm: {e}")
-        install_status['swarm'] = {'status': 'error', 'message': str(e)}
+        logger.exception(f"Erro na task de Swarm: {e}")
+        set_install_status('swarm', 'error', str(e))
+    _finish_install('swarm', host)
 
 def run_create_network_task(host, username, password, network_name):
-    install_status['network'] = {'status': 'running', 'message': 'Criando rede...'}
+    set_install_status('network', 'running', 'Criando rede...')
     try:
-        from app.installer import create_network
         result = create_network(host, username, password, network_name)
-        install_status['network'] = {'status': 'success', 'message': result.get('message', 'Rede criada com sucesso!')}
+        set_install_status('network', 'success', result.get('message', 'Rede criada com sucesso!'))
     except Exception as e:
-        logger.error(f"Erro na task de Rede: {e}")
-        install_status['network'] = {'status': 'error', 'message': str(e)}
+        logger.exception(f"Erro na task de Rede: {e}")
+        set_install_status('network', 'error', str(e))
+    _finish_install('network', host)
 
 def run_install_ctop_task(host, username, password):
-    install_status['ctop'] = {'status': 'running', 'message': 'Instalando Ctop...'}
+    set_install_status('ctop', 'running', 'Instalando Ctop...')
     try:
-        from app.installer import install_ctop
         result = install_ctop(host, username, password)
-        install_status['ctop'] = {'status': 'success', 'message': result.get('message', 'Ctop instalado com sucesso!')}
+        set_install_status('ctop', 'success', result.get('message', 'Ctop instalado com sucesso!'))
     except Exception as e:
-        logger.error(f"Erro na task de Ctop: {e}")
-        install_status['ctop'] = {'status': 'error', 'message': str(e)}
-
+        logger.exception(f"Erro na task de Ctop: {e}")
+        set_install_status('ctop', 'error', str(e))
+    _finish_install('ctop', host)
 
 @app.post("/upgrade-docker")
-def trigger_docker_upgrade(credentials: ServerCredentials, background_tasks: BackgroundTasks):
+def trigger_docker_upgrade(credentials: ServerCredentials):
     """
     Inicia o processo de atualização do Docker Engine em um servidor remoto.
     """
     try:
-        background_tasks.add_task(run_upgrade_docker_task, credentials.host, credentials.username, credentials.password)
+        if not _try_begin_install('docker-upgrade', credentials.host):
+            return {"message": f"Instalação de 'docker-upgrade' já está em andamento em {credentials.host}"}
+
+        install_executor.submit(run_upgrade_docker_task, credentials.host, credentials.username, credentials.password)
         return {"message": f"Atualização do Docker iniciada em {credentials.host}"}
     except Exception as e:
-        logger.error(f"Falha ao iniciar a atualização: {e}")
+        logger.exception(f"Falha ao iniciar a atualização: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/init-swarm")
-def trigger_swarm_init(credentials: ServerCredentials, background_tasks: BackgroundTasks):
+async def trigger_swarm_init(credentials: ServerCredentials):
     """
     Inicializa o Docker Swarm em um servidor remoto.
     """
     try:
-        # Verifica se o Swarm já está ativo
-        if check_swarm_active(credentials.host, credentials.username, credentials.password):
+        # Verifica se o Swarm já está ativo (sem bloquear a thread de request)
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(
+                install_executor, check_swarm_active,
+                credentials.host, credentials.username, credentials.password):
              return {"message": f"Swarm já está ativo e inicializado em {credentials.host}"}
 
         # Usa o próprio IP do host como advertise_addr
-        background_tasks.add_task(run_init_swarm_task, credentials.host, credentials.username, credentials.password, credentials.host)
+        if not _try_begin_install('swarm', credentials.host):
+            return {"message": f"Instalação de 'swarm' já está em andamento em {credentials.host}"}
+
+        install_executor.submit(run_init_swarm_task, credentials.host, credentials.username, credentials.password, credentials.host)
         return {"message": f"Inicialização do Swarm iniciada para {credentials.host}"}
     except Exception as e:
-        logger.error(f"Falha ao inicializar o swarm: {e}")
+        logger.exception(f"Falha ao inicializar o swarm: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/create-network")
-def trigger_create_network(request: NetworkCreateRequest, background_tasks: BackgroundTasks):
+async def trigger_create_network(request: NetworkCreateRequest):
     """
     Cria uma rede overlay Docker em um servidor remoto.
     """
     try:
-        # Verifica se a rede já existe
-        if check_network_exists(request.host, request.username, request.password, request.network_name) and not request.overwrite:
+        # Verifica se a rede já existe (sem bloquear a thread de request)
+        loop = asyncio.get_running_loop()
+        network_exists = await loop.run_in_executor(
+            install_executor, check_network_exists,
+            request.host, request.username, request.password, request.network_name)
+        if network_exists and not request.overwrite:
              return {"message": f"A rede '{request.network_name}' já existe em {request.host}. Use 'overwrite': true para forçar."}
 
-        background_tasks.add_task(run_create_network_task, request.host, request.username, request.password, request.network_name)
+        if not _try_begin_install('network', request.host):
+            return {"message": f"Instalação de 'network' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_create_network_task, request.host, request.username, request.password, request.network_name)
         return {"message": f"Criação da rede iniciada para {request.network_name} em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao criar a rede: {e}")
+        logger.exception(f"Falha ao criar a rede: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/install-ctop")
-def trigger_ctop_install(credentials: ServerCredentials, background_tasks: BackgroundTasks):
+def trigger_ctop_install(credentials: ServerCredentials):
     """
     Instala o Ctop em um servidor remoto.
     """
     try:
-        background_tasks.add_task(run_install_ctop_task, credentials.host, credentials.username, credentials.password)
+        if not _try_begin_install('ctop', credentials.host):
+            return {"message": f"Instalação de 'ctop' já está em andamento em {credentials.host}"}
+
+        install_executor.submit(run_install_ctop_task, credentials.host, credentials.username, credentials.password)
         return {"message": f"Instalação do Ctop iniciada em {credentials.host}"}
     except Exception as e:
-        logger.error(f"Falha ao iniciar instalação do Ctop: {e}")
+        logger.exception(f"Falha ao iniciar instalação do Ctop: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/atualiza_versao_docker")
-def trigger_update_docker_version(credentials: ServerCredentials, background_tasks: BackgroundTasks):
+async def trigger_update_docker_version(credentials: ServerCredentials):
     """
     Aplica a correção de versão da API do Docker (DOCKER_MIN_API_VERSION=1.24) para compatibilidade.
     """
     try:
-        # Verifica se o Docker está instalado
-        existing_version = check_docker_installed(credentials.host, credentials.username, credentials.password)
+        # Verifica se o Docker está instalado (sem bloquear a thread de request)
+        loop = asyncio.get_running_loop()
+        existing_version = await loop.run_in_executor(
+            install_executor, check_docker_installed,
+            credentials.host, credentials.username, credentials.password)
         if not existing_version:
              return {"message": f"Docker não está instalado em {credentials.host}. Instale o Docker primeiro."}
 
-        from app.installer import update_docker_version_config
-        background_tasks.add_task(update_docker_version_config, credentials.host, credentials.username, credentials.password)
+        install_executor.submit(update_docker_version_config, credentials.host, credentials.username, credentials.password)
         return {"message": f"Atualização da configuração do Docker iniciada em {credentials.host}"}
     except Exception as e:
-        logger.error(f"Falha ao atualizar configuração do Docker: {e}")
+        logger.exception(f"Falha ao atualizar configuração do Docker: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 def run_generic_install_task(service_key, install_func, *args, **kwargs):
-    install_status[service_key] = {'status': 'running', 'message': f'Instalando {service_key}...'}
+    set_install_status(service_key, 'running', f'Instalando {service_key}...')
     try:
         result = install_func(*args, **kwargs)
         msg = f'{service_key.capitalize()} instalado com sucesso!'
         if isinstance(result, dict) and 'message' in result:
             msg = result['message']
-        install_status[service_key] = {'status': 'success', 'message': msg}
+        set_install_status(service_key, 'success', msg)
+        # O estado do host mudou: derruba o probe cacheado (TTL 10s) para
+        # que os check_stack_exists seguintes enxerguem a stack nova
+        if len(args) >= 2:
+            invalidate_probe_cache(args[0], args[1])
     except Exception as e:
-        logger.error(f"Erro na task de {service_key}: {e}")
-        install_status[service_key] = {'status': 'error', 'message': str(e)}
+        logger.exception(f"Erro na task de {service_key}: {e}")
+        set_install_status(service_key, 'error', str(e))
+    finally:
+        # args[0] é sempre o host nos install_*
+        _finish_install(service_key, args[0] if args else "")
 
 class RedisInstallRequest(ServerCredentials):
     portainer_api_key: Optional[str] = None
 
 @app.post("/install-redis")
-def trigger_install_redis(request: RedisInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_redis(request: RedisInstallRequest):
     """
     Faz o deploy da stack do Redis.
     """
@@ -378,17 +612,16 @@ def trigger_install_redis(request: RedisInstallRequest, background_tasks: Backgr
         if check_stack_exists(request.host, request.username, request.password, "redis"):
              return {"message": f"A stack 'redis' já está rodando em {request.host}"}
 
-        if check_stack_exists(request.host, request.username, request.password, "redis"):
-             return {"message": f"A stack 'redis' já está rodando em {request.host}"}
-
         # Revertendo para instalação padrão via SSH (docker stack deploy)
         # O usuário preferiu o método antigo devido a instabilidades com a API do Portainer
-        from app.installer import install_redis
-        background_tasks.add_task(run_generic_install_task, 'redis', install_redis, request.host, request.username, request.password)
+        if not _try_begin_install('redis', request.host):
+            return {"message": f"Instalação de 'redis' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'redis', install_redis, request.host, request.username, request.password)
         return {"message": f"Instalação do Redis via SSH iniciada em {request.host}"}
             
     except Exception as e:
-        logger.error(f"Falha ao instalar Redis: {e}")
+        logger.exception(f"Falha ao instalar Redis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class PortainerInstallRequest(ServerCredentials):
@@ -396,12 +629,11 @@ class PortainerInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-portainer")
-def trigger_install_portainer(request: PortainerInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_portainer(request: PortainerInstallRequest):
     """
     Faz o deploy da stack do Portainer em um servidor remoto.
     """
     try:
-        from app.installer import get_active_stacks, install_portainer
         
         # Verifica se a stack já existe
         active_stacks = get_active_stacks(request.host, request.username, request.password)
@@ -412,10 +644,13 @@ def trigger_install_portainer(request: PortainerInstallRequest, background_tasks
                  "detected_stacks": active_stacks
              }
 
-        background_tasks.add_task(run_generic_install_task, 'portainer', install_portainer, request.host, request.username, request.password, request.portainer_host)
+        if not _try_begin_install('portainer', request.host):
+            return {"message": f"Instalação de 'portainer' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'portainer', install_portainer, request.host, request.username, request.password, request.portainer_host)
         return {"message": f"Instalação do Portainer iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar o Portainer: {e}")
+        logger.exception(f"Falha ao instalar o Portainer: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class TraefikInstallRequest(ServerCredentials):
@@ -423,7 +658,7 @@ class TraefikInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-traefik")
-def trigger_install_traefik(request: TraefikInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_traefik(request: TraefikInstallRequest):
     """
     Faz o deploy da stack do Traefik em um servidor remoto.
     """
@@ -432,10 +667,13 @@ def trigger_install_traefik(request: TraefikInstallRequest, background_tasks: Ba
         if check_stack_exists(request.host, request.username, request.password, "traefik") and not request.overwrite:
              return {"message": f"A stack 'traefik' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
 
-        background_tasks.add_task(run_generic_install_task, 'traefik', install_traefik, request.host, request.username, request.password, request.email)
+        if not _try_begin_install('traefik', request.host):
+            return {"message": f"Instalação de 'traefik' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'traefik', install_traefik, request.host, request.username, request.password, request.email)
         return {"message": f"Instalação do Traefik iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar o Traefik: {e}")
+        logger.exception(f"Falha ao instalar o Traefik: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class PostgresInstallRequest(ServerCredentials):
@@ -443,7 +681,7 @@ class PostgresInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-postgres")
-def trigger_install_postgres(request: PostgresInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_postgres(request: PostgresInstallRequest):
     """
     Faz o deploy da stack do Postgres em um servidor remoto.
     """
@@ -452,11 +690,13 @@ def trigger_install_postgres(request: PostgresInstallRequest, background_tasks:
         if check_stack_exists(request.host, request.username, request.password, "postgres") and not request.overwrite:
              return {"message": f"A stack 'postgres' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
 
-        from app.installer import install_postgres
-        background_tasks.add_task(run_generic_install_task, 'postgres', install_postgres, request.host, request.username, request.password, request.postgres_password)
+        if not _try_begin_install('postgres', request.host):
+            return {"message": f"Instalação de 'postgres' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'postgres', install_postgres, request.host, request.username, request.password, request.postgres_password)
         return {"message": f"Instalação do Postgres iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar Postgres: {e}")
+        logger.exception(f"Falha ao instalar Postgres: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class RabbitMQInstallRequest(ServerCredentials):
@@ -466,7 +706,7 @@ class RabbitMQInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-rabbitmq")
-def trigger_install_rabbitmq(request: RabbitMQInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_rabbitmq(request: RabbitMQInstallRequest):
     """
     Faz o deploy da stack do RabbitMQ em um servidor remoto.
     """
@@ -475,11 +715,13 @@ def trigger_install_rabbitmq(request: RabbitMQInstallRequest, background_tasks:
         if check_stack_exists(request.host, request.username, request.password, "rabbitmq") and not request.overwrite:
              return {"message": f"A stack 'rabbitmq' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
 
-        from app.installer import install_rabbitmq
-        background_tasks.add_task(run_generic_install_task, 'rabbitmq', install_rabbitmq, request.host, request.username, request.password, request.rabbit_user, request.rabbit_password, request.rabbit_base_url)
+        if not _try_begin_install('rabbitmq', request.host):
+            return {"message": f"Instalação de 'rabbitmq' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'rabbitmq', install_rabbitmq, request.host, request.username, request.password, request.rabbit_user, request.rabbit_password, request.rabbit_base_url)
         return {"message": f"Instalação do RabbitMQ iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar RabbitMQ: {e}")
+        logger.exception(f"Falha ao instalar RabbitMQ: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class MinioInstallRequest(ServerCredentials):
@@ -490,7 +732,7 @@ class MinioInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-minio")
-def trigger_install_minio(request: MinioInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_minio(request: MinioInstallRequest):
     """
     Faz o deploy da stack do Minio em um servidor remoto.
     """
@@ -499,11 +741,13 @@ def trigger_install_minio(request: MinioInstallRequest, background_tasks: Backgr
         if check_stack_exists(request.host, request.username, request.password, "minio") and not request.overwrite:
              return {"message": f"A stack 'minio' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
 
-        from app.installer import install_minio
-        background_tasks.add_task(run_generic_install_task, 'minio', install_minio, request.host, request.username, request.password, request.minio_user, request.minio_password, request.minio_base_url_private, request.minio_base_url_public)
+        if not _try_begin_install('minio', request.host):
+            return {"message": f"Instalação de 'minio' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'minio', install_minio, request.host, request.username, request.password, request.minio_user, request.minio_password, request.minio_base_url_private, request.minio_base_url_public)
         return {"message": f"Instalação do Minio iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar Minio: {e}")
+        logger.exception(f"Falha ao instalar Minio: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class BaserowInstallRequest(ServerCredentials):
@@ -512,7 +756,7 @@ class BaserowInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-baserow")
-def trigger_install_baserow(request: BaserowInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_baserow(request: BaserowInstallRequest):
     """
     Faz o deploy da stack do Baserow em um servidor remoto.
     """
@@ -521,11 +765,13 @@ def trigger_install_baserow(request: BaserowInstallRequest, background_tasks: Ba
         if check_stack_exists(request.host, request.username, request.password, "baserow") and not request.overwrite:
              return {"message": f"A stack 'baserow' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
 
-        from app.installer import install_baserow
-        background_tasks.add_task(run_generic_install_task, 'baserow', install_baserow, request.host, request.username, request.password, request.baserow_base_url, request.postgres_password)
+        if not _try_begin_install('baserow', request.host):
+            return {"message": f"Instalação de 'baserow' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'baserow', install_baserow, request.host, request.username, request.password, request.baserow_base_url, request.postgres_password)
         return {"message": f"Instalação do Baserow iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar Baserow: {e}")
+        logger.exception(f"Falha ao instalar Baserow: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class ChatwootInstallRequest(ServerCredentials):
@@ -537,7 +783,7 @@ class ChatwootInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-chatwoot")
-def trigger_install_chatwoot(request: ChatwootInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_chatwoot(request: ChatwootInstallRequest):
     """
     Faz o deploy das stacks do Chatwoot (Admin e Sidekiq) em um servidor remoto.
     """
@@ -546,26 +792,30 @@ def trigger_install_chatwoot(request: ChatwootInstallRequest, background_tasks:
         if check_stack_exists(request.host, request.username, request.password, "chatwoot_admin") and not request.overwrite:
              return {"message": f"A stack 'chatwoot_admin' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
 
-        from app.installer import install_chatwoot
-        background_tasks.add_task(run_generic_install_task, 'chatwoot', install_chatwoot, request.host, request.username, request.password, request.postgres_password, request.minio_user, request.minio_password, request.minio_base_url_public, request.chatwoot_base_url)
+        if not _try_begin_install('chatwoot', request.host):
+            return {"message": f"Instalação de 'chatwoot' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'chatwoot', install_chatwoot, request.host, request.username, request.password, request.postgres_password, request.minio_user, request.minio_password, request.minio_base_url_public, request.chatwoot_base_url)
         return {"message": f"Instalação do Chatwoot iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar Chatwoot: {e}")
+        logger.exception(f"Falha ao instalar Chatwoot: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class EnvUpdate(BaseModel):
+    # Validação estrita no core Rust do pydantic: sem bookkeeping de
+    # campos desconhecidos, instâncias imutáveis e menos pressão de GC
+    model_config = ConfigDict(extra='forbid', frozen=True, str_strip_whitespace=True)
     host: str
     username: str
     password: str
     stack_name: str
-    env_vars: dict
+    env_vars: Dict[str, str]
 
 @app.post("/get-stack-env/{stack_name}")
-def get_stack_env(stack_name: str, credentials: ServerCredentials):
+def get_stack_env(stack_name: str, credentials: ServerCredentials):  # def-on-purpose: blocking SSH
     """
     Obtém as variáveis de ambiente de uma stack.
     """
-    from app.installer import get_stack_env_vars
     try:
         env_vars = get_stack_env_vars(credentials.host, credentials.username, credentials.password, stack_name)
         return {"env_vars": env_vars}
@@ -573,11 +823,10 @@ def get_stack_env(stack_name: str, credentials: ServerCredentials):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/update-stack-env")
-def update_stack_env(data: EnvUpdate):
+def update_stack_env(data: EnvUpdate):  # def-on-purpose: blocking SSH
     """
     Atualiza as variáveis de ambiente de uma stack.
     """
-    from app.installer import update_stack_env_vars
     try:
         result = update_stack_env_vars(data.host, data.username, data.password, data.stack_name, data.env_vars)
         return result
@@ -588,16 +837,15 @@ class RestartStackRequest(ServerCredentials):
     stack_name: str
 
 @app.post("/restart-stack")
-def trigger_restart_stack(request: RestartStackRequest, background_tasks: BackgroundTasks):
+def trigger_restart_stack(request: RestartStackRequest):
     """
     Reinicia todos os serviços de uma stack específica.
     """
     try:
-        from app.installer import restart_stack_services
-        background_tasks.add_task(restart_stack_services, request.host, request.username, request.password, request.stack_name)
+        install_executor.submit(restart_stack_services, request.host, request.username, request.password, request.stack_name)
         return {"message": f"Reinício da stack '{request.stack_name}' iniciado em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao reiniciar stack: {e}")
+        logger.exception(f"Falha ao reiniciar stack: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class N8NInstallRequest(ServerCredentials):
@@ -607,7 +855,7 @@ class N8NInstallRequest(ServerCredentials):
     overwrite: bool = False
 
 @app.post("/install-n8n")
-def trigger_install_n8n(request: N8NInstallRequest, background_tasks: BackgroundTasks):
+def trigger_install_n8n(request: N8NInstallRequest):
     """
     Faz o deploy das stacks do N8N (Editor, Webhook, Worker) em um servidor remoto.
     """
@@ -616,10 +864,77 @@ def trigger_install_n8n(request: N8NInstallRequest, background_tasks: Background
         if check_stack_exists(request.host, request.username, request.password, "n8n_editor") and not request.overwrite:
              return {"message": f"A stack 'n8n_editor' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
 
-        from app.installer import install_n8n
-        background_tasks.add_task(run_generic_install_task, 'n8n', install_n8n, request.host, request.username, request.password, request.postgres_password, request.n8n_host, request.n8n_webhook_url)
+        if not _try_begin_install('n8n', request.host):
+            return {"message": f"Instalação de 'n8n' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, 'n8n', install_n8n, request.host, request.username, request.password, request.postgres_password, request.n8n_host, request.n8n_webhook_url)
         return {"message": f"Instalação do N8N iniciada em {request.host}"}
     except Exception as e:
-        logger.error(f"Falha ao instalar N8N: {e}")
+        logger.exception(f"Falha ao instalar N8N: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+# Registro orientado a tabela dos serviços instaláveis: um único endpoint
+# genérico concentra o check de stack, o dedupe in-flight e o despacho ao
+# executor — as otimizações valem para todos os serviços em um ponto só.
+# Cada entrada: (modelo de request, função de install, stack a checar,
+# args extras extraídos do request)
+SERVICE_REGISTRY = {
+    "redis": (RedisInstallRequest, install_redis, "redis", lambda r: ()),
+    "traefik": (TraefikInstallRequest, install_traefik, "traefik", lambda r: (r.email,)),
+    "portainer": (PortainerInstallRequest, install_portainer, "portainer", lambda r: (r.portainer_host,)),
+    "postgres": (PostgresInstallRequest, install_postgres, "postgres", lambda r: (r.postgres_password,)),
+    "rabbitmq": (RabbitMQInstallRequest, install_rabbitmq, "rabbitmq",
+                 lambda r: (r.rabbit_user, r.rabbit_password, r.rabbit_base_url)),
+    "minio": (MinioInstallRequest, install_minio, "minio",
+              lambda r: (r.minio_user, r.minio_password, r.minio_base_url_private, r.minio_base_url_public)),
+    "baserow": (BaserowInstallRequest, install_baserow, "baserow",
+                lambda r: (r.baserow_base_url, r.postgres_password)),
+    "chatwoot": (ChatwootInstallRequest, install_chatwoot, "chatwoot_admin",
+                 lambda r: (r.postgres_password, r.minio_user, r.minio_password,
+                            r.minio_base_url_public, r.chatwoot_base_url)),
+    "n8n": (N8NInstallRequest, install_n8n, "n8n_editor",
+            lambda r: (r.postgres_password, r.n8n_host, r.n8n_webhook_url)),
+}
+
+
+@app.post("/install/{service}")
+def trigger_install_service(service: str, payload: dict):
+    """
+    Endpoint único para instalar qualquer stack registrada.
+    Os endpoints /install-<serviço> legados continuam disponíveis.
+    """
+    spec = SERVICE_REGISTRY.get(service)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Serviço desconhecido: {service}")
+
+    model, install_func, stack_name, extra_args = spec
+    try:
+        request = model(**payload)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        if check_stack_exists(request.host, request.username, request.password, stack_name) \
+                and not getattr(request, "overwrite", False):
+            return {"message": f"A stack '{stack_name}' já está rodando em {request.host}. Use 'overwrite': true para forçar."}
+
+        if not _try_begin_install(service, request.host):
+            return {"message": f"Instalação de '{service}' já está em andamento em {request.host}"}
+
+        install_executor.submit(run_generic_install_task, service, install_func,
+                                request.host, request.username, request.password,
+                                *extra_args(request))
+        return {"message": f"Instalação de {service} iniciada em {request.host}"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Falha ao instalar {service}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Monta o frontend na raiz POR ÚLTIMO (depois de todas as rotas da API):
+# StaticFiles(html=True) serve o index.html com ETag/304 e sendfile do
+# uvicorn, sem passar pelo dispatch de rotas do FastAPI a cada hit em '/'
+if STATIC_DIR.exists():
+    app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="root")
@@ -1,10 +1,41 @@
+import json
 import requests
 import logging
 
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson é ~2-5x mais rápido no decode; sem ele, cai no parser padrão
+try:
+    import orjson
+
+    def _json(response):
+        return orjson.loads(response.content)
+except ImportError:
+    def _json(response):
+        return response.json()
+
 # Configura o logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sessão compartilhada: as chamadas à API do Portainer (auth, endpoints,
+# stacks, deploy) reaproveitam a mesma conexão TCP+TLS em vez de refazer
+# o handshake a cada requisição.
+_session = requests.Session()
+# gzip/deflate são descomprimidos automaticamente pelo requests; zstd é
+# negociado quando urllib3>=2 + zstandard estão presentes
+_session.headers["Accept-Encoding"] = "gzip, deflate, zstd"
+# Falhas transitórias (502/503/504) se resolvem sozinhas com backoff;
+# timeouts explícitos evitam que um Portainer travado prenda uma worker
+_retry = Retry(total=3, connect=3, read=2, backoff_factor=0.3,
+               status_forcelist=(502, 503, 504),
+               allowed_methods=frozenset(["GET", "POST", "PUT"]))
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=_retry)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
 def get_portainer_token(base_url, username, password, verify=True):
     """
     Autentica no Portainer e retorna o token JWT.
@@ -18,10 +49,10 @@ def get_portainer_token(base_url, username, password, verify=True):
     
     print(f"DEBUG: Tentando autenticar em {url} com usuário {username}")
     try:
-        response = requests.post(url, json=payload, verify=verify)
+        response = _session.post(url, json=payload, verify=verify, timeout=(3.05, 30))
         response.raise_for_status()
         print("DEBUG: Autenticação bem sucedida.")
-        return response.json().get("jwt")
+        return _json(response).get("jwt")
     except requests.exceptions.RequestException as e:
         print(f"ERRO: Falha na autenticação do Portainer: {e}")
         if hasattr(e, 'response') and e.response is not None:
@@ -46,9 +77,9 @@ def get_first_swarm_endpoint_id(base_url, token=None, api_key=None, verify=True)
     
     print(f"DEBUG: Buscando endpoints em {url}")
     try:
-        response = requests.get(url, headers=headers, verify=verify)
+        response = _session.get(url, headers=headers, verify=verify, timeout=(3.05, 30))
         response.raise_for_status()
-        endpoints = response.json()
+        endpoints = _json(response)
         
         for endpoint in endpoints:
             # Type 1 = Docker (pode ser Swarm ou Standalone), Type 2 = Agent (Swarm)
@@ -62,6 +93,18 @@ def get_first_swarm_endpoint_id(base_url, token=None, api_key=None, verify=True)
         print(f"ERRO: Falha ao listar endpoints do Portainer: {e}")
         raise Exception(f"Falha ao listar endpoints do Portainer: {e}")
 
+# O Swarm.Cluster.ID de um endpoint nunca muda: cacheado, os redeploys
+# seguintes pulam o GET /docker/info inteiro. Os headers entram como tupla
+# ordenada para a chave ser hasheável.
+@lru_cache(maxsize=32)
+def _get_swarm_id(base_url, endpoint_id, auth_items, verify):
+    headers = dict(auth_items)
+    info_url = f"{base_url}/api/endpoints/{endpoint_id}/docker/info"
+    info_response = _session.get(info_url, headers=headers, verify=verify, timeout=(3.05, 30))
+    info_response.raise_for_status()
+    return _json(info_response).get("Swarm", {}).get("Cluster", {}).get("ID")
+
+
 def deploy_stack_portainer(base_url, stack_name, stack_content, endpoint_id, token=None, api_key=None, verify=True):
     """
     Faz o deploy de uma stack no Portainer via API.
@@ -81,14 +124,17 @@ def deploy_stack_portainer(base_url, stack_name, stack_content, endpoint_id, tok
         
     print(f"DEBUG: Verificando se stack {stack_name} já existe...")
     try:
-        response = requests.get(check_url, headers=headers, verify=verify)
+        # Filtro aplicado no servidor: só a stack procurada volta na resposta,
+        # em vez de transferir e parsear a lista inteira
+        response = _session.get(check_url, headers=headers,
+                                params={"filters": json.dumps({"Name": stack_name})},
+                                verify=verify, timeout=(3.05, 30))
         response.raise_for_status()
-        stacks = response.json()
-        
-        for stack in stacks:
-            if stack.get("Name") == stack_name:
-                print(f"INFO: Stack {stack_name} já existe no Portainer.")
-                return {"status": "success", "message": f"Stack {stack_name} já existe no Portainer"}
+        stacks = _json(response) or []
+
+        if any(stack.get("Name") == stack_name for stack in stacks):
+            print(f"INFO: Stack {stack_name} já existe no Portainer.")
+            return {"status": "success", "message": f"Stack {stack_name} já existe no Portainer"}
     except Exception as e:
         print(f"AVISO: Não foi possível verificar se a stack existe: {e}")
 
@@ -110,12 +156,8 @@ def deploy_stack_portainer(base_url, stack_name, stack_content, endpoint_id, tok
     }
     
     # Precisamos pegar o SwarmID real do endpoint para criar uma Swarm Stack corretamente
-    # GET /api/endpoints/{id}/docker/info
     try:
-        info_url = f"{base_url}/api/endpoints/{endpoint_id}/docker/info"
-        info_response = requests.get(info_url, headers=headers, verify=verify)
-        info_response.raise_for_status()
-        swarm_id = info_response.json().get("Swarm", {}).get("Cluster", {}).get("ID")
+        swarm_id = _get_swarm_id(base_url, endpoint_id, tuple(sorted(headers.items())), verify)
         if swarm_id:
             payload["SwarmID"] = swarm_id
             print(f"DEBUG: Swarm ID encontrado: {swarm_id}")
@@ -128,7 +170,7 @@ def deploy_stack_portainer(base_url, stack_name, stack_content, endpoint_id, tok
     
     try:
         # allow_redirects=False para detectar se o Portainer está redirecionando (ex: http -> https)
-        response = requests.post(url, headers=headers, params=query_params, json=payload, verify=verify, allow_redirects=False)
+        response = _session.post(url, headers=headers, params=query_params, json=payload, verify=verify, allow_redirects=False, timeout=(3.05, 30))
         
         if response.status_code in [301, 302, 307, 308]:
              print(f"AVISO: Redirect detectado para {response.headers.get('Location')}")
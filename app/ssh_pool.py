@@ -0,0 +1,166 @@
+import atexit
+import hashlib
+import secrets
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Tempo máximo (segundos) que uma conexão pode ficar ociosa no pool
+IDLE_TTL = 300
+# Máximo de conexões ociosas guardadas por (host, username)
+MAX_IDLE_PER_KEY = 8
+# Máximo de conexões EM USO simultâneas por chave: fica abaixo do
+# MaxSessions/MaxStartups=10 padrão do sshd, evitando tarpit sob rajadas
+# de endpoints concorrentes contra o mesmo host
+MAX_ACTIVE_PER_KEY = 8
+
+_lock = threading.Lock()
+# (host, username, pw_digest) -> deque[(SSHClient, timestamp_da_devolucao)]
+_pool = {}
+_reaper_started = False
+# key -> semáforo limitando conexões ativas simultâneas
+_active_limiters = {}
+
+# A senha nunca fica retida como chave do dict: o que entra na chave é um
+# digest blake2s de 16 bytes com salt por processo (rápido para entradas
+# curtas e sem valor fora deste processo).
+_SALT = secrets.token_bytes(16)
+
+
+def _pw_key(password):
+    return hashlib.blake2s(password.encode("utf-8"), digest_size=16, key=_SALT).digest()
+
+
+def _is_alive(client):
+    """
+    Verifica se a conexão SSH ainda está viva (probe barato via send_ignore).
+    """
+    try:
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        transport.send_ignore()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(client):
+    try:
+        client.close()
+    except Exception:
+        pass
+
+
+def _reap_idle_loop():
+    """
+    Thread de limpeza: fecha conexões ociosas há mais de IDLE_TTL segundos.
+    """
+    while True:
+        time.sleep(60)
+        now = time.time()
+        with _lock:
+            for key in list(_pool.keys()):
+                kept = deque()
+                while _pool[key]:
+                    client, returned_at = _pool[key].popleft()
+                    if now - returned_at > IDLE_TTL:
+                        logger.info(f"[POOL] Fechando conexão ociosa de {key[1]}@{key[0]}")
+                        _close_quietly(client)
+                    else:
+                        kept.append((client, returned_at))
+                if kept:
+                    _pool[key] = kept
+                else:
+                    del _pool[key]
+
+
+def _ensure_reaper():
+    global _reaper_started
+    if not _reaper_started:
+        thread = threading.Thread(target=_reap_idle_loop, daemon=True, name="ssh-pool-reaper")
+        thread.start()
+        _reaper_started = True
+
+
+@contextmanager
+def acquire(host, username, password):
+    """
+    Obtém uma conexão SSH do pool (ou cria uma nova) e a devolve ao sair do bloco.
+
+    Uso:
+        with ssh_pool.acquire(host, username, password) as client:
+            run_ssh_command(client, "...")
+    """
+    # Import tardio para evitar ciclo: app.installer também usa este pool
+    from app.installer import get_ssh_client
+
+    client = None
+    key = (host, username, _pw_key(password))
+
+    with _lock:
+        limiter = _active_limiters.get(key)
+        if limiter is None:
+            limiter = _active_limiters[key] = threading.BoundedSemaphore(MAX_ACTIVE_PER_KEY)
+    limiter.acquire()
+
+    with _lock:
+        _ensure_reaper()
+        idle = _pool.get(key)
+        while idle:
+            candidate, _ = idle.popleft()
+            if _is_alive(candidate):
+                client = candidate
+                break
+            _close_quietly(candidate)
+
+    try:
+        if client is None:
+            client = get_ssh_client(host, username, password)
+        else:
+            logger.info(f"[POOL] Reutilizando conexão SSH com {username}@{host}")
+
+        try:
+            yield client
+        except Exception:
+            # Em caso de erro não devolvemos a conexão: pode estar em estado ruim
+            _close_quietly(client)
+            raise
+        else:
+            _release(key, client)
+    finally:
+        limiter.release()
+
+
+def _release(key, client):
+    """
+    Devolve uma conexão ao pool se ainda estiver ativa (senão, fecha).
+    """
+    if not _is_alive(client):
+        _close_quietly(client)
+        return
+    with _lock:
+        idle = _pool.setdefault(key, deque())
+        if len(idle) >= MAX_IDLE_PER_KEY:
+            _close_quietly(client)
+        else:
+            idle.append((client, time.time()))
+
+
+def drain():
+    """
+    Fecha todas as conexões ociosas do pool (chamado no shutdown do processo).
+    """
+    with _lock:
+        for key, idle in _pool.items():
+            while idle:
+                client, _ = idle.popleft()
+                _close_quietly(client)
+        _pool.clear()
+
+
+atexit.register(drain)
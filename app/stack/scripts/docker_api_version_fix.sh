@@ -0,0 +1,10 @@
+# Aplica o override DOCKER_MIN_API_VERSION=1.24 (compatibilidade
+# Traefik/Portainer). O conteúdo já foi enviado por SFTP para
+# /tmp/docker_override.conf; aqui só instalamos e reiniciamos — tudo em
+# um único exec SSH via 'bash -s'.
+sudo mkdir -p /etc/systemd/system/docker.service.d
+sudo install -m 644 /tmp/docker_override.conf /etc/systemd/system/docker.service.d/override.conf
+sudo rm /tmp/docker_override.conf
+sudo systemctl daemon-reload
+sudo systemctl restart docker
+systemctl show --property=Environment docker
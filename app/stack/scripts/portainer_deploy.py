@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Helper remoto de deploy via Portainer (executado no próprio servidor).
+
+Lê um JSON no stdin ({api_key?, username, password, stack_name, stack_yml})
+e faz auth -> endpoints -> stacks -> swarm info -> create em UMA conexão
+HTTP/1.1 keep-alive com 127.0.0.1:9000 — sem curl, sem arquivos em /tmp.
+Imprime um JSON {"status": ..., "message": ...} no stdout.
+"""
+import http.client
+import json
+import sys
+
+
+def request(conn, method, path, headers=None, body=None):
+    request_headers = dict(headers or {})
+    data = None
+    if body is not None:
+        data = json.dumps(body)
+        request_headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=data, headers=request_headers)
+    response = conn.getresponse()
+    content = response.read().decode("utf-8").strip()
+    if response.status >= 400:
+        raise RuntimeError(f"Portainer API {response.status}: {content[:200]}")
+    return json.loads(content) if content else {}
+
+
+def main():
+    payload = json.load(sys.stdin)
+    stack_name = payload["stack_name"]
+
+    conn = http.client.HTTPConnection("127.0.0.1", 9000, timeout=30)
+
+    headers = {}
+    if payload.get("api_key"):
+        headers["X-API-Key"] = payload["api_key"]
+    else:
+        auth = request(conn, "POST", "/api/auth",
+                       body={"Username": payload["username"], "Password": payload["password"]})
+        if not auth.get("jwt"):
+            raise RuntimeError(f"Falha na autenticação: {auth}")
+        headers["Authorization"] = f"Bearer {auth['jwt']}"
+
+    endpoints = request(conn, "GET", "/api/endpoints", headers)
+    endpoint_id = next((ep.get("Id") for ep in endpoints if ep.get("Status") == 1), None)
+    if endpoint_id is None:
+        raise RuntimeError("Nenhum endpoint ativo encontrado no Portainer.")
+
+    stacks = request(conn, "GET", "/api/stacks", headers)
+    if any(stack.get("Name") == stack_name for stack in stacks):
+        print(json.dumps({"status": "success",
+                          "message": f"Stack {stack_name} já existe no Portainer."}))
+        return
+
+    info = request(conn, "GET", f"/api/endpoints/{endpoint_id}/docker/info", headers)
+    swarm_id = info.get("Swarm", {}).get("Cluster", {}).get("ID") or "placeholder"
+
+    created = request(conn, "POST",
+                      f"/api/stacks?type=1&method=string&endpointId={endpoint_id}", headers,
+                      body={"Name": stack_name,
+                            "StackFileContent": payload["stack_yml"],
+                            "SwarmID": swarm_id})
+    if not created.get("Id"):
+        raise RuntimeError(f"Erro no deploy: {created}")
+
+    print(json.dumps({"status": "success",
+                      "message": f"Stack {stack_name} criada com sucesso via Portainer."}))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:
+        print(json.dumps({"status": "error", "message": str(exc)}))
+        sys.exit(1)
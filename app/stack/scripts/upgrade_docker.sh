@@ -0,0 +1,3 @@
+# Atualização do Docker Engine — enviado inteiro via 'bash -s' em um único exec SSH.
+sudo apt-get update
+sudo DEBIAN_FRONTEND=noninteractive apt-get install --only-upgrade -y docker-ce docker-ce-cli containerd.io docker-buildx-plugin docker-compose-plugin
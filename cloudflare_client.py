@@ -0,0 +1,82 @@
+import time
+
+from http_client import client
+
+# orjson serializa pequenos dicts ~5x mais rápido e devolve bytes direto;
+# sem ele, cai no json da stdlib
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    import json
+
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+# Upsert de registro A na Cloudflare compartilhado pelos deployers (antes
+# copiado e colado em cada arquivo). O record_id de cada (zone, nome) fica
+# em cache por 5 min: no caso comum — redeploy do mesmo domínio — o GET
+# inicial é pulado e vamos direto ao PUT, metade das chamadas por deploy.
+_RECORD_TTL = 300
+_RECORD_CACHE_MAX = 1024
+_record_cache = {}  # (zone_id, nome) -> (record_id, expira_em)
+
+
+def _record_cache_put(key, record_id, now):
+    if len(_record_cache) >= _RECORD_CACHE_MAX:
+        # Poda as entradas expiradas; se nada expirou, descarta a mais antiga
+        expired = [k for k, (_, expires) in _record_cache.items() if expires <= now]
+        for k in expired:
+            del _record_cache[k]
+        if len(_record_cache) >= _RECORD_CACHE_MAX:
+            _record_cache.pop(min(_record_cache, key=lambda k: _record_cache[k][1]))
+    _record_cache[key] = (record_id, now + _RECORD_TTL)
+
+
+async def upsert_a_record(api_token, zone_id, name, ip, logs=None, proxied=False):
+    """
+    Cria ou atualiza um registro 'A' apontando name -> ip na zona.
+    'logs' (opcional) recebe as mensagens de progresso dos deployers.
+    """
+    def log(message):
+        if logs is not None:
+            logs.append(message)
+
+    api_url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
+    headers = {"Authorization": f"Bearer {api_token}", "Content-Type": "application/json"}
+    # Payload serializado UMA vez e reaproveitado pelos ramos PUT e POST
+    payload_bytes = _dumps({"type": "A", "name": name, "content": ip, "ttl": 1, "proxied": proxied})
+
+    now = time.monotonic()
+    cached = _record_cache.get((zone_id, name))
+    if cached and cached[1] > now:
+        record_id = cached[0]
+        log(f"Registro DNS em cache (ID {record_id}). Atualizando direto...")
+        response = await client.put(f"{api_url}/{record_id}", headers=headers, content=payload_bytes)
+        if response.status_code == 404:
+            # O registro sumiu por fora: invalida e cai no fluxo completo
+            _record_cache.pop((zone_id, name), None)
+        else:
+            response.raise_for_status()
+            log("Registro DNS na Cloudflare atualizado com sucesso.")
+            return
+
+    response = await client.get(api_url, headers=headers, params={"name": name})
+    response.raise_for_status()
+    records = response.json().get("result", [])
+
+    if records:
+        record_id = records[0]["id"]
+        log(f"Registro DNS encontrado com ID {record_id}. Atualizando...")
+        response = await client.put(f"{api_url}/{record_id}", headers=headers, content=payload_bytes)
+    else:
+        log("Nenhum registro DNS encontrado. Criando um novo...")
+        response = await client.post(api_url, headers=headers, content=payload_bytes)
+    response.raise_for_status()
+
+    record_id = (response.json().get("result") or {}).get("id")
+    if record_id:
+        _record_cache_put((zone_id, name), record_id, now)
+    log("Registro DNS na Cloudflare atualizado com sucesso.")
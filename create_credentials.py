@@ -1,6 +1,8 @@
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from typing import Optional, List, Dict, Any
@@ -70,22 +72,30 @@ class AllCredentialsRequest(BaseModel):
 
 # --- Instância do FastAPI ---
 app = FastAPI(
+    default_response_class=ORJSONResponse,
     title="n8n Credentials Creator API",
     description="Uma API para criar um conjunto de credenciais no n8n de forma automática.",
     version="1.1.0" # Versão atualizada
 )
 
 # --- Função Auxiliar para Criar Credencial ---
+# Sessão compartilhada com o n8n: os POSTs em sequência reaproveitam a mesma
+# conexão TCP+TLS e os headers fixos são serializados uma única vez.
+_N8N_API_ENDPOINT = f"{N8N_URL}/api/v1/credentials"
+_n8n = requests.Session()
+_n8n.headers.update({
+    "Accept": "application/json",
+    "X-N8N-API-KEY": N8N_API_KEY
+})
+_n8n_retry = requests.adapters.Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                                     allowed_methods=frozenset(["POST"]))
+_n8n.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=8, max_retries=_n8n_retry))
+
+
 def create_credential_in_n8n(name: str, cred_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Constrói o payload e envia a requisição para a API do n8n para criar uma credencial.
     """
-    n8n_api_endpoint = f"{N8N_URL}/api/v1/credentials"
-    headers = {
-        "Accept": "application/json",
-        "X-N8N-API-KEY": N8N_API_KEY
-    }
-    
     payload = {
         "name": name,
         "type": cred_type,
@@ -93,7 +103,7 @@ def create_credential_in_n8n(name: str, cred_type: str, data: Dict[str, Any]) ->
     }
     
     try:
-        response = requests.post(n8n_api_endpoint, headers=headers, json=payload)
+        response = _n8n.post(_N8N_API_ENDPOINT, json=payload, timeout=10)
         response.raise_for_status()
         created_data = response.json()
         return {"status": "success", "id": created_data.get('id'), "name": name}
@@ -102,6 +112,17 @@ def create_credential_in_n8n(name: str, cred_type: str, data: Dict[str, Any]) ->
     except requests.exceptions.RequestException as req_err:
         return {"status": "error", "name": name, "detail": str(req_err)}
 
+# Dispatch estático campo do request -> tipo de credencial na API do n8n
+_CRED_FIELDS = (
+    ("baserow", "n8n-nodes-base.baserowApi"),
+    ("telegram", "n8n-nodes-base.telegramApi"),
+    ("openai", "n8n-nodes-base.openAiApi"),
+    ("postgres", "n8n-nodes-base.postgres"),
+    ("rabbitmq", "n8n-nodes-base.rabbitmq"),
+    ("redis", "n8n-nodes-base.redis"),
+)
+
+
 # --- Endpoint Principal ---
 @app.post("/create-all-credentials", status_code=status.HTTP_201_CREATED)
 def create_all_credentials(request_data: AllCredentialsRequest):
@@ -109,31 +130,26 @@ def create_all_credentials(request_data: AllCredentialsRequest):
     Recebe os dados de várias credenciais e tenta criar cada uma delas no n8n.
     """
     results = []
-    
-    # Mapeamento dos tipos de credenciais para os nomes na API do n8n
-    CREDENTIAL_TYPE_MAP = {
-        "baserow": "n8n-nodes-base.baserowApi",
-        "telegram": "n8n-nodes-base.telegramApi",
-        "openai": "n8n-nodes-base.openAiApi",
-        "postgres": "n8n-nodes-base.postgres",
-        "rabbitmq": "n8n-nodes-base.rabbitmq",
-        "redis": "n8n-nodes-base.redis"
-    }
 
-    credentials_to_create = request_data.model_dump(exclude_none=True)
+    # Itera os submodelos já validados direto: cada um serializa apenas os
+    # próprios campos (exclude name), sem o model_dump recursivo do request
+    # inteiro nem o pop() mutando o dict
+    tasks = []
+    for field, cred_type in _CRED_FIELDS:
+        sub_model = getattr(request_data, field)
+        if sub_model is not None:
+            tasks.append((sub_model.name, cred_type, sub_model.model_dump(exclude={"name"})))
 
-    if not credentials_to_create:
+    if not tasks:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Pelo menos uma credencial deve ser fornecida no corpo da requisição."
         )
 
-    for key, cred_data in credentials_to_create.items():
-        cred_name = cred_data.pop("name")
-        cred_type = CREDENTIAL_TYPE_MAP.get(key)
-        
-        if cred_type:
-            result = create_credential_in_n8n(cred_name, cred_type, cred_data)
-            results.append(result)
+    # Os POSTs são independentes e vão para o mesmo host: disparados em
+    # paralelo sobre a sessão keep-alive (o GIL é liberado no I/O de socket),
+    # o tempo total vira ~1 RTT em vez de N
+    with ThreadPoolExecutor(max_workers=min(8, len(tasks))) as executor:
+        results = list(executor.map(lambda task: create_credential_in_n8n(*task), tasks))
 
     return {"message": "Processo de criação de credenciais finalizado.", "results": results}
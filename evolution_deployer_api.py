@@ -176,7 +176,9 @@ def deploy_evolution_stack(details: EvolutionDeployDetails):
     except requests.exceptions.RequestException as e:
         error_message = f"Erro de comunicação com as APIs: {e}"
         if e.response is not None:
-            error_message += f" | Resposta: {e.response.text}"
+            # Trunca e decodifica uma única vez: páginas de erro gigantes
+            # não são materializadas inteiras no log
+            error_message += f" | Resposta: {e.response.content[:512].decode('utf-8', 'replace')}"
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_message)
     except Exception as e:
         error_detail = {"detail": f"Ocorreu um erro inesperado: {str(e)}", "logs": logs}
@@ -0,0 +1,25 @@
+import ssl
+
+import httpx
+
+# Cliente HTTP assíncrono compartilhado pelos deployers (Cloudflare +
+# Portainer). Com HTTP/2, as chamadas de um deploy (auth, endpoints,
+# swarm, stacks, create/update) são multiplexadas em UMA conexão — um
+# handshake TLS por host em vez de um por chamada — e o pool keep-alive
+# sobrevive entre requisições.
+# Um único SSLContext reutilizado por todas as conexões: os session
+# tickets TLS ficam válidos entre handshakes, então reconexões ao mesmo
+# host são abreviadas. O Portainer costuma ter certificado self-signed,
+# daí CERT_NONE (mesma semântica do verify=False anterior, mas sem
+# reconstruir o contexto a cada conexão).
+_ssl_context = ssl.create_default_context()
+_ssl_context.check_hostname = False
+_ssl_context.verify_mode = ssl.CERT_NONE
+_ssl_context.options |= ssl.OP_NO_COMPRESSION
+
+client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    timeout=httpx.Timeout(15.0, connect=5.0),
+    verify=_ssl_context,
+)
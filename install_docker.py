@@ -1,11 +1,15 @@
 import os
 import json
+import shlex
+import asyncio
 import paramiko
 from fastapi import FastAPI, HTTPException, status
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from typing import List, Dict
 
+from ssh_exec import execute_ssh_command, get_pooled_ssh, release_pooled_ssh
+
 # Carrega as variáveis do arquivo .env para o ambiente de execução.
 load_dotenv()
 
@@ -36,53 +40,22 @@ DOCKER_INSTALL_COMMANDS = [
     "systemctl enable containerd.service"
 ]
 
-# --- Função Auxiliar para Executar Comandos ---
-def execute_ssh_command(ssh_client: paramiko.SSHClient, command: str, logs: List[str], ignore_errors: bool = False) -> str:
-    """
-    Executa um comando SSH, registra a saída e os erros, e retorna a saída padrão.
-    Lança uma exceção se o comando falhar e ignore_errors for False.
-    """
-    logs.append(f"Executando: {command}")
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    
-    # Esta chamada bloqueia a execução até o comando terminar.
-    exit_status = stdout.channel.recv_exit_status()
-    
-    output = stdout.read().decode('utf-8').strip()
-    error = stderr.read().decode('utf-8').strip()
-    
-    if output:
-        logs.append(f"Saída: {output}")
-    if error:
-        logs.append(f"Erro: {error}")
-
-    if not ignore_errors and exit_status != 0:
-        raise Exception(f"Falha ao executar comando: '{command}'. Código de saída: {exit_status}")
-    
-    return output
-
 # --- Endpoint da API ---
-@app.post("/install-docker", status_code=status.HTTP_200_OK)
-def install_docker_on_server(server: ServerDetails):
+def _provision_server(server: ServerDetails, logs: List[str]):
     """
-    Conecta-se a um servidor, instala o Docker, inicializa o Swarm e cria a rede.
+    Trabalho SSH bloqueante do provisionamento (roda fora do event loop).
     """
-    ssh_client = paramiko.SSHClient()
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    
-    logs = []
-
+    # Conecta ao servidor via pool: repetições contra o mesmo host
+    # reutilizam o transport autenticado
+    # RECOMENDAÇÃO: Usar `pkey` para autenticação por chave SSH.
+    ssh_client = get_pooled_ssh(server.host, "root", server.password)
     try:
-        # Conecta ao servidor
-        # RECOMENDAÇÃO: Usar `pkey` para autenticação por chave SSH.
-        ssh_client.connect(
-            hostname=server.host, port=22, username="root", password=server.password, timeout=15
-        )
         logs.append(f"Conexão com {server.host} estabelecida com sucesso.")
 
-        # Executa a instalação do Docker
-        for command in DOCKER_INSTALL_COMMANDS:
-            execute_ssh_command(ssh_client, command, logs)
+        # Executa a instalação do Docker: os 10 comandos saem como UM único
+        # 'bash -e -c', pagando uma abertura de canal SSH em vez de dez
+        install_script = " && ".join(DOCKER_INSTALL_COMMANDS)
+        execute_ssh_command(ssh_client, f"bash -c {shlex.quote(install_script)}", logs)
         
         # Comandos para inicializar o Swarm e criar a rede
         logs.append("Inicializando Docker Swarm...")
@@ -96,6 +69,21 @@ def install_docker_on_server(server: ServerDetails):
         execute_ssh_command(ssh_client, network_create_command, logs, ignore_errors=True)
 
         logs.append("Provisionamento do servidor finalizado com sucesso!")
+    finally:
+        # A conexão volta ao pool (não é fechada)
+        release_pooled_ssh(ssh_client)
+
+
+@app.post("/install-docker", status_code=status.HTTP_200_OK)
+async def install_docker_on_server(server: ServerDetails):
+    """
+    Conecta-se a um servidor, instala o Docker, inicializa o Swarm e cria a rede.
+    O trabalho SSH roda via asyncio.to_thread: o event loop continua
+    atendendo outras requisições durante o install.
+    """
+    logs = []
+    try:
+        await asyncio.to_thread(_provision_server, server, logs)
         return {"message": "Provisionamento concluído com sucesso.", "logs": logs}
 
     except paramiko.AuthenticationException:
@@ -105,7 +93,4 @@ def install_docker_on_server(server: ServerDetails):
             "detail": f"Ocorreu um erro inesperado: {str(e)}",
             "logs": logs
         }
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
-    finally:
-        if ssh_client:
-            ssh_client.close()
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
\ No newline at end of file
@@ -0,0 +1,51 @@
+import time
+
+# Contexto autenticado do Portainer compartilhado pelos deployers.
+# O JWT vale horas e endpoint_id/swarm_id não mudam, então redeploys
+# consecutivos contra o mesmo Portainer pulam os três round-trips de
+# auth + /api/endpoints + /docker/swarm. TTL conservador de 25 minutos.
+_TTL = 25 * 60
+_cache = {}  # (portainer_url, usuario) -> (jwt, endpoint_id, swarm_id, expira_em)
+
+
+def invalidate_portainer_context(portainer_url, username):
+    """
+    Descarta o contexto cacheado (ex.: após um 401 com token expirado).
+    """
+    _cache.pop((portainer_url, username), None)
+
+
+async def get_portainer_context(client, portainer_url, username, password, force_refresh=False):
+    """
+    Retorna (jwt, endpoint_id, swarm_id) para a instância do Portainer,
+    usando cache com TTL. 'client' é um httpx.AsyncClient compartilhado.
+    """
+    key = (portainer_url, username)
+    now = time.monotonic()
+
+    if not force_refresh:
+        cached = _cache.get(key)
+        if cached and cached[3] > now:
+            return cached[0], cached[1], cached[2]
+
+    auth_response = await client.post(f"{portainer_url}/api/auth",
+                                      json={"Username": username, "Password": password})
+    auth_response.raise_for_status()
+    jwt_token = auth_response.json().get("jwt")
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+
+    endpoints_response = await client.get(f"{portainer_url}/api/endpoints", headers=headers)
+    endpoints_response.raise_for_status()
+    endpoints = endpoints_response.json()
+    if not endpoints:
+        raise Exception("Nenhum endpoint encontrado no Portainer.")
+    endpoint_id = endpoints[0].get("Id")
+
+    swarm_response = await client.get(f"{portainer_url}/api/endpoints/{endpoint_id}/docker/swarm",
+                                      headers=headers)
+    swarm_response.raise_for_status()
+    swarm_id = swarm_response.json().get("ID")
+
+    _cache[key] = (jwt_token, endpoint_id, swarm_id, now + _TTL)
+    return jwt_token, endpoint_id, swarm_id
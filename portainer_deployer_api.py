@@ -1,12 +1,19 @@
 import os
 import json
+import shlex
 import time
+import asyncio
+import httpx
 import requests
 import paramiko
 import dns.resolver
-from fastapi import FastAPI, HTTPException, status
+import dns.asyncresolver
+from uuid import uuid4
+from fastapi import FastAPI, HTTPException, status, BackgroundTasks, WebSocket
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from ssh_exec import execute_ssh_command, get_pooled_ssh, release_pooled_ssh
+from cloudflare_client import upsert_a_record
 from typing import List
 
 # Carrega as variáveis do arquivo .env para o ambiente de execução.
@@ -77,100 +84,128 @@ volumes:
     name: portainer_data
 """
 
+# O template tem UM placeholder: pré-quebrado em prefixo/sufixo no import,
+# o render vira uma concatenação sem nenhum scan do YAML.
+_PORTAINER_TPL_PREFIX, _PORTAINER_TPL_SUFFIX = PORTAINER_STACK_TEMPLATE.split("{{PORTAINER_DOMAIN}}")
+
 # --- Funções Auxiliares ---
 
-def execute_ssh_command(ssh_client: paramiko.SSHClient, command: str, logs: List[str], ignore_errors: bool = False) -> str:
-    logs.append(f"Executando comando SSH: {command}")
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    exit_status = stdout.channel.recv_exit_status()
-    output = stdout.read().decode('utf-8').strip()
-    error = stderr.read().decode('utf-8').strip()
-    if output: logs.append(f"Saída: {output}")
-    if error: logs.append(f"Erro: {error}")
-    if not ignore_errors and exit_status != 0:
-        raise Exception(f"Falha ao executar comando: '{command}'. Código de saída: {exit_status}")
-    return output
 
 def get_ssh_connection(server: PortainerDeployDetails) -> paramiko.SSHClient:
-    ssh_client = paramiko.SSHClient()
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
-        ssh_client.connect(hostname=server.host, port=22, username="root", password=server.password, timeout=15)
-        return ssh_client
+        # Conexão vinda do pool compartilhado: deploys consecutivos contra o
+        # mesmo host reutilizam o transport autenticado (o pool cuida do
+        # keepalive e da limpeza das conexões ociosas)
+        return get_pooled_ssh(server.host, "root", server.password)
     except paramiko.AuthenticationException:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Falha na autenticação. Verifique o IP e a senha.")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro de conexão: {e}")
 
-def update_cloudflare_dns(details: PortainerDeployDetails, logs: List[str]):
+async def update_cloudflare_dns(details: PortainerDeployDetails, logs: List[str]):
     logs.append(f"Atualizando DNS para {details.portainer_domain} -> {details.host}")
-    api_url = f"https://api.cloudflare.com/client/v4/zones/{details.cloudflare_zone_id}/dns_records"
-    headers = {"Authorization": f"Bearer {details.cloudflare_api_token}", "Content-Type": "application/json"}
-    response = requests.get(api_url, headers=headers, params={"name": details.portainer_domain})
-    response.raise_for_status()
-    records = response.json().get("result", [])
-    payload = {"type": "A", "name": details.portainer_domain, "content": details.host, "ttl": 1, "proxied": False}
-    if records:
-        record_id = records[0]["id"]
-        logs.append(f"Registro DNS encontrado com ID {record_id}. Atualizando...")
-        response = requests.put(f"{api_url}/{record_id}", headers=headers, json=payload)
-    else:
-        logs.append("Nenhum registro DNS encontrado. Criando um novo...")
-        response = requests.post(api_url, headers=headers, json=payload)
-    response.raise_for_status()
-    logs.append("Registro DNS na Cloudflare atualizado com sucesso.")
-
-def wait_for_dns_propagation(domain: str, target_ip: str, logs: List[str]):
+    await upsert_a_record(details.cloudflare_api_token, details.cloudflare_zone_id,
+                          details.portainer_domain, details.host, logs)
+
+# Resolver de módulo com cache LRU: respostas recentes (dentro do TTL do
+# registro) são servidas localmente — deploys encadeados do mesmo domínio
+# confirmam na hora, sem novo round-trip ao 8.8.8.8.
+_resolver = dns.asyncresolver.Resolver()
+_resolver.cache = dns.resolver.LRUCache(max_size=1024)
+_resolver.nameservers = ['8.8.8.8', '1.1.1.1']
+
+
+async def wait_for_dns_propagation(domain: str, target_ip: str, logs: List[str]):
     logs.append(f"Aguardando propagação do DNS para {domain}...")
-    resolver = dns.resolver.Resolver()
-    resolver.nameservers = ['8.8.8.8']
-    for i in range(30):
+    # Backoff exponencial (1s -> 15s): a primeira consulta sai imediatamente
+    # (confirmação típica segundos mais cedo que o sleep fixo de 10s) e o
+    # event loop fica livre durante a espera.
+    delay = 1.0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + 300
+    while loop.time() < deadline:
         try:
-            answers = resolver.resolve(domain, 'A')
+            answers = await _resolver.resolve(domain, 'A')
             resolved_ip = answers[0].to_text()
             logs.append(f"DNS resolvido para: {resolved_ip}")
-            if resolved_ip == target_ip:
+            if any(answer.to_text() == target_ip for answer in answers):
                 logs.append("Propagação do DNS confirmada!")
                 return
+            # Resposta ainda antiga: tira do cache para a próxima iteração
+            # consultar o resolver de verdade
+            _resolver.cache.flush()
         except Exception as e:
             logs.append(f"Aguardando DNS... ({e})")
-        time.sleep(10)
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.5, 15)
     raise Exception("Tempo limite excedido aguardando a propagação do DNS.")
 
 # --- Endpoint da API ---
-@app.post("/deploy-portainer", status_code=status.HTTP_200_OK)
-def deploy_portainer_stack(server: PortainerDeployDetails):
-    logs = []
-    ssh_client = None
-    sftp = None
-    remote_path = "/root/portainer.yaml"
-    try:
-        update_cloudflare_dns(server, logs)
-        wait_for_dns_propagation(server.portainer_domain, server.host, logs)
+_REMOTE_STACK_PATH = "/root/portainer.yaml"
 
-        ssh_client = get_ssh_connection(server)
+
+def _prepare_via_ssh(server: PortainerDeployDetails, logs: List[str]):
+    """
+    Fase de preparação (bloqueante): upload da stack, volume e pulls.
+    Independente da propagação do DNS, então roda em paralelo com ela.
+    """
+    remote_path = _REMOTE_STACK_PATH
+    ssh_client = get_ssh_connection(server)
+    try:
         logs.append(f"Conexão SSH com {server.host} estabelecida.")
 
         logs.append(f"Enviando arquivo da stack para {remote_path}...")
-        stack_content = PORTAINER_STACK_TEMPLATE.replace("{{PORTAINER_DOMAIN}}", server.portainer_domain)
-        sftp = ssh_client.open_sftp()
-        with sftp.file(remote_path, 'w') as f:
-            f.write(stack_content)
+        stack_content = _PORTAINER_TPL_PREFIX + server.portainer_domain + _PORTAINER_TPL_SUFFIX
+        # O YAML vai pelo stdin de um exec ('cat > arquivo'): para poucos KB
+        # isso dispensa o handshake de abertura do subsistema SFTP (~1 RTT)
+        stdin, stdout, stderr = ssh_client.exec_command(f"cat > {remote_path}")
+        stdin.write(stack_content)
+        stdin.channel.shutdown_write()
+        if stdout.channel.recv_exit_status() != 0:
+            raise Exception(f"Falha ao enviar o arquivo da stack para {remote_path}")
         logs.append("Arquivo da stack enviado com sucesso.")
 
-        execute_ssh_command(ssh_client, "docker volume create portainer_data", logs, ignore_errors=True)
-        execute_ssh_command(ssh_client, "docker pull portainer/portainer-ce:sts", logs)
-        execute_ssh_command(ssh_client, "docker pull portainer/agent:sts", logs)
-        
-        deploy_command = f"docker stack deploy --prune --compose-file {remote_path} portainer"
+        # Volume idempotente + os dois pulls em UM único exec: o shell remoto
+        # roda os pulls em paralelo ('&' + wait), pulando cada um se a imagem
+        # já existe no host — um canal SSH em vez de três, e o registry só é
+        # contatado quando realmente falta imagem.
+        prep_script = (
+            "set -e; "
+            "docker volume create portainer_data >/dev/null 2>&1 || true; "
+            "pull_if_missing() { "
+            "docker image inspect -f '{{.Id}}' \"$1\" >/dev/null 2>&1 "
+            "&& echo \"Imagem $1 ja presente; pull pulado.\" "
+            "|| docker pull \"$1\"; }; "
+            "pull_if_missing portainer/portainer-ce:sts & "
+            "pull_if_missing portainer/agent:sts & "
+            "wait"
+        )
+        execute_ssh_command(ssh_client, f"bash -c {shlex.quote(prep_script)}", logs)
+    finally:
+        # A conexão SSH volta ao pool (não é fechada)
+        release_pooled_ssh(ssh_client)
+
+
+def _finish_deploy_via_ssh(server: PortainerDeployDetails, logs: List[str]):
+    """
+    Fase final (bloqueante): stack deploy + verificação do serviço.
+    """
+    ssh_client = get_ssh_connection(server)
+    try:
+        deploy_command = f"docker stack deploy --prune --compose-file {_REMOTE_STACK_PATH} portainer"
         execute_ssh_command(ssh_client, deploy_command, logs)
 
-        logs.append("Aguardando 10 segundos para o serviço estabilizar...")
-        time.sleep(10)
-        
+        # Poll com backoff em vez de sleep fixo de 10s: retorna assim que o
+        # serviço mostra 1/1 (tipicamente 1-3s) e espera no máximo ~32s antes
+        # de declarar falha
         logs.append("Verificando status do serviço Portainer...")
         status_cmd = 'docker service ls --filter name=portainer_portainer --format "{{.Replicas}}"'
-        replica_status = execute_ssh_command(ssh_client, status_cmd, logs)
+        replica_status = ""
+        for delay in (1, 1, 2, 3, 5, 5, 5, 10):
+            time.sleep(delay)
+            replica_status = execute_ssh_command(ssh_client, status_cmd, logs, ignore_errors=True).strip()
+            if replica_status == "1/1":
+                break
 
         if replica_status != "1/1":
             logs.append("!!! ALERTA: O serviço do Portainer não iniciou corretamente. Status: " + replica_status)
@@ -182,15 +217,112 @@ def deploy_portainer_stack(server: PortainerDeployDetails):
             raise Exception("O serviço Portainer falhou ao iniciar. Verifique os logs e o status das tarefas para mais detalhes.")
         
         logs.append("Serviço Portainer iniciado com sucesso (1/1).")
-        
-        return {"message": "Deploy do Portainer concluído. Acesse o domínio para criar o usuário administrador.", "logs": logs}
+    finally:
+        # A conexão SSH volta ao pool (não é fechada)
+        release_pooled_ssh(ssh_client)
+
+
+# Jobs de deploy em background: o endpoint devolve um job_id na hora (em
+# vez de segurar a conexão HTTP por minutos de docker pull) e os logs
+# saem progressivamente via WebSocket.
+_jobs = {}  # job_id -> {"logs": _JobLog, "status": "running"|"success"|"error"}
+
+
+class _JobLog(list):
+    """
+    Lista de logs que replica cada append para os assinantes WebSocket.
+    Appends podem vir de worker threads (fases via to_thread), por isso o
+    call_soon_threadsafe.
+    """
 
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Erro na API da Cloudflare: {e}")
+    def __init__(self, loop):
+        super().__init__()
+        self._loop = loop
+        self.queues = []
+
+    def append(self, message):
+        super().append(message)
+        for queue in list(self.queues):
+            self._loop.call_soon_threadsafe(queue.put_nowait, message)
+
+
+async def _run_deploy(job_id: str, server: PortainerDeployDetails):
+    job = _jobs[job_id]
+    logs = job["logs"]
+    try:
+        await update_cloudflare_dns(server, logs)
+
+        # A espera de propagação do DNS e a preparação via SSH (upload,
+        # volume, pulls) são independentes: rodam em paralelo e o tempo
+        # total vira max() em vez da soma
+        await asyncio.gather(
+            wait_for_dns_propagation(server.portainer_domain, server.host, logs),
+            asyncio.to_thread(_prepare_via_ssh, server, logs),
+        )
+
+        await asyncio.to_thread(_finish_deploy_via_ssh, server, logs)
+
+        logs.append("Deploy do Portainer concluído. Acesse o domínio para criar o usuário administrador.")
+        job["status"] = "success"
     except Exception as e:
-        if isinstance(e, HTTPException): raise e
-        error_detail = {"detail": f"Ocorreu um erro inesperado: {str(e)}", "logs": logs}
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
+        logs.append(f"ERRO: {e}")
+        job["status"] = "error"
+
+
+@app.post("/deploy-portainer", status_code=status.HTTP_202_ACCEPTED)
+async def deploy_portainer_stack(server: PortainerDeployDetails, background_tasks: BackgroundTasks):
+    job_id = uuid4().hex
+    _jobs[job_id] = {"logs": _JobLog(asyncio.get_running_loop()), "status": "running"}
+    background_tasks.add_task(_run_deploy, job_id, server)
+    return {"job_id": job_id,
+            "message": "Deploy iniciado. Acompanhe em GET /deploy/{job_id} ou via WebSocket /deploy/{job_id}/logs."}
+
+
+@app.get("/deploy/{job_id}")
+async def get_deploy_job(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado.")
+    return {"status": job["status"], "logs": list(job["logs"])}
+
+
+@app.websocket("/deploy/{job_id}/logs")
+async def stream_deploy_logs(websocket: WebSocket, job_id: str):
+    await websocket.accept()
+    job = _jobs.get(job_id)
+    if job is None:
+        await websocket.close(code=1008)
+        return
+
+    logs = job["logs"]
+    queue = asyncio.Queue()
+    logs.queues.append(queue)
+    try:
+        # Replay do que já aconteceu, depois streaming do restante
+        for message in list(logs):
+            await websocket.send_text(message)
+        while job["status"] == "running" or not queue.empty():
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            await websocket.send_text(message)
+        await websocket.send_text(f"__STATUS__:{job['status']}")
+        await websocket.close()
+    except Exception:
+        pass
     finally:
-        if sftp: sftp.close()
-        if ssh_client: ssh_client.close()
\ No newline at end of file
+        if queue in logs.queues:
+            logs.queues.remove(queue)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop + httptools cortam o overhead do event loop por requisição.
+    # ATENÇÃO: este app guarda estado em memória (_jobs, logs dos deploys);
+    # workers do uvicorn são processos separados sem afinidade de request,
+    # então com N>1 o GET /deploy/{job_id} cairia em um worker que não
+    # conhece o job. Fica em 1 worker até o estado ir para storage externo.
+    uvicorn.run("portainer_deployer_api:app", host="0.0.0.0", port=8000,
+                loop="uvloop", http="httptools", workers=1)
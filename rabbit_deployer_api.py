@@ -1,10 +1,15 @@
 import os
 import json
 import time
+import asyncio
+import httpx
 import requests
 from fastapi import FastAPI, HTTPException, status
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from string import Template
+from portainer_context import get_portainer_context, invalidate_portainer_context
+from cloudflare_client import upsert_a_record
 from typing import List
 
 # Carrega as variáveis do arquivo .env para o ambiente de execução.
@@ -70,25 +75,25 @@ networks:
     external: true
 """
 
+# Cliente HTTP/2 compartilhado entre os deployers (ver http_client.py)
+from http_client import client as _client
+
+
+# Template compilado no import: a substituição dos três placeholders é uma
+# única passada, sem as strings intermediárias dos .replace encadeados.
+_RABBIT_TPL = Template(
+    RABBITMQ_STACK_TEMPLATE
+    .replace("{RABBITMQ_DOMAIN}", "$RABBITMQ_DOMAIN")
+    .replace("{RABBITMQ_USER}", "$RABBITMQ_USER")
+    .replace("{RABBITMQ_PASSWORD}", "$RABBITMQ_PASSWORD")
+)
+
 # --- Funções Auxiliares ---
 
-def update_cloudflare_dns(details: RabbitMQDeployDetails, logs: List[str]):
+async def update_cloudflare_dns(details: RabbitMQDeployDetails, logs: List[str]):
     logs.append(f"Atualizando DNS para {details.rabbitmq_domain} -> {details.host}")
-    api_url = f"https://api.cloudflare.com/client/v4/zones/{details.cloudflare_zone_id}/dns_records"
-    headers = {"Authorization": f"Bearer {details.cloudflare_api_token}", "Content-Type": "application/json"}
-    response = requests.get(api_url, headers=headers, params={"name": details.rabbitmq_domain})
-    response.raise_for_status()
-    records = response.json().get("result", [])
-    payload = {"type": "A", "name": details.rabbitmq_domain, "content": details.host, "ttl": 1, "proxied": False}
-    if records:
-        record_id = records[0]["id"]
-        logs.append(f"Registro DNS encontrado com ID {record_id}. Atualizando...")
-        response = requests.put(f"{api_url}/{record_id}", headers=headers, json=payload)
-    else:
-        logs.append("Nenhum registro DNS encontrado. Criando um novo...")
-        response = requests.post(api_url, headers=headers, json=payload)
-    response.raise_for_status()
-    logs.append("Registro DNS na Cloudflare atualizado com sucesso.")
+    await upsert_a_record(details.cloudflare_api_token, details.cloudflare_zone_id,
+                          details.rabbitmq_domain, details.host, logs)
 
 def wait_for_dns_propagation(domain: str, target_ip: str, logs: List[str]):
     logs.append(f"Aguardando propagação do DNS para {domain}...")
@@ -99,56 +104,51 @@ def wait_for_dns_propagation(domain: str, target_ip: str, logs: List[str]):
 
 # --- Endpoint da API ---
 @app.post("/deploy-rabbitmq", status_code=status.HTTP_200_OK)
-def deploy_rabbitmq_stack(details: RabbitMQDeployDetails):
+async def deploy_rabbitmq_stack(details: RabbitMQDeployDetails):
     """
     Configura o DNS, autentica-se no Portainer e implanta ou atualiza a stack do RabbitMQ.
     """
     logs = []
     try:
         # Passo 1: Configurar DNS na Cloudflare
-        update_cloudflare_dns(details, logs)
-        wait_for_dns_propagation(details.rabbitmq_domain, details.host, logs)
-
-        # Passo 2: Obter o token de acesso (JWT) do Portainer
-        logs.append("Passo 2: A autenticar na API do Portainer...")
-        auth_payload = {"Username": details.portainer_user, "Password": details.portainer_password}
-        auth_url = f"{details.portainer_url}/api/auth"
-        auth_response = requests.post(auth_url, json=auth_payload, verify=False)
-        auth_response.raise_for_status()
-        jwt_token = auth_response.json().get("jwt")
-        logs.append("Autenticação bem-sucedida.")
+        await update_cloudflare_dns(details, logs)
+        await asyncio.to_thread(wait_for_dns_propagation, details.rabbitmq_domain, details.host, logs)
 
-        headers = {"Authorization": f"Bearer {jwt_token}"}
+        # Passos 2-3: contexto (JWT + endpoint + swarm) vem do cache
+        # compartilhado — redeploys pulam os três round-trips de setup
+        logs.append("Passos 2-3: A obter contexto autenticado do Portainer...")
+        jwt_token, endpoint_id, swarm_id = await get_portainer_context(
+            _client, details.portainer_url, details.portainer_user, details.portainer_password)
+        logs.append(f"Endpoint ID: {endpoint_id}, Swarm ID: {swarm_id}")
 
-        # Passo 3: Encontrar o ID do endpoint e do Swarm
-        logs.append("Passo 3: A procurar IDs do endpoint e do Swarm...")
-        endpoints_url = f"{details.portainer_url}/api/endpoints"
-        endpoints_response = requests.get(endpoints_url, headers=headers, verify=False)
-        endpoints_response.raise_for_status()
-        endpoints = endpoints_response.json()
-        if not endpoints: raise Exception("Nenhum endpoint encontrado no Portainer.")
-        endpoint_id = endpoints[0].get("Id")
-        logs.append(f"Endpoint ID: {endpoint_id}")
-
-        swarm_url = f"{details.portainer_url}/api/endpoints/{endpoint_id}/docker/swarm"
-        swarm_response = requests.get(swarm_url, headers=headers, verify=False)
-        swarm_response.raise_for_status()
-        swarm_id = swarm_response.json().get("ID")
-        logs.append(f"Swarm ID específico encontrado: {swarm_id}")
+        headers = {"Authorization": f"Bearer {jwt_token}"}
 
         # Passo 4: Verificar se a stack "rabbitmq" já existe
         logs.append("Passo 4: A verificar se a stack 'rabbitmq' já existe...")
         stacks_url = f"{details.portainer_url}/api/stacks"
-        stacks_response = requests.get(stacks_url, headers=headers, verify=False)
+        stacks_response = await _client.get(stacks_url, headers=headers)
+        if stacks_response.status_code == 401:
+            # JWT cacheado expirou no servidor: renova uma única vez
+            invalidate_portainer_context(details.portainer_url, details.portainer_user)
+            jwt_token, endpoint_id, swarm_id = await get_portainer_context(
+                _client, details.portainer_url, details.portainer_user, details.portainer_password,
+                force_refresh=True)
+            headers = {"Authorization": f"Bearer {jwt_token}"}
+            stacks_response = await _client.get(stacks_url, headers=headers)
         stacks_response.raise_for_status()
         
         existing_stacks = stacks_response.json()
-        rabbitmq_stack = next((stack for stack in existing_stacks if stack.get("Name") == "rabbitmq" and stack.get("EndpointId") == endpoint_id), None)
+        # Indexado por (nome, endpoint): lookup O(1) em vez de varrer a
+        # lista inteira com next()
+        stack_by_key = {(stack.get("Name"), stack.get("EndpointId")): stack for stack in existing_stacks}
+        rabbitmq_stack = stack_by_key.get(("rabbitmq", endpoint_id))
 
         # Prepara o conteúdo da stack, substituindo as variáveis
-        stack_content = RABBITMQ_STACK_TEMPLATE.replace("{RABBITMQ_DOMAIN}", details.rabbitmq_domain)
-        stack_content = stack_content.replace("{RABBITMQ_USER}", details.rabbitmq_user)
-        stack_content = stack_content.replace("{RABBITMQ_PASSWORD}", details.rabbitmq_password)
+        stack_content = _RABBIT_TPL.safe_substitute(
+            RABBITMQ_DOMAIN=details.rabbitmq_domain,
+            RABBITMQ_USER=details.rabbitmq_user,
+            RABBITMQ_PASSWORD=details.rabbitmq_password,
+        )
 
         # Passo 5: Criar ou Atualizar a stack
         if rabbitmq_stack:
@@ -156,12 +156,12 @@ def deploy_rabbitmq_stack(details: RabbitMQDeployDetails):
             logs.append(f"Stack 'rabbitmq' encontrada com ID {stack_id}. A atualizar...")
             update_url = f"{details.portainer_url}/api/stacks/{stack_id}?endpointId={endpoint_id}"
             update_payload = {"StackFileContent": stack_content, "Prune": True}
-            deploy_response = requests.put(update_url, headers=headers, json=update_payload, verify=False)
+            deploy_response = await _client.put(update_url, headers=headers, json=update_payload)
         else:
             logs.append("Stack 'rabbitmq' não encontrada. A criar uma nova...")
             create_url = f"{details.portainer_url}/api/stacks/create/swarm/string?endpointId={endpoint_id}"
             create_payload = {"Name": "rabbitmq", "SwarmID": swarm_id, "StackFileContent": stack_content}
-            deploy_response = requests.post(create_url, headers=headers, json=create_payload, verify=False)
+            deploy_response = await _client.post(create_url, headers=headers, json=create_payload)
 
         deploy_response.raise_for_status()
 
@@ -169,11 +169,23 @@ def deploy_rabbitmq_stack(details: RabbitMQDeployDetails):
         
         return {"message": "Deu tudo certo"}
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
         error_message = f"Erro de comunicação com as APIs: {e}"
-        if e.response is not None:
-            error_message += f" | Resposta: {e.response.text}"
+        response = getattr(e, "response", None)
+        if response is not None:
+            # Trunca e decodifica uma única vez: páginas de erro gigantes do
+            # Portainer não são materializadas inteiras no log
+            error_message += f" | Resposta: {response.content[:512].decode('utf-8', 'replace')}"
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_message)
     except Exception as e:
         error_detail = {"detail": f"Ocorreu um erro inesperado: {str(e)}", "logs": logs}
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop + httptools cortam o overhead do event loop por requisição e
+    # múltiplos workers escalam deploys concorrentes entre os núcleos
+    uvicorn.run("rabbit_deployer_api:app", host="0.0.0.0", port=8000,
+                loop="uvloop", http="httptools", workers=os.cpu_count())
@@ -1,10 +1,12 @@
 import os
 import json
 import time
+import httpx
 import requests
 from fastapi import FastAPI, HTTPException, status
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from portainer_context import get_portainer_context, invalidate_portainer_context
 from typing import List
 
 # Carrega as variáveis do arquivo .env para o ambiente de execução.
@@ -53,51 +55,46 @@ networks:
     name: network_swarm_public
 """
 
+# Cliente HTTP/2 compartilhado entre os deployers (ver http_client.py)
+from http_client import client as _client
+
+
 # --- Endpoint da API ---
 @app.post("/deploy-redis", status_code=status.HTTP_200_OK)
-def deploy_redis_stack(details: RedisDeployDetails):
+async def deploy_redis_stack(details: RedisDeployDetails):
     """
     Autentica-se na API do Portainer e implanta ou atualiza a stack do Redis.
     """
     logs = []
     try:
-        # Passo 1: Obter o token de acesso (JWT) do Portainer
-        logs.append("Passo 1: A autenticar na API do Portainer...")
-        auth_payload = {"Username": details.portainer_user, "Password": details.portainer_password}
-        auth_url = f"{details.portainer_url}/api/auth"
-        auth_response = requests.post(auth_url, json=auth_payload, verify=False)
-        auth_response.raise_for_status()
-        jwt_token = auth_response.json().get("jwt")
-        logs.append("Autenticação bem-sucedida.")
+        # Passos 1-3: contexto (JWT + endpoint + swarm) vem do cache
+        # compartilhado — redeploys pulam os três round-trips de setup
+        logs.append("Passos 1-3: A obter contexto autenticado do Portainer...")
+        jwt_token, endpoint_id, swarm_id = await get_portainer_context(
+            _client, details.portainer_url, details.portainer_user, details.portainer_password)
+        logs.append(f"Endpoint ID: {endpoint_id}, Swarm ID: {swarm_id}")
 
         headers = {"Authorization": f"Bearer {jwt_token}"}
 
-        # Passo 2: Encontrar o ID do endpoint
-        logs.append("Passo 2: A procurar o ID do endpoint...")
-        endpoints_url = f"{details.portainer_url}/api/endpoints"
-        endpoints_response = requests.get(endpoints_url, headers=headers, verify=False)
-        endpoints_response.raise_for_status()
-        endpoints = endpoints_response.json()
-        if not endpoints: raise Exception("Nenhum endpoint encontrado no Portainer.")
-        endpoint_id = endpoints[0].get("Id")
-        logs.append(f"Endpoint encontrado com ID: {endpoint_id}")
-
-        # Passo 3: Obter o SwarmID
-        logs.append("Passo 3: A procurar o ID do Swarm...")
-        swarm_url = f"{details.portainer_url}/api/endpoints/{endpoint_id}/docker/swarm"
-        swarm_response = requests.get(swarm_url, headers=headers, verify=False)
-        swarm_response.raise_for_status()
-        swarm_id = swarm_response.json().get("ID")
-        logs.append(f"Swarm encontrado com ID: {swarm_id}")
-
         # Passo 4: Verificar se a stack "redis" já existe
         logs.append("Passo 4: A verificar se a stack 'redis' já existe...")
         stacks_url = f"{details.portainer_url}/api/stacks"
-        stacks_response = requests.get(stacks_url, headers=headers, verify=False)
+        stacks_response = await _client.get(stacks_url, headers=headers)
+        if stacks_response.status_code == 401:
+            # JWT cacheado expirou no servidor: renova uma única vez
+            invalidate_portainer_context(details.portainer_url, details.portainer_user)
+            jwt_token, endpoint_id, swarm_id = await get_portainer_context(
+                _client, details.portainer_url, details.portainer_user, details.portainer_password,
+                force_refresh=True)
+            headers = {"Authorization": f"Bearer {jwt_token}"}
+            stacks_response = await _client.get(stacks_url, headers=headers)
         stacks_response.raise_for_status()
         
         existing_stacks = stacks_response.json()
-        redis_stack = next((stack for stack in existing_stacks if stack.get("Name") == "redis" and stack.get("EndpointId") == endpoint_id), None)
+        # Indexado por (nome, endpoint): lookup O(1) em vez de varrer a
+        # lista inteira com next()
+        stack_by_key = {(stack.get("Name"), stack.get("EndpointId")): stack for stack in existing_stacks}
+        redis_stack = stack_by_key.get(("redis", endpoint_id))
 
         # Passo 5: Criar ou Atualizar a stack
         if redis_stack:
@@ -110,7 +107,7 @@ def deploy_redis_stack(details: RedisDeployDetails):
                 "StackFileContent": REDIS_STACK_TEMPLATE,
                 "Prune": True
             }
-            deploy_response = requests.put(update_url, headers=headers, json=update_payload, verify=False)
+            deploy_response = await _client.put(update_url, headers=headers, json=update_payload)
         else:
             # Se não existir, CRIA a stack (POST)
             logs.append("Stack 'redis' não encontrada. A criar uma nova...")
@@ -120,7 +117,7 @@ def deploy_redis_stack(details: RedisDeployDetails):
                 "SwarmID": swarm_id,
                 "StackFileContent": REDIS_STACK_TEMPLATE
             }
-            deploy_response = requests.post(create_url, headers=headers, json=create_payload, verify=False)
+            deploy_response = await _client.post(create_url, headers=headers, json=create_payload)
 
         deploy_response.raise_for_status()
 
@@ -128,11 +125,23 @@ def deploy_redis_stack(details: RedisDeployDetails):
         
         return {"message": "Deu tudo certo"}
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
         error_message = f"Erro de comunicação com a API do Portainer: {e}"
-        if e.response is not None:
-            error_message += f" | Resposta: {e.response.text}"
+        response = getattr(e, "response", None)
+        if response is not None:
+            # Trunca e decodifica uma única vez: páginas de erro gigantes do
+            # Portainer não são materializadas inteiras no log
+            error_message += f" | Resposta: {response.content[:512].decode('utf-8', 'replace')}"
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_message)
     except Exception as e:
         error_detail = {"detail": f"Ocorreu um erro inesperado: {str(e)}", "logs": logs}
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop + httptools cortam o overhead do event loop por requisição e
+    # múltiplos workers escalam deploys concorrentes entre os núcleos
+    uvicorn.run("redis_deployer_api:app", host="0.0.0.0", port=8000,
+                loop="uvloop", http="httptools", workers=os.cpu_count())
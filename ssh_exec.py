@@ -0,0 +1,163 @@
+import hashlib
+import secrets
+import select
+import threading
+import time
+from typing import List
+
+import paramiko
+
+# Pool de conexões SSH por (host, usuário, digest da senha): requisições
+# consecutivas contra o mesmo servidor pulam o handshake TCP+SSH+auth
+# (mesma lógica do keep-alive HTTP). Uma thread de limpeza fecha conexões
+# ociosas >5min para não vazar file descriptors.
+_IDLE_TTL = 300
+_ssh_pool = {}  # (host, username, pw_digest) -> [SSHClient, ultimo_uso, em_uso]
+_ssh_pool_lock = threading.Lock()
+_sweeper_started = False
+
+# A senha entra na chave como digest blake2s com salt por processo (mesmo
+# padrão do app/ssh_pool): uma senha errada nunca reaproveita uma conexão
+# já autenticada, e uma senha rotacionada deixa de casar com a sessão
+# antiga em vez de mantê-la válida.
+_SALT = secrets.token_bytes(16)
+
+
+def _pw_key(password: str) -> bytes:
+    return hashlib.blake2s(password.encode("utf-8"), digest_size=16, key=_SALT).digest()
+
+
+def _sweep_idle_loop():
+    while True:
+        time.sleep(60)
+        now = time.time()
+        with _ssh_pool_lock:
+            for key in list(_ssh_pool.keys()):
+                client, last_used, in_use = _ssh_pool[key]
+                # Só fecha conexões DEVOLVIDAS e ociosas: um exec longo
+                # (install completo do Docker, pulls de imagem) mantém
+                # em_uso > 0 e nunca é derrubado no meio do comando
+                if in_use == 0 and now - last_used > _IDLE_TTL:
+                    try:
+                        client.close()
+                    except Exception:
+                        pass
+                    del _ssh_pool[key]
+
+
+def _ensure_sweeper():
+    global _sweeper_started
+    if not _sweeper_started:
+        threading.Thread(target=_sweep_idle_loop, daemon=True, name="ssh-pool-sweeper").start()
+        _sweeper_started = True
+
+
+def get_pooled_ssh(host: str, username: str, password: str) -> paramiko.SSHClient:
+    """
+    Retorna uma conexão SSH reutilizável do pool (criando se necessário).
+    O chamador NÃO deve fechar o cliente — deve devolvê-lo com
+    release_pooled_ssh() num finally; a conexão fica viva (keepalive de
+    30s) para a próxima requisição e o sweeper só fecha conexões
+    devolvidas e ociosas.
+    """
+    key = (host, username, _pw_key(password))
+    with _ssh_pool_lock:
+        _ensure_sweeper()
+        entry = _ssh_pool.get(key)
+        if entry:
+            client = entry[0]
+            transport = client.get_transport()
+            if transport and transport.is_active():
+                entry[1] = time.time()
+                entry[2] += 1
+                return client
+            _ssh_pool.pop(key, None)
+
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(hostname=host, port=22, username=username, password=password,
+                   timeout=15, banner_timeout=15, auth_timeout=15)
+    transport = client.get_transport()
+    if transport:
+        transport.set_keepalive(30)
+
+    with _ssh_pool_lock:
+        _ssh_pool[key] = [client, time.time(), 1]
+    return client
+
+
+def release_pooled_ssh(client: paramiko.SSHClient):
+    """
+    Devolve a conexão ao pool (NÃO fecha). Chamar no finally de quem usou
+    get_pooled_ssh; zera o relógio de ociosidade e libera o sweeper para
+    eventualmente fechá-la.
+    """
+    if client is None:
+        return
+    with _ssh_pool_lock:
+        for entry in _ssh_pool.values():
+            if entry[0] is client:
+                entry[1] = time.time()
+                if entry[2] > 0:
+                    entry[2] -= 1
+                return
+
+
+def execute_ssh_command(ssh_client: paramiko.SSHClient, command: str, logs: List[str], ignore_errors: bool = False) -> str:
+    """
+    Executa um comando SSH, registra a saída e os erros, e retorna a saída padrão.
+    Lança uma exceção se o comando falhar e ignore_errors for False.
+
+    stdout e stderr são drenados juntos num loop de select conforme chegam,
+    em vez de bloquear em recv_exit_status antes de ler — isso evita o
+    deadlock quando o buffer remoto enche (ex.: saída longa de apt-get) e
+    não bufferiza a saída em dobro.
+    """
+    logs.append(f"Executando comando SSH: {command}")
+
+    channel = ssh_client.get_transport().open_session()
+    channel.exec_command(command)
+
+    # Captura limitada a 1 MiB por stream: saídas patológicas (docker
+    # service logs gigantes etc.) continuam sendo drenadas — para não
+    # travar o comando remoto — mas o excedente é descartado em vez de
+    # crescer sem limite na memória.
+    max_capture = 1 << 20
+    out_buf = bytearray()
+    err_buf = bytearray()
+
+    def _drain():
+        while channel.recv_ready():
+            chunk = channel.recv(65536)
+            if len(out_buf) < max_capture:
+                out_buf.extend(chunk)
+        while channel.recv_stderr_ready():
+            chunk = channel.recv_stderr(65536)
+            if len(err_buf) < max_capture:
+                err_buf.extend(chunk)
+
+    try:
+        while True:
+            readable, _, _ = select.select([channel], [], [], 1.0)
+            if readable:
+                _drain()
+
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+
+        exit_status = channel.recv_exit_status()
+
+        # Drena qualquer resto que tenha chegado junto com o exit status
+        _drain()
+    finally:
+        channel.close()
+
+    output = out_buf.decode('utf-8', errors='replace').strip()
+    error = err_buf.decode('utf-8', errors='replace').strip()
+    if output: logs.append(f"Saída: {output}")
+    if error: logs.append(f"Erro: {error}")
+
+    if not ignore_errors and exit_status != 0:
+        raise Exception(f"Falha ao executar comando: '{command}'. Código de saída: {exit_status}")
+
+    return output
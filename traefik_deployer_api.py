@@ -1,9 +1,11 @@
 import os
 import json
+import asyncio
 import paramiko
 from fastapi import FastAPI, HTTPException, status
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from ssh_exec import execute_ssh_command, get_pooled_ssh, release_pooled_ssh
 from typing import List
 
 # Carrega as variáveis do arquivo .env para o ambiente de execução.
@@ -78,58 +80,78 @@ networks:
     name: network_swarm_public
 """
 
+# O template tem UM placeholder: pré-quebrado em prefixo/sufixo no import,
+# o render vira uma concatenação sem nenhum scan do YAML.
+_TRAEFIK_TPL_PREFIX, _TRAEFIK_TPL_SUFFIX = TRAEFIK_STACK_TEMPLATE.split("{{LETSENCRYPT_EMAIL}}")
+
 # --- Funções Auxiliares ---
-def execute_ssh_command(ssh_client: paramiko.SSHClient, command: str, logs: List[str], ignore_errors: bool = False) -> str:
-    logs.append(f"Executando: {command}")
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    exit_status = stdout.channel.recv_exit_status()
-    output = stdout.read().decode('utf-8').strip()
-    error = stderr.read().decode('utf-8').strip()
-    if output: logs.append(f"Saída: {output}")
-    if error: logs.append(f"Erro: {error}")
-    if not ignore_errors and exit_status != 0:
-        raise Exception(f"Falha ao executar comando: '{command}'. Código de saída: {exit_status}")
-    return output
 
 def get_ssh_connection(server: TraefikDeployDetails) -> paramiko.SSHClient:
-    ssh_client = paramiko.SSHClient()
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
-        ssh_client.connect(hostname=server.host, port=22, username="root", password=server.password, timeout=15)
-        return ssh_client
+        # Conexão vinda do pool compartilhado: deploys consecutivos contra o
+        # mesmo host reutilizam o transport autenticado (o pool cuida do
+        # keepalive e da limpeza das conexões ociosas)
+        return get_pooled_ssh(server.host, "root", server.password)
     except paramiko.AuthenticationException:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Falha na autenticação. Verifique o IP e a senha.")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro de conexão: {e}")
 
 # --- Endpoint da API ---
-@app.post("/deploy-traefik", status_code=status.HTTP_200_OK)
-def deploy_traefik_stack(server: TraefikDeployDetails):
-    logs = []
+def _deploy_via_ssh(server: TraefikDeployDetails, logs: List[str]):
+    """
+    Fase SSH do deploy (bloqueante; roda fora do event loop).
+    """
     ssh_client = None
-    sftp = None
     remote_path = "/root/traefik-v2.yaml"
     try:
         ssh_client = get_ssh_connection(server)
         logs.append(f"Conexão com {server.host} estabelecida com sucesso.")
 
         logs.append(f"Preparando para enviar o arquivo da stack para {remote_path}...")
-        stack_content = TRAEFIK_STACK_TEMPLATE.replace("{{LETSENCRYPT_EMAIL}}", server.letsencrypt_email)
-        
-        sftp = ssh_client.open_sftp()
-        with sftp.file(remote_path, 'w') as remote_file:
-            remote_file.write(stack_content)
+        stack_content = _TRAEFIK_TPL_PREFIX + server.letsencrypt_email + _TRAEFIK_TPL_SUFFIX
+
+        # O YAML vai pelo stdin de um exec ('cat > arquivo'): para poucos KB
+        # isso dispensa o handshake de abertura do subsistema SFTP (~1 RTT)
+        stdin, stdout, stderr = ssh_client.exec_command(f"cat > {remote_path}")
+        stdin.write(stack_content)
+        stdin.channel.shutdown_write()
+        if stdout.channel.recv_exit_status() != 0:
+            raise Exception(f"Falha ao enviar o arquivo da stack para {remote_path}")
         logs.append("Arquivo da stack enviado com sucesso.")
 
-        execute_ssh_command(ssh_client, "docker pull traefik:v2.11.3", logs)
+        # Pull só quando a imagem não está presente: poupa o round-trip ao
+        # registry em redeploys
+        present = execute_ssh_command(
+            ssh_client, "docker image inspect -f '{{.Id}}' traefik:v2.11.3 2>/dev/null || true",
+            logs, ignore_errors=True).strip()
+        if present:
+            logs.append("Imagem traefik:v2.11.3 já presente; pull pulado.")
+        else:
+            execute_ssh_command(ssh_client, "docker pull traefik:v2.11.3", logs)
         deploy_command = f"docker stack deploy --prune --compose-file {remote_path} traefik"
         execute_ssh_command(ssh_client, deploy_command, logs)
-        
+    finally:
+        # A conexão SSH volta ao pool (não é fechada)
+        release_pooled_ssh(ssh_client)
+
+
+@app.post("/deploy-traefik", status_code=status.HTTP_200_OK)
+async def deploy_traefik_stack(server: TraefikDeployDetails):
+    logs = []
+    try:
+        await asyncio.to_thread(_deploy_via_ssh, server, logs)
         return {"message": "Deploy do Traefik concluído com sucesso.", "logs": logs}
     except Exception as e:
         if isinstance(e, HTTPException): raise e
         error_detail = {"detail": f"Ocorreu um erro inesperado: {str(e)}", "logs": logs}
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_detail)
-    finally:
-        if sftp: sftp.close()
-        if ssh_client: ssh_client.close()
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop + httptools cortam o overhead do event loop por requisição e
+    # múltiplos workers escalam deploys concorrentes entre os núcleos
+    uvicorn.run("traefik_deployer_api:app", host="0.0.0.0", port=8000,
+                loop="uvloop", http="httptools", workers=os.cpu_count())